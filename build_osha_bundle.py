@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Build the compact OSHA reference bundle shipped in the Android assets
+
+Reports need OSHA Part 1926 context (section titles and their Subpart/Part
+hierarchy), but shipping the 2.5 MB title-29.json is wasteful. This step
+collects every citation the app can emit:
+
+- hazard_categories[].osha_codes and ppe_requirements.*.osha_codes from
+  model_config.json (or the defaults in download_real_ppe_models.py)
+- osha_regulations in model_metadata.json
+
+resolves them through the title-29 index (osha_index.py) and writes just
+those sections plus their ancestors into a small SQLite file:
+
+    nodes(id, parent, type, identifier, part, label, description)
+        pre-order numbered, so a node's ancestors all have smaller ids
+    citations(citation, node)       normalized citation -> node
+    groups(name, citation)          e.g. fall_protection -> 1926.501
+
+The output is deterministic (no timestamps), so rebuilding without input
+changes leaves the asset byte-identical.
+
+Usage:
+    python build_osha_bundle.py
+    python build_osha_bundle.py --model-config path/to/model_config.json --output out.sqlite
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from osha_index import DEFAULT_INDEX, DEFAULT_SOURCE, open_index, parse_citation
+
+ASSETS_DIR = Path("HazardHawk/androidApp/src/main/assets")
+DEFAULT_METADATA = ASSETS_DIR / "model_metadata.json"
+DEFAULT_OUTPUT = ASSETS_DIR / "osha_reference.sqlite"
+
+BUNDLE_VERSION = 1
+
+BUNDLE_SCHEMA = """
+PRAGMA page_size = 1024;
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    type TEXT NOT NULL,
+    identifier TEXT,
+    part TEXT,
+    label TEXT NOT NULL,
+    description TEXT
+);
+CREATE TABLE citations (citation TEXT PRIMARY KEY, node INTEGER NOT NULL) WITHOUT ROWID;
+CREATE TABLE groups (name TEXT NOT NULL, citation TEXT NOT NULL, PRIMARY KEY (name, citation)) WITHOUT ROWID;
+"""
+
+def normalize_citation(citation):
+    """Canonical key stored in the bundle: '1926.501', '1926 Subpart M' or '1926'"""
+    parsed = parse_citation(citation)
+    if parsed is None:
+        return None
+    kind, identifier, part = parsed
+    return f"{part} Subpart {identifier}" if kind == "subpart" else identifier
+
+def load_model_config(path=None):
+    """hazard_categories/ppe_requirements from a model_config.json, or the repo defaults"""
+    if path:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    else:
+        config = {}
+    if not config.get("hazard_categories") or not config.get("ppe_requirements"):
+        from download_real_ppe_models import DEFAULT_HAZARD_CATEGORIES, DEFAULT_PPE_REQUIREMENTS
+        config.setdefault("hazard_categories", DEFAULT_HAZARD_CATEGORIES)
+        config.setdefault("ppe_requirements", DEFAULT_PPE_REQUIREMENTS)
+    return config
+
+def collect_citations(model_config, metadata):
+    """Return {group name: [citations]} for every OSHA reference the app uses"""
+    groups = {}
+    for category in model_config.get("hazard_categories") or []:
+        groups.setdefault(category["id"], []).extend(category.get("osha_codes") or [])
+    for name, requirement in (model_config.get("ppe_requirements") or {}).items():
+        groups.setdefault(name, []).extend(requirement.get("osha_codes") or [])
+    for name, codes in (metadata.get("osha_regulations") or {}).items():
+        groups.setdefault(name, []).extend(codes)
+    return {name: list(dict.fromkeys(codes)) for name, codes in groups.items()}
+
+def build_bundle(groups, output=DEFAULT_OUTPUT, source=DEFAULT_SOURCE, index_path=DEFAULT_INDEX):
+    """
+    Write the bundle for the given citation groups.
+
+    Returns (stats dict, list of citations that could not be resolved).
+    """
+    selected = {}
+    citation_nodes = {}
+    missing = []
+
+    with open_index(source, index_path) as index:
+        for citation in dict.fromkeys(c for codes in groups.values() for c in codes):
+            node = index.lookup(citation)
+            if node is None:
+                missing.append(citation)
+                continue
+            citation_nodes[normalize_citation(citation)] = node["id"]
+            selected[node["id"]] = node
+            for ancestor in index.ancestors(node["id"]):
+                selected[ancestor["id"]] = ancestor
+
+    # Renumber densely in document order; parents keep smaller ids
+    renumber = {old: new for new, old in enumerate(sorted(selected))}
+    nodes = [
+        (renumber[old], renumber.get(node["parent"]), node["type"], node["identifier"], node["part"],
+         node["label"], node["description"])
+        for old, node in sorted(selected.items())
+    ]
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(output.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript(BUNDLE_SCHEMA)
+    conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?)", nodes)
+    conn.executemany("INSERT INTO citations VALUES (?, ?)",
+                     sorted((c, renumber[n]) for c, n in citation_nodes.items()))
+    conn.executemany("INSERT INTO groups VALUES (?, ?)", sorted({
+        (name, normalize_citation(c)) for name, codes in groups.items()
+        for c in codes if normalize_citation(c) in citation_nodes
+    }))
+    with open(source, 'rb') as f:
+        source_sha256 = hashlib.sha256(f.read()).hexdigest()
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ("bundle_version", str(BUNDLE_VERSION)),
+        ("source_sha256", source_sha256),
+    ])
+    conn.execute(f"PRAGMA user_version = {BUNDLE_VERSION}")
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, output)
+
+    stats = {
+        "citations": len(citation_nodes),
+        "nodes": len(nodes),
+        "bytes": output.stat().st_size,
+        "source_bytes": Path(source).stat().st_size,
+    }
+    return stats, missing
+
+def bundle_lookup(conn, citation):
+    """Resolve a citation in the bundle to (section label, [ancestor labels])"""
+    key = normalize_citation(citation)
+    row = conn.execute(
+        "SELECT n.id, n.label FROM citations c JOIN nodes n ON n.id = c.node WHERE c.citation = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    ancestors = conn.execute("""
+        WITH RECURSIVE chain(id) AS (
+            SELECT parent FROM nodes WHERE id = ?
+            UNION ALL
+            SELECT nodes.parent FROM nodes JOIN chain ON nodes.id = chain.id WHERE nodes.parent IS NOT NULL
+        )
+        SELECT label FROM nodes WHERE id IN (SELECT id FROM chain) ORDER BY id
+    """, (row[0],)).fetchall()
+    return row[1], [a[0] for a in ancestors]
+
+def compare_latency(output, source, citations, repeat=1000):
+    """Time bundle lookups against loading and walking the raw JSON"""
+    def walk_json():
+        with open(source, 'r') as f:
+            pending = [json.load(f)]
+        wanted = {c for c in citations}
+        found = 0
+        while pending and found < len(wanted):
+            node = pending.pop()
+            found += node.get("identifier") in wanted
+            pending.extend(node.get("children") or [])
+
+    start = time.perf_counter()
+    for _ in range(3):
+        walk_json()
+    json_ms = (time.perf_counter() - start) / 3 * 1000
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(f"file:{output}?mode=ro", uri=True)
+    open_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for citation in citations:
+            bundle_lookup(conn, citation)
+    lookup_us = (time.perf_counter() - start) / (repeat * len(citations)) * 1e6
+    conn.close()
+
+    return {"json_ms": json_ms, "bundle_open_ms": open_ms, "bundle_lookup_us": lookup_us}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the OSHA reference bundle for the Android assets")
+    parser.add_argument("--source", default=str(DEFAULT_SOURCE), help="title-29.json path")
+    parser.add_argument("--index", default=str(DEFAULT_INDEX), help="osha_index.py index path")
+    parser.add_argument("--model-config", help="model_config.json (defaults: download_real_ppe_models.py)")
+    parser.add_argument("--metadata", default=str(DEFAULT_METADATA), help="model_metadata.json path")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="Bundle path")
+    parser.add_argument("--no-bench", action="store_true", help="Skip the latency comparison")
+    args = parser.parse_args(argv)
+
+    with open(args.metadata, 'r') as f:
+        metadata = json.load(f)
+    groups = collect_citations(load_model_config(args.model_config), metadata)
+    total = len({c for codes in groups.values() for c in codes})
+    print(f"📚 {total} OSHA citations referenced in {len(groups)} groups")
+
+    stats, missing = build_bundle(groups, args.output, args.source, args.index)
+    for citation in missing:
+        print(f"⚠️  {citation}: not found in {args.source}")
+
+    print(f"✅ Bundled {stats['citations']} citations ({stats['nodes']} nodes with ancestors) → {args.output}")
+    print(f"📦 Size: {stats['bytes']:,} bytes vs {stats['source_bytes']:,} bytes for {args.source} "
+          f"({stats['bytes'] / stats['source_bytes'] * 100:.2f}%)")
+
+    if not args.no_bench:
+        citations = [c for codes in groups.values() for c in codes if c not in missing]
+        timings = compare_latency(args.output, args.source, citations)
+        print(f"⏱️  Raw JSON parse + walk: {timings['json_ms']:.1f} ms")
+        print(f"⚡ Bundle open: {timings['bundle_open_ms']:.2f} ms, "
+              f"lookup with ancestors: {timings['bundle_lookup_us']:.1f} µs per citation")
+
+    return not missing
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Compile hazard class -> OSHA citation lookup tables
+
+The detector vocabularies (SAFETY_CLASSES in
+scripts/setup_yolo_hazard_detection.py and PPE_MODEL_CLASSES in
+download_real_ppe_models.py), construction_classes in model_metadata.json
+and the OSHA code lists (hazard_categories / ppe_requirements in the model
+config, osha_regulations in the metadata) are maintained separately.
+HAZARD_RULES below links them. The compiler checks every vocabulary against
+the rules and the OSHA reference bundle, then emits dense per-model tables:
+
+    category[class_id]      index into "categories" (construction_classes)
+    severity[class_id]      index into "severities"
+    threshold[class_id]     minimum confidence before citing
+    citation_offsets[class_id] .. citation_offsets[class_id + 1]
+                            slice of citation_ids (indices into "citations")
+
+so turning a detection into citations is two array reads. The asset carries
+a format version and a content hash of its inputs.
+
+Usage:
+    python compile_hazard_mapping.py
+    python compile_hazard_mapping.py --check     # validate only, non-zero exit on errors
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+from build_osha_bundle import DEFAULT_METADATA, DEFAULT_OUTPUT as DEFAULT_BUNDLE, load_model_config, normalize_citation
+from download_real_ppe_models import PPE_MODEL_CLASSES
+from setup_yolo_hazard_detection import SAFETY_CLASSES
+
+ASSETS_DIR = Path("HazardHawk/androidApp/src/main/assets")
+DEFAULT_OUTPUT = ASSETS_DIR / "hazard_mapping.json"
+
+FORMAT_VERSION = 1
+
+SEVERITIES = ["none", "low", "medium", "high", "critical"]
+
+# Spelling differences between model vocabularies -> canonical class name
+CLASS_ALIASES = {
+    "hardhat": "hard_hat",
+    "no_hardhat": "no_hard_hat",
+}
+
+# Canonical class -> construction class, severity, where its confidence
+# threshold comes from and which OSHA code groups a detection cites.
+# References are "<section>.<key>" into the model config / metadata.
+HAZARD_RULES = {
+    "person": {
+        "category": "general_construction",
+        "severity": "none",
+        "threshold": "confidence_thresholds.default",
+        "osha_groups": [],
+    },
+    "hard_hat": {
+        "category": "hard_hat_required",
+        "severity": "none",
+        "threshold": "confidence_thresholds.ppe_detection",
+        "osha_groups": [],
+    },
+    "safety_vest": {
+        "category": "safety_vest_required",
+        "severity": "none",
+        "threshold": "confidence_thresholds.ppe_detection",
+        "osha_groups": [],
+    },
+    "no_hard_hat": {
+        "category": "hard_hat_required",
+        "severity": "high",
+        "threshold": "ppe_requirements.hard_hat",
+        "osha_groups": ["ppe_requirements.hard_hat"],
+    },
+    "no_safety_vest": {
+        "category": "safety_vest_required",
+        "severity": "medium",
+        "threshold": "ppe_requirements.safety_vest",
+        "osha_groups": ["ppe_requirements.safety_vest"],
+    },
+    "machinery": {
+        "category": "heavy_machinery_operation",
+        "severity": "medium",
+        "threshold": "confidence_thresholds.hazard_identification",
+        "osha_groups": [],
+    },
+    "vehicle": {
+        "category": "heavy_machinery_operation",
+        "severity": "medium",
+        "threshold": "confidence_thresholds.hazard_identification",
+        "osha_groups": [],
+    },
+    "truck": {
+        "category": "heavy_machinery_operation",
+        "severity": "medium",
+        "threshold": "confidence_thresholds.hazard_identification",
+        "osha_groups": [],
+    },
+    "excavator": {
+        "category": "excavation_work",
+        "severity": "high",
+        "threshold": "confidence_thresholds.hazard_identification",
+        "osha_groups": ["osha_regulations.subpart_p_excavations"],
+    },
+    "crane": {
+        "category": "crane_operation",
+        "severity": "high",
+        "threshold": "confidence_thresholds.hazard_identification",
+        "osha_groups": ["osha_regulations.subpart_cc_cranes"],
+    },
+    "fall_hazard": {
+        "category": "fall_protection_required",
+        "severity": "critical",
+        "threshold": "hazard_categories.fall_protection",
+        "osha_groups": ["hazard_categories.fall_protection", "osha_regulations.subpart_m_fall_protection"],
+    },
+    "electrical_hazard": {
+        "category": "electrical_hazard",
+        "severity": "critical",
+        "threshold": "confidence_thresholds.hazard_identification",
+        "osha_groups": ["osha_regulations.subpart_k_electrical"],
+    },
+    "safety_cone": {
+        "category": "general_construction",
+        "severity": "none",
+        "threshold": "confidence_thresholds.default",
+        "osha_groups": [],
+    },
+    "barrier": {
+        "category": "general_construction",
+        "severity": "none",
+        "threshold": "confidence_thresholds.default",
+        "osha_groups": [],
+    },
+}
+
+def canonical_class(name):
+    """Normalize a model's class name (case, '-' vs '_', known aliases)"""
+    key = re.sub(r"[\s-]+", "_", name.strip().lower())
+    return CLASS_ALIASES.get(key, key)
+
+def model_vocabularies():
+    """Detector vocabularies as {model name: [class names by class id]}"""
+    hazard_detection = [name for name, _ in sorted(SAFETY_CLASSES.items(), key=lambda item: item[1])]
+    return {
+        "hazard_detection": hazard_detection,
+        "ppe_litert": list(PPE_MODEL_CLASSES),
+    }
+
+def reference_tables(model_config, metadata):
+    """Resolve "<section>.<key>" references to OSHA code lists and thresholds"""
+    groups = {}
+    thresholds = {}
+    for category in model_config.get("hazard_categories") or []:
+        key = f"hazard_categories.{category['id']}"
+        groups[key] = category.get("osha_codes") or []
+        thresholds[key] = category.get("confidence_threshold")
+    for name, requirement in (model_config.get("ppe_requirements") or {}).items():
+        key = f"ppe_requirements.{name}"
+        groups[key] = requirement.get("osha_codes") or []
+        thresholds[key] = requirement.get("confidence_threshold")
+    for name, codes in (metadata.get("osha_regulations") or {}).items():
+        groups[f"osha_regulations.{name}"] = codes
+    for name, value in (metadata.get("confidence_thresholds") or {}).items():
+        thresholds[f"confidence_thresholds.{name}"] = value
+    return groups, thresholds
+
+def bundle_citations(bundle_path):
+    """Normalized citation -> node id in the OSHA reference bundle"""
+    conn = sqlite3.connect(f"file:{bundle_path}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT citation, node FROM citations"))
+    finally:
+        conn.close()
+
+def validate(vocabularies, construction_classes, groups, thresholds, bundle):
+    """Cross-check every vocabulary; returns (errors, warnings)"""
+    errors = []
+    warnings = []
+
+    for model, classes in vocabularies.items():
+        seen = {}
+        for class_id, name in enumerate(classes):
+            canonical = canonical_class(name)
+            if canonical in seen:
+                errors.append(f"{model}: classes {seen[canonical]} and {class_id} both map to '{canonical}'")
+            seen[canonical] = class_id
+            if canonical not in HAZARD_RULES:
+                errors.append(f"{model}: class {class_id} '{name}' has no rule in HAZARD_RULES")
+
+    used_categories = set()
+    for name, rule in HAZARD_RULES.items():
+        used_categories.add(rule["category"])
+        if rule["category"] not in construction_classes:
+            errors.append(f"rule '{name}': category '{rule['category']}' is not in construction_classes")
+        if rule["severity"] not in SEVERITIES:
+            errors.append(f"rule '{name}': unknown severity '{rule['severity']}'")
+        if thresholds.get(rule["threshold"]) is None:
+            errors.append(f"rule '{name}': threshold reference '{rule['threshold']}' not found")
+        for group in rule["osha_groups"]:
+            if group not in groups:
+                errors.append(f"rule '{name}': OSHA group '{group}' not found")
+                continue
+            for citation in groups[group]:
+                if normalize_citation(citation) not in bundle:
+                    errors.append(f"rule '{name}': {citation} is missing from the OSHA bundle "
+                                  f"(run build_osha_bundle.py)")
+
+    in_use = {canonical_class(n) for classes in vocabularies.values() for n in classes}
+    for name in sorted(set(HAZARD_RULES) - in_use):
+        warnings.append(f"rule '{name}' is not used by any model vocabulary")
+    for category in construction_classes:
+        if category not in used_categories:
+            warnings.append(f"construction class '{category}' has no detector class")
+    cited = {g for rule in HAZARD_RULES.values() for g in rule["osha_groups"]}
+    for group in sorted(set(groups) - cited):
+        warnings.append(f"OSHA group '{group}' is not cited by any class")
+
+    return errors, warnings
+
+def compile_tables(vocabularies, construction_classes, groups, thresholds, bundle):
+    """Build the dense per-model arrays"""
+    citations = sorted(
+        {normalize_citation(c) for rule in HAZARD_RULES.values() for g in rule["osha_groups"] for c in groups[g]},
+        key=lambda c: [int(p) if p.isdigit() else p for p in re.split(r"[.\s]", c)],
+    )
+    citation_ids = {c: i for i, c in enumerate(citations)}
+
+    models = {}
+    for model, classes in vocabularies.items():
+        table = {"classes": list(classes), "category": [], "severity": [], "threshold": [],
+                 "citation_offsets": [0], "citation_ids": []}
+        for name in classes:
+            rule = HAZARD_RULES[canonical_class(name)]
+            table["category"].append(construction_classes.index(rule["category"]))
+            table["severity"].append(SEVERITIES.index(rule["severity"]))
+            table["threshold"].append(float(thresholds[rule["threshold"]]))
+            ids = list(dict.fromkeys(
+                citation_ids[normalize_citation(c)] for g in rule["osha_groups"] for c in groups[g]
+            ))
+            table["citation_ids"].extend(ids)
+            table["citation_offsets"].append(len(table["citation_ids"]))
+        models[model] = table
+
+    return {
+        "format_version": FORMAT_VERSION,
+        "severities": SEVERITIES,
+        "categories": list(construction_classes),
+        "citations": citations,
+        "citation_nodes": [bundle[c] for c in citations],
+        "models": models,
+    }
+
+def write_mapping(mapping, output):
+    """Stamp the content hash and write atomically; returns the hash"""
+    body = json.dumps(mapping, sort_keys=True, separators=(",", ":"))
+    mapping_version = hashlib.sha256(body.encode()).hexdigest()[:16]
+    document = {"mapping_version": mapping_version, **mapping}
+
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = output.with_name(output.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(document, f, separators=(",", ":"))
+        f.write("\n")
+    os.replace(tmp_path, output)
+    return mapping_version
+
+class HazardMapping:
+    """Host-side reader for the compiled asset (mirrors what the app does)"""
+
+    def __init__(self, path=DEFAULT_OUTPUT):
+        with open(path, 'r') as f:
+            self.data = json.load(f)
+
+    def citations_for(self, model, class_id, confidence=1.0):
+        """OSHA citations for a detection, or [] below the class threshold"""
+        table = self.data["models"][model]
+        if confidence < table["threshold"][class_id]:
+            return []
+        ids = table["citation_ids"][table["citation_offsets"][class_id]:table["citation_offsets"][class_id + 1]]
+        return [self.data["citations"][i] for i in ids]
+
+    def severity(self, model, class_id):
+        return self.data["severities"][self.data["models"][model]["severity"][class_id]]
+
+    def category(self, model, class_id):
+        return self.data["categories"][self.data["models"][model]["category"][class_id]]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile hazard class -> OSHA citation tables")
+    parser.add_argument("--model-config", help="model_config.json (defaults: download_real_ppe_models.py)")
+    parser.add_argument("--metadata", default=str(DEFAULT_METADATA), help="model_metadata.json path")
+    parser.add_argument("--bundle", default=str(DEFAULT_BUNDLE), help="OSHA reference bundle")
+    parser.add_argument("--output", default=str(DEFAULT_OUTPUT), help="Compiled mapping asset")
+    parser.add_argument("--check", action="store_true", help="Validate only, do not write")
+    args = parser.parse_args(argv)
+
+    with open(args.metadata, 'r') as f:
+        metadata = json.load(f)
+    construction_classes = metadata["construction_classes"]
+    groups, thresholds = reference_tables(load_model_config(args.model_config), metadata)
+    vocabularies = model_vocabularies()
+    bundle = bundle_citations(args.bundle)
+
+    errors, warnings = validate(vocabularies, construction_classes, groups, thresholds, bundle)
+    for warning in warnings:
+        print(f"⚠️  {warning}")
+    for error in errors:
+        print(f"❌ {error}")
+    if errors:
+        print(f"\n❌ {len(errors)} error(s); mapping not written")
+        return False
+
+    mapping = compile_tables(vocabularies, construction_classes, groups, thresholds, bundle)
+    for model, table in mapping["models"].items():
+        print(f"✅ {model}: {len(table['classes'])} classes, {len(table['citation_ids'])} citation links")
+    if args.check:
+        return True
+
+    version = write_mapping(mapping, args.output)
+    print(f"📦 Wrote {args.output} ({Path(args.output).stat().st_size:,} bytes, version {version})")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
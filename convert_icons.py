@@ -1,78 +1,170 @@
 #!/usr/bin/env python3
 """
 Convert SVG to PNG icons for Android app
-Requires: pip install pillow cairosvg
+
+The SVG is parsed and rendered once at the largest density (xxxhdpi,
+192 px); every other density is downsampled from that master, round
+variants are cut with an anti-aliased circular alpha mask, and the PNGs
+are encoded and written in parallel, then losslessly recompressed by
+optimize_png.py. The run is skipped entirely when the SVG (and the
+pipeline settings) hash matches the previous run.
+
+Requires: pip install pillow cairosvg numpy
 """
+import argparse
+import hashlib
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Check if required modules are available
 try:
     import cairosvg
+    import numpy as np
     from PIL import Image
     import io
 except ImportError as e:
     print(f"Missing required module: {e}")
-    print("Please install with: pip install pillow cairosvg")
+    print("Please install with: pip install pillow cairosvg numpy")
     sys.exit(1)
 
 # Android icon sizes for different densities
 DENSITIES = {
     'mdpi': 48,      # 1x
-    'hdpi': 72,      # 1.5x  
+    'hdpi': 72,      # 1.5x
     'xhdpi': 96,     # 2x
     'xxhdpi': 144,   # 3x
     'xxxhdpi': 192   # 4x
 }
 
-def convert_svg_to_png(svg_path, output_path, size):
-    """Convert SVG file to PNG with specified size"""
+# Bump when the rendering pipeline changes so stale icons get regenerated
+PIPELINE_VERSION = 2
+
+# Hash stamp lives next to res/ so aapt never sees it
+HASH_STAMP_NAME = '.launcher_icons.sha256'
+
+def render_master(svg_path, size):
+    """Parse and render the SVG once, returning an RGBA image of size x size"""
+    png_data = cairosvg.svg2png(url=str(svg_path), output_width=size, output_height=size)
+    return Image.open(io.BytesIO(png_data)).convert('RGBA')
+
+def downsample(master, size):
+    """High-quality downsample of the master render (alpha-premultiplied LANCZOS)"""
+    if master.size == (size, size):
+        return master.copy()
+    return master.resize((size, size), Image.Resampling.LANCZOS)
+
+def round_mask(size):
+    """Anti-aliased circular alpha mask as a float array in [0, 1]"""
+    center = (size - 1) / 2.0
+    y, x = np.ogrid[:size, :size]
+    distance = np.sqrt((x - center) ** 2 + (y - center) ** 2)
+    return np.clip(size / 2.0 - distance, 0.0, 1.0)
+
+def make_round(icon):
+    """Apply the circular mask to the icon's alpha channel"""
+    pixels = np.array(icon, dtype=np.float32)
+    pixels[..., 3] *= round_mask(icon.size[0])
+    return Image.fromarray(np.rint(pixels).astype(np.uint8), 'RGBA')
+
+def build_icons(master):
+    """Produce every density and variant from a single master render"""
+    icons = {}
+    for density, size in DENSITIES.items():
+        square = downsample(master, size)
+        icons[(density, 'ic_launcher.png')] = square
+        icons[(density, 'ic_launcher_round.png')] = make_round(square)
+    return icons
+
+def write_png(image, output_path):
+    """Encode and save one PNG"""
     try:
-        # Convert SVG to PNG using cairosvg
-        png_data = cairosvg.svg2png(url=svg_path, output_width=size, output_height=size)
-        
-        # Save PNG file
-        with open(output_path, 'wb') as f:
-            f.write(png_data)
-        
-        print(f"✓ Created {output_path} ({size}x{size})")
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        image.save(output_path, 'PNG')
+        print(f"✓ Created {output_path} ({image.size[0]}x{image.size[1]})")
         return True
     except Exception as e:
         print(f"✗ Failed to create {output_path}: {e}")
         return False
 
-def main():
+def source_hash(svg_path, optimize=True):
+    """Hash of the SVG contents plus everything else that affects the output"""
+    digest = hashlib.sha256()
+    digest.update(Path(svg_path).read_bytes())
+    digest.update(repr((PIPELINE_VERSION, sorted(DENSITIES.items()), optimize)).encode())
+    return digest.hexdigest()
+
+def outputs_exist(android_app_res):
+    return all(
+        (android_app_res / f'mipmap-{density}' / variant).exists()
+        for density in DENSITIES
+        for variant in ('ic_launcher.png', 'ic_launcher_round.png')
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Android launcher icons from the HazardHawk SVG")
+    parser.add_argument('--svg', default='superdesign/design_iterations/create_android_app_i_4.svg',
+                        help="Source SVG")
+    parser.add_argument('--res-dir', default='HazardHawk/androidApp/src/main/res',
+                        help="Android res directory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Parallel PNG writers")
+    parser.add_argument('--force', action='store_true',
+                        help="Regenerate even if the SVG is unchanged")
+    parser.add_argument('--no-optimize', action='store_true',
+                        help="Skip the lossless PNG optimization stage")
+    args = parser.parse_args(argv)
+
     # Paths
-    svg_file = Path('superdesign/design_iterations/create_android_app_i_4.svg')
-    android_app_res = Path('HazardHawk/androidApp/src/main/res')
-    
+    svg_file = Path(args.svg)
+    android_app_res = Path(args.res_dir)
+    stamp_file = android_app_res.parent / HASH_STAMP_NAME
+
     if not svg_file.exists():
         print(f"SVG file not found: {svg_file}")
         return False
-    
+
+    current_hash = source_hash(svg_file, not args.no_optimize)
+    if (not args.force and stamp_file.exists()
+            and stamp_file.read_text().strip() == current_hash
+            and outputs_exist(android_app_res)):
+        print(f"⏭️  {svg_file} unchanged since last run, icons are up to date")
+        return True
+
     print(f"🦅 Converting HazardHawk icon from {svg_file}")
     print(f"📱 Target: Android app in {android_app_res}")
-    
-    success_count = 0
-    total_count = 0
-    
-    # Create icons for each density
-    for density, size in DENSITIES.items():
-        mipmap_dir = android_app_res / f'mipmap-{density}'
-        mipmap_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Create both square and round variants
-        for variant in ['ic_launcher.png', 'ic_launcher_round.png']:
-            output_path = mipmap_dir / variant
-            total_count += 1
-            
-            if convert_svg_to_png(str(svg_file), str(output_path), size):
-                success_count += 1
-    
+
+    try:
+        master = render_master(svg_file, max(DENSITIES.values()))
+    except Exception as e:
+        print(f"✗ Failed to render {svg_file}: {e}")
+        return False
+
+    icons = build_icons(master)
+    total_count = len(icons)
+    outputs = {
+        android_app_res / f'mipmap-{density}' / variant: image
+        for (density, variant), image in icons.items()
+    }
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(lambda item: write_png(item[1], item[0]), outputs.items()))
+    success_count = sum(results)
+
     print(f"\n🎯 Conversion complete: {success_count}/{total_count} icons created")
-    
+
+    if success_count == total_count and not args.no_optimize:
+        import optimize_png
+
+        print("\n🗜️  Optimizing PNG encoding")
+        optimized = optimize_png.optimize_paths(list(outputs), args.workers)
+        if any('error' in r for r in optimized):
+            print("⚠️ Some icons could not be optimized")
+            return False
+
     if success_count == total_count:
+        stamp_file.write_text(current_hash + '\n')
         print("✅ All Android app icons successfully created!")
         return True
     else:
@@ -81,4 +173,4 @@ def main():
 
 if __name__ == '__main__':
     success = main()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+    sys.exit(0 if success else 1)
@@ -7,6 +7,8 @@ import tensorflow as tf
 import numpy as np
 from pathlib import Path
 
+from model_manifest import atomic_write_json, compile_manifest, update_model
+
 def create_dummy_yolo_tflite():
     """
     Create a dummy TensorFlow Lite model with the correct YOLOv8 structure
@@ -71,9 +73,7 @@ def update_model_metadata():
     }
     
     classes_path = Path("HazardHawk/androidApp/src/main/assets/hazard_classes.json")
-    import json
-    with open(classes_path, 'w') as f:
-        json.dump(classes, f, indent=2)
+    atomic_write_json(classes_path, classes)
     
     # Update model info
     model_info = {
@@ -86,8 +86,19 @@ def update_model_metadata():
     }
     
     info_path = Path("HazardHawk/androidApp/src/main/assets/model_info.json")
-    with open(info_path, 'w') as f:
-        json.dump(model_info, f, indent=2)
+    atomic_write_json(info_path, model_info)
+    
+    update_model("hazard_detector", {
+        "role": "hazard_detector",
+        "format": "tflite",
+        "version": model_info["version"],
+        "files": ["hazard_detection_model.tflite"],
+        "description": model_info["description"],
+        "quantization": "fp16",
+        "input_size": model_info["input_size"],
+        "classes": classes["classes"]
+    })
+    compile_manifest()
     
     print(f"✅ Updated model metadata")
 
@@ -3,102 +3,73 @@
 Download the best Gemma ONNX models for construction safety analysis
 """
 
-import os
-from huggingface_hub import hf_hub_download, list_repo_files
+from datetime import datetime, timezone
+from huggingface_hub import hf_hub_download
 from pathlib import Path
 import shutil
 
-def download_best_gemma_onnx():
-    """Download the most suitable Gemma ONNX models"""
-    
-    # Create temporary download directory
-    temp_dir = Path("models/temp_download")
-    temp_dir.mkdir(parents=True, exist_ok=True)
+from model_manifest import atomic_write_json, compile_manifest, update_model
+from select_onnx_model import select_model
+
+# Candidate repos for mobile deployment; the benchmark decides between them
+CANDIDATES = [
+    {
+        "repo": "aless2212/gemma-2b-it-fp16-onnx",
+        "description": "Gemma 2B Instruct FP16 - Good balance of size and performance"
+    },
+    {
+        "repo": "EmbeddedLLM/gemma-2b-it-int4-onnx-directml",
+        "description": "Gemma 2B INT4 - Smallest, optimized for mobile"
+    },
+    {
+        "repo": "nvidia/Gemma-2b-it-ONNX-INT4",
+        "description": "NVIDIA optimized Gemma 2B INT4"
+    },
+    {
+        "repo": "llmware/gemma-2b-it-onnx",
+        "description": "LLMware optimized Gemma 2B"
+    }
+]
+
+def download_best_gemma_onnx(client=None, budgets=None):
+    """
+    Download the most suitable Gemma ONNX model.
+
+    Every candidate variant within the RAM budget is downloaded and
+    benchmarked (see select_onnx_model.py); the fastest one that meets the
+    RAM and latency budgets in model_metadata.json is copied into assets
+    together with its external data files.
+    """
     
     # Assets directory for Android
     assets_dir = Path("HazardHawk/androidApp/src/main/assets")
     
-    # Best candidates for mobile deployment
-    candidates = [
-        {
-            "repo": "aless2212/gemma-2b-it-fp16-onnx",
-            "description": "Gemma 2B Instruct FP16 - Good balance of size and performance",
-            "priority": 1
-        },
-        {
-            "repo": "EmbeddedLLM/gemma-2b-it-int4-onnx-directml", 
-            "description": "Gemma 2B INT4 - Smallest, optimized for mobile",
-            "priority": 2
-        },
-        {
-            "repo": "nvidia/Gemma-2b-it-ONNX-INT4",
-            "description": "NVIDIA optimized Gemma 2B INT4",
-            "priority": 3
-        },
-        {
-            "repo": "llmware/gemma-2b-it-onnx",
-            "description": "LLMware optimized Gemma 2B",
-            "priority": 4
-        }
-    ]
+    print("🎯 Candidates:")
+    for candidate in CANDIDATES:
+        print(f"   {candidate['repo']}: {candidate['description']}")
     
-    downloaded_models = []
+    best, _ = select_model(client, [c["repo"] for c in CANDIDATES], budgets=budgets)
+    if best is None:
+        return []
     
-    for candidate in sorted(candidates, key=lambda x: x["priority"]):
-        try:
-            print(f"\n🎯 Trying {candidate['repo']}")
-            print(f"   Description: {candidate['description']}")
-            
-            # List files in the repository
-            files = list_repo_files(candidate["repo"])
-            onnx_files = [f for f in files if f.endswith('.onnx')]
-            
-            print(f"   📁 Available files: {len(files)}")
-            print(f"   🧠 ONNX models: {onnx_files}")
-            
-            if onnx_files:
-                # Download the main ONNX model
-                main_model = onnx_files[0]  # Usually the main model
-                
-                print(f"   📥 Downloading {main_model}...")
-                
-                # Download to temp directory first
-                downloaded_path = hf_hub_download(
-                    repo_id=candidate["repo"],
-                    filename=main_model,
-                    local_dir=str(temp_dir / candidate["repo"].replace("/", "_")),
-                    local_dir_use_symlinks=False
-                )
-                
-                # Get file size
-                file_size = os.path.getsize(downloaded_path) / (1024 * 1024)  # MB
-                print(f"   ✅ Downloaded: {file_size:.1f} MB")
-                
-                # Check if suitable for mobile (< 500MB for decoder)
-                if file_size < 500:
-                    print(f"   ✅ Suitable for mobile deployment")
-                    
-                    # Copy to Android assets as decoder
-                    decoder_path = assets_dir / "decoder_model_merged_q4.onnx"
-                    shutil.copy2(downloaded_path, decoder_path)
-                    print(f"   📱 Copied to Android assets: {decoder_path}")
-                    
-                    downloaded_models.append({
-                        "repo": candidate["repo"],
-                        "file": main_model,
-                        "size_mb": file_size,
-                        "path": decoder_path
-                    })
-                    
-                    break  # Use the first suitable model
-                else:
-                    print(f"   ⚠️  Too large for mobile: {file_size:.1f} MB")
-                    
-        except Exception as e:
-            print(f"   ❌ Failed to download from {candidate['repo']}: {e}")
-            continue
+    # The graph references its external data by file name, so data files
+    # keep their original names next to the renamed decoder
+    source_path = Path(best["path"])
+    decoder_path = assets_dir / "decoder_model_merged_q4.onnx"
+    shutil.copy2(source_path, decoder_path)
+    for data_file in best["data_files"]:
+        shutil.copy2(source_path.parent / Path(data_file).name, assets_dir / Path(data_file).name)
+    print(f"   📱 Copied to Android assets: {decoder_path}")
     
-    return downloaded_models
+    return [{
+        "repo": best["source"],
+        "file": best["file"],
+        "data_files": [Path(d).name for d in best["data_files"]],
+        "size_mb": best["size_mb"],
+        "quantization": best["quantization"],
+        "path": decoder_path,
+        "benchmark": best["result"]
+    }]
 
 def download_vision_model():
     """Download a suitable vision model for image analysis"""
@@ -125,10 +96,8 @@ def download_vision_model():
             except:
                 print(f"   ⚠️  Could not download {file}")
         
-        print(f"   ✅ CLIP vision model downloaded for future conversion")
-        
-        # For now, keep using YOLO as vision encoder (already optimized)
-        print(f"   📱 Using existing YOLO model as vision encoder")
+        print(f"   ✅ CLIP vision model downloaded")
+        print(f"   📱 Export it with: python scripts/vision_encoder_export.py export --update-manifest")
         
         return True
         
@@ -156,21 +125,38 @@ def update_model_metadata(downloaded_models):
             "size_mb": model["size_mb"],
             "checksum": f"real_gemma_{model['repo'].split('/')[-1]}",
             "source_repo": model["repo"],
-            "description": f"Real Gemma 2B ONNX model from {model['repo']}"
+            "description": f"Real Gemma 2B ONNX model from {model['repo']}",
+            "external_data_files": model["data_files"]
         })
         
         metadata["performance"].update({
             "using_placeholder_models": False,
             "real_gemma_model": True,
-            "model_source": model["repo"]
+            "model_source": model["repo"],
+            "measured_tokens_per_second": model["benchmark"]["tokens_per_second"],
+            "measured_latency_ms": model["benchmark"]["latency_ms"],
+            "measured_peak_rss_mb": model["benchmark"]["peak_rss_mb"]
         })
         
-        metadata["deployment"]["created_at"] = "2025-09-03T16:55:00Z"
+        metadata["deployment"]["created_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
         metadata["deployment"]["real_models_integrated"] = True
         
         # Save updated metadata
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
+        atomic_write_json(metadata_path, metadata)
+        
+        # Patch only the decoder's manifest record; sizes and checksums come from disk
+        update_model("gemma_decoder", {
+            "files": [Path(model["path"]).name] + model["data_files"],
+            "source": model["repo"],
+            "description": f"Real Gemma 2B ONNX model from {model['repo']}",
+            "quantization": model["quantization"],
+            "stats": {
+                "tokens_per_second": model["benchmark"]["tokens_per_second"],
+                "latency_ms": model["benchmark"]["latency_ms"],
+                "peak_rss_mb": model["benchmark"]["peak_rss_mb"]
+            }
+        })
+        compile_manifest()
         
         print(f"   ✅ Updated model metadata with real Gemma information")
 
@@ -4,6 +4,7 @@ Download and convert real YOLOv8 PPE detection models to TFLite format
 for the HazardHawk LiteRT integration.
 """
 
+import argparse
 import os
 import sys
 import subprocess
@@ -11,6 +12,45 @@ import urllib.request
 import json
 from pathlib import Path
 
+from model_manifest import atomic_write_json, compile_manifest, update_model
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+from setup_yolo_hazard_detection import ASPECT_RATIOS, parse_imgsz
+
+# Output classes of the converted PPE detection models
+PPE_MODEL_CLASSES = ["person", "hardhat", "no-hardhat", "safety-vest", "no-safety-vest",
+                     "machinery", "vehicle", "safety-cone"]
+
+# Written to model_config.json when the config does not define its own.
+# The OSHA codes are also bundled into the app by build_osha_bundle.py.
+DEFAULT_HAZARD_CATEGORIES = [
+    {
+        "id": "fall_protection",
+        "name": "Fall Protection",
+        "osha_codes": ["1926.501", "1926.502", "1926.503"],
+        "confidence_threshold": 0.7
+    },
+    {
+        "id": "ppe_compliance",
+        "name": "PPE Compliance", 
+        "osha_codes": ["1926.95", "1926.96", "1926.100"],
+        "confidence_threshold": 0.6
+    }
+]
+
+DEFAULT_PPE_REQUIREMENTS = {
+    "hard_hat": {
+        "work_types": ["GENERAL_CONSTRUCTION", "HIGH_RISE_CONSTRUCTION"],
+        "osha_codes": ["1926.100"],
+        "confidence_threshold": 0.8
+    },
+    "safety_vest": {
+        "work_types": ["ROADWORK", "GENERAL_CONSTRUCTION"],
+        "osha_codes": ["1926.201"],
+        "confidence_threshold": 0.7
+    }
+}
+
 def check_dependencies():
     """Check if required packages are installed."""
     required_packages = ['ultralytics', 'torch', 'torchvision']
@@ -31,8 +71,13 @@ def check_dependencies():
     
     return True
 
-def download_yolov8_models():
-    """Download pre-trained YOLOv8 models and convert to TFLite."""
+def download_yolov8_models(aspect=None):
+    """
+    Download pre-trained YOLOv8 models and convert to TFLite.
+    
+    target_size is the long (width) side; with an aspect ratio such as
+    4:3 the height is the stride-aligned short side (320 -> 320x256).
+    """
     
     project_dir = Path("/Users/aaron/Apps-Coded/HH-v0")
     models_dir = project_dir / "HazardHawk/androidApp/src/main/assets/models/litert"
@@ -76,15 +121,18 @@ def download_yolov8_models():
             
             # Load YOLO model
             model = YOLO(model_config['yolo_model'])
+            imgsz = parse_imgsz(str(model_config['target_size']), aspect)
+            # ultralytics takes a bare int for square inputs and [height, width] otherwise
+            export_size = imgsz[0] if imgsz[0] == imgsz[1] else list(imgsz)
             
             # Export to TFLite
             tflite_path = temp_dir / f"{model_config['name']}.tflite"
             
-            print(f"   📤 Exporting to TFLite format...")
+            print(f"   📤 Exporting to TFLite format at {imgsz[1]}x{imgsz[0]} (WxH)...")
             try:
                 model.export(
                     format='tflite',
-                    imgsz=model_config['target_size'],
+                    imgsz=export_size,
                     int8=True,  # Use INT8 quantization for smaller size
                     half=False,
                     simplify=True
@@ -109,7 +157,7 @@ def download_yolov8_models():
                         'name': model_config['name'],
                         'path': str(final_path),
                         'size_mb': round(size_mb, 1),
-                        'input_size': model_config['target_size'],
+                        'input_size': list(imgsz),
                         'description': model_config['description']
                     })
                     
@@ -158,7 +206,6 @@ def update_model_config(models_dir, converted_models):
         
         # Estimate performance based on model size and type
         size_mb = model_info['size_mb']
-        input_size = model_info['input_size']
         
         # Performance estimates (based on typical YOLOv8 benchmarks)
         if 'lite' in model_name:
@@ -179,14 +226,14 @@ def update_model_config(models_dir, converted_models):
             "version": "1.0.0",
             "size_mb": size_mb,
             "description": model_info['description'],
-            "input_size": input_size,
+            "input_size": model_info['input_size'],
+            "input_layout": "height_width",
             "supported_backends": ["CPU", "GPU_OPENGL", "GPU_OPENCL"] if 'lite' in model_name 
                                 else ["GPU_OPENCL", "GPU_OPENGL", "NPU_NNAPI"],
             "min_memory_gb": 2.0 if 'lite' in model_name else 3.0 if 'gpu' in model_name else 4.0,
             "accuracy_score": accuracy,
-            "classes": ["person", "hardhat", "no-hardhat", "safety-vest", "no-safety-vest", 
-                       "machinery", "vehicle", "safety-cone"],
-            "num_classes": 8,
+            "classes": PPE_MODEL_CLASSES,
+            "num_classes": len(PPE_MODEL_CLASSES),
             "inference_time_ms": {
                 "CPU": cpu_time,
                 "GPU": gpu_time
@@ -195,40 +242,43 @@ def update_model_config(models_dir, converted_models):
     
     # Ensure hazard categories and PPE requirements exist
     if not config.get("hazard_categories"):
-        config["hazard_categories"] = [
-            {
-                "id": "fall_protection",
-                "name": "Fall Protection",
-                "osha_codes": ["1926.501", "1926.502", "1926.503"],
-                "confidence_threshold": 0.7
-            },
-            {
-                "id": "ppe_compliance",
-                "name": "PPE Compliance", 
-                "osha_codes": ["1926.95", "1926.96", "1926.100"],
-                "confidence_threshold": 0.6
-            }
-        ]
+        config["hazard_categories"] = DEFAULT_HAZARD_CATEGORIES
     
     if not config.get("ppe_requirements"):
-        config["ppe_requirements"] = {
-            "hard_hat": {
-                "work_types": ["GENERAL_CONSTRUCTION", "HIGH_RISE_CONSTRUCTION"],
-                "confidence_threshold": 0.8
-            },
-            "safety_vest": {
-                "work_types": ["ROADWORK", "GENERAL_CONSTRUCTION"],
-                "confidence_threshold": 0.7
-            }
-        }
+        config["ppe_requirements"] = DEFAULT_PPE_REQUIREMENTS
     
     # Save updated configuration
-    with open(config_path, 'w') as f:
-        json.dump(config, f, indent=2)
+    atomic_write_json(config_path, config)
     
     print(f"📝 Updated configuration: {config_path}")
+    
+    # One manifest record per converted model; the other records are untouched
+    assets_dir = models_dir.parent.parent
+    for model_info in converted_models:
+        model_config = config["models"][model_info['name']]
+        update_model(model_info['name'], {
+            "role": "ppe_detector",
+            "format": "tflite",
+            "version": model_config["version"],
+            "files": [str(Path(model_info['path']).relative_to(assets_dir))],
+            "description": model_info['description'],
+            "quantization": "int8",
+            "input_size": model_info['input_size'],
+            "classes": PPE_MODEL_CLASSES,
+            "stats": {
+                "accuracy_score": model_config["accuracy_score"],
+                "inference_time_ms": model_config["inference_time_ms"],
+                "min_memory_gb": model_config["min_memory_gb"]
+            }
+        }, assets_dir=assets_dir)
+    compile_manifest(output=assets_dir / "model_manifest.json")
 
 def main():
+    parser = argparse.ArgumentParser(description="Download and convert YOLOv8 PPE models to TFLite")
+    parser.add_argument("--aspect", choices=sorted(ASPECT_RATIOS),
+                        help="Camera aspect ratio (width:height) to match, e.g. 4:3 -> 640x480")
+    args = parser.parse_args()
+    
     print("🏗️  HazardHawk LiteRT Model Setup")
     print("=" * 40)
     
@@ -237,7 +287,7 @@ def main():
         sys.exit(1)
     
     try:
-        success = download_yolov8_models()
+        success = download_yolov8_models(args.aspect)
         
         if success:
             print("\n🎉 Model setup completed successfully!")
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Concurrent, cached Hugging Face Hub model discovery
+
+Talks to the Hub REST API over one pooled requests.Session, fans searches
+and per-repo lookups out over a thread pool, and caches every JSON
+response on disk with a TTL. With a fixture file (or --offline) no network
+access happens at all, which keeps CI and laptops without network usable.
+
+Fixture format:
+    {
+      "search": {"gemma onnx": [{"id": "...", "tags": [...], "downloads": 1}]},
+      "models": {"org/repo": {"id": "org/repo", "siblings": [{"rfilename": "model.onnx", "size": 123}]}}
+    }
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+HUB_API = "https://huggingface.co/api"
+REPO_ROOT = Path(__file__).resolve().parent
+DEFAULT_CACHE_DIR = REPO_ROOT / "models/cache/hf_api"
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+CACHEABLE_STATUSES = (200, 404)
+
+# Filename/tag markers, most mobile-friendly first
+QUANTIZATION_MARKERS = [
+    ("int4", ("int4", "q4", "4bit", "w4")),
+    ("int8", ("int8", "uint8", "q8", "8bit", "quantized")),
+    ("fp16", ("fp16", "float16", "f16")),
+]
+QUANTIZATION_SCORES = {"int4": 1.0, "int8": 0.7, "fp16": 0.4, "fp32": 0.0}
+
+
+class HubClient:
+    """Thin Hub API client with connection pooling, disk caching and fixtures."""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 fixture=None, offline=False, max_workers=8, timeout=10):
+        """
+        Args:
+            cache_dir: Directory for cached JSON responses (None disables caching)
+            ttl_seconds: Age after which cached responses are refetched
+            fixture: Optional JSON fixture path used instead of the network
+            offline: Never touch the network; serve from fixture/cache only
+            max_workers: Thread pool size and HTTP connection pool size
+            timeout: Per-request timeout in seconds
+        """
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.ttl_seconds = ttl_seconds
+        self.offline = offline or fixture is not None
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.fixture = None
+        if fixture is not None:
+            with open(fixture, "r") as f:
+                self.fixture = json.load(f)
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            self._session.mount("https://", adapter)
+            token = os.environ.get("HF_TOKEN")
+            if token:
+                self._session.headers["Authorization"] = f"Bearer {token}"
+        return self._session
+
+    def _cache_path(self, key):
+        return self.cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.json"
+
+    def _read_cache(self, key, allow_stale=False):
+        if self.cache_dir is None:
+            return None
+        path = self._cache_path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not allow_stale and time.time() - entry["fetched_at"] > self.ttl_seconds:
+            return None
+        return entry
+
+    def _write_cache(self, key, status, body):
+        if self.cache_dir is None:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "fetched_at": time.time(), "status": status, "body": body}, f)
+        os.replace(tmp_path, path)
+
+    def get_json(self, path, params=None):
+        """
+        GET a Hub API path and return (status, body), using the cache when fresh.
+
+        Only 200 and 404 responses are cached. Network errors, rate limits,
+        server errors and unparseable bodies fall back to a stale cache
+        entry if one exists.
+        """
+        query = "&".join(f"{k}={v}" for k, v in sorted((params or {}).items()))
+        key = f"{path}?{query}"
+
+        cached = self._read_cache(key)
+        if cached is not None:
+            return cached["status"], cached["body"]
+        if self.offline:
+            stale = self._read_cache(key, allow_stale=True)
+            return (stale["status"], stale["body"]) if stale else (None, None)
+
+        try:
+            response = self.session.get(f"{HUB_API}/{path}", params=params, timeout=self.timeout)
+            body = response.json() if response.status_code == 200 else None
+        except Exception:
+            response = None
+
+        # 429s and 5xx are transient: never let them hide a repo or search for a whole TTL
+        if response is None or response.status_code not in CACHEABLE_STATUSES:
+            stale = self._read_cache(key, allow_stale=True)
+            if stale:
+                return stale["status"], stale["body"]
+            return (response.status_code, None) if response is not None else (None, None)
+
+        self._write_cache(key, response.status_code, body)
+        return response.status_code, body
+
+    def search(self, term, limit=10):
+        """Search models; returns a list of model dicts (id, tags, downloads, ...)"""
+        if self.fixture is not None:
+            return self.fixture.get("search", {}).get(term, [])[:limit]
+        status, body = self.get_json("models", {"search": term, "limit": limit, "full": "true"})
+        return body if status == 200 and body else []
+
+    def model_info(self, repo):
+        """Model info including sibling file sizes, or None if the repo is unavailable"""
+        if self.fixture is not None:
+            info = self.fixture.get("models", {}).get(repo)
+            return {"id": repo, **info} if info is not None else None
+        status, body = self.get_json(f"models/{repo}", {"blobs": "true"})
+        return body if status == 200 else None
+
+    def search_many(self, terms, limit=10):
+        """Run several searches concurrently; returns {term: results}"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = executor.map(lambda term: self.search(term, limit), terms)
+            return dict(zip(terms, results))
+
+    def model_infos(self, repos):
+        """Fetch info for several repos concurrently; returns {repo: info or None}"""
+        repos = list(dict.fromkeys(repos))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return dict(zip(repos, executor.map(self.model_info, repos)))
+
+
+def model_id(info):
+    return info.get("id") or info.get("modelId")
+
+
+def detect_quantization(text):
+    """Map a filename or tag string to int4/int8/fp16, defaulting to fp32"""
+    lowered = text.lower()
+    for label, markers in QUANTIZATION_MARKERS:
+        if any(re.search(rf"(^|[^a-z0-9]){marker}([^a-z0-9]|$)", lowered) for marker in markers):
+            return label
+    return "fp32"
+
+
+def onnx_variants(info):
+    """
+    Group a repo's ONNX graphs with their external data files.
+
+    Returns a list of dicts sorted by total size:
+        {"file", "data_files", "bytes", "quantization"}
+    Sizes are None when the Hub did not report them.
+    """
+    siblings = info.get("siblings") or []
+    sizes = {s["rfilename"]: s.get("size") for s in siblings}
+    variants = []
+
+    for name, size in sizes.items():
+        if not name.endswith(".onnx"):
+            continue
+        # model.onnx_data, model.onnx.data, model.onnx.data_1, ...
+        data_files = sorted(other for other in sizes if other != name and other.startswith(name))
+        parts = [size] + [sizes[d] for d in data_files]
+        total = sum(parts) if all(p is not None for p in parts) else None
+        variants.append({
+            "file": name,
+            "data_files": data_files,
+            "bytes": total,
+            "quantization": detect_quantization(name),
+        })
+
+    return sorted(variants, key=lambda v: (v["bytes"] is None, v["bytes"] or 0))
+
+
+def summarize_candidate(info):
+    """Flatten Hub model info into a ranking record"""
+    variants = onnx_variants(info)
+    tags = info.get("tags") or []
+    smallest = variants[0] if variants else None
+
+    quantization = smallest["quantization"] if smallest else "fp32"
+    if quantization == "fp32":
+        quantization = detect_quantization(" ".join([model_id(info) or ""] + tags))
+
+    return {
+        "id": model_id(info),
+        "tags": tags,
+        "downloads": info.get("downloads") or 0,
+        "onnx_variants": variants,
+        "smallest_onnx_bytes": smallest["bytes"] if smallest else None,
+        "quantization": quantization,
+    }
+
+
+def score_candidate(candidate):
+    """
+    Rank a candidate for mobile use: small ONNX files, low-bit quantization
+    and popularity. Repos without ONNX files score 0.
+    """
+    if not candidate["onnx_variants"]:
+        return 0.0
+    size_bytes = candidate["smallest_onnx_bytes"]
+    size_gb = size_bytes / 1024 ** 3 if size_bytes is not None else 4.0
+    size_score = 1.0 / (1.0 + size_gb)
+    quant_score = QUANTIZATION_SCORES.get(candidate["quantization"], 0.0)
+    popularity = min(math.log10(1 + candidate["downloads"]) / 6.0, 1.0)
+    return round(2.0 * size_score + quant_score + popularity, 4)
+
+
+def discover(client, search_terms, extra_repos=(), limit=10):
+    """
+    Search concurrently, fetch file manifests concurrently and rank results.
+
+    Args:
+        client: HubClient instance
+        search_terms: Hub search queries
+        extra_repos: Repos to include regardless of search results
+        limit: Results per search
+
+    Returns:
+        Ranked list of candidate records (best first), each with a "score"
+    """
+    found = client.search_many(search_terms, limit)
+    repos = []
+    for results in found.values():
+        for result in results:
+            identifier = model_id(result)
+            tags = " ".join(result.get("tags") or []).lower()
+            if identifier and ("onnx" in identifier.lower() or "onnx" in tags):
+                repos.append(identifier)
+    repos.extend(extra_repos)
+
+    candidates = []
+    for repo, info in client.model_infos(repos).items():
+        if info is None:
+            continue
+        candidate = summarize_candidate(info)
+        candidate["score"] = score_candidate(candidate)
+        candidates.append(candidate)
+
+    return sorted(candidates, key=lambda c: c["score"], reverse=True)
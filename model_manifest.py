@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+Unified, schema-validated model manifest
+
+Model metadata used to be spread over model_config.json, model_metadata.json,
+model_info.json, hazard_classes.json (in two different shapes) and
+decoder_config.json. This module keeps one typed record per model:
+
+    models/manifest.d/<model id>.json    source of truth, one file per model
+
+and compiles them into the single file the app reads at startup:
+
+    HazardHawk/androidApp/src/main/assets/model_manifest.json
+
+- Every record is validated against the ModelEntry/ModelFile dataclasses
+  (types, required fields, unknown keys, known roles and formats).
+- Writes go to a temporary file in the same directory and are renamed into
+  place, so a crash never leaves a half-written manifest.
+- File sizes and SHA-256 checksums are real. A checksum is only recomputed
+  when a file's size or mtime changed (models/cache/manifest_checksums.json).
+- update_model() patches one model's record (deep merge). It never touches
+  the other records, and compile_manifest() skips work when no record changed.
+
+Usage:
+    python model_manifest.py import-legacy       # one-off migration of the old JSON files
+    python model_manifest.py patch gemma_decoder '{"stats": {"target_inference_time_ms": 1500}}'
+    python model_manifest.py refresh             # re-stat files, rehash changed ones
+    python model_manifest.py compile
+    python model_manifest.py verify
+"""
+import argparse
+import dataclasses
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import typing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Anchored to the repository root so scripts run from any directory share one set of records
+REPO_ROOT = Path(__file__).resolve().parent
+ASSETS_DIR = REPO_ROOT / "HazardHawk/androidApp/src/main/assets"
+FRAGMENTS_DIR = REPO_ROOT / "models/manifest.d"
+COMPILED_MANIFEST = ASSETS_DIR / "model_manifest.json"
+CHECKSUM_CACHE = REPO_ROOT / "models/cache/manifest_checksums.json"
+
+FORMAT_VERSION = 1
+
+ROLES = ("hazard_detector", "ppe_detector", "vision_encoder", "text_decoder", "tokenizer", "reference_data")
+FORMATS = ("tflite", "onnx", "ort", "json", "sqlite")
+
+HASH_CHUNK_BYTES = 1 << 20
+
+class ManifestError(ValueError):
+    """Raised when a manifest record does not match the schema"""
+
+@dataclass
+class ModelFile:
+    path: str                       # relative to the assets directory
+    size_bytes: int
+    sha256: Optional[str] = None    # None until the file exists locally
+    required: bool = True
+
+@dataclass
+class ModelEntry:
+    id: str
+    role: str
+    format: str
+    version: str
+    files: List[ModelFile]
+    description: str = ""
+    source: Optional[str] = None
+    quantization: Optional[str] = None
+    input_size: List[int] = field(default_factory=list)
+    classes: List[str] = field(default_factory=list)
+    config: Dict[str, Any] = field(default_factory=dict)
+    stats: Dict[str, Any] = field(default_factory=dict)
+    updated_at: Optional[str] = None
+
+    def validate(self):
+        if self.role not in ROLES:
+            raise ManifestError(f"{self.id}.role: '{self.role}' is not one of {', '.join(ROLES)}")
+        if self.format not in FORMATS:
+            raise ManifestError(f"{self.id}.format: '{self.format}' is not one of {', '.join(FORMATS)}")
+        paths = [f.path for f in self.files]
+        if len(paths) != len(set(paths)):
+            raise ManifestError(f"{self.id}.files: duplicate paths")
+        for model_file in self.files:
+            if model_file.size_bytes < 0:
+                raise ManifestError(f"{self.id}.files[{model_file.path}].size_bytes: must be >= 0")
+            if model_file.sha256 is not None and len(model_file.sha256) != 64:
+                raise ManifestError(f"{self.id}.files[{model_file.path}].sha256: not a SHA-256 hex digest")
+
+def _check_type(value, hint, where):
+    """Validate value against a type hint and convert nested dataclasses"""
+    origin = typing.get_origin(hint)
+    args = typing.get_args(hint)
+
+    if hint is Any:
+        return value
+    if origin is typing.Union:
+        if value is None and type(None) in args:
+            return None
+        return _check_type(value, next(a for a in args if a is not type(None)), where)
+    if dataclasses.is_dataclass(hint):
+        return _from_dict(hint, value, where)
+    if origin is list:
+        if not isinstance(value, list):
+            raise ManifestError(f"{where}: expected a list, got {type(value).__name__}")
+        return [_check_type(item, args[0], f"{where}[{i}]") for i, item in enumerate(value)]
+    if origin is dict:
+        if not isinstance(value, dict):
+            raise ManifestError(f"{where}: expected an object, got {type(value).__name__}")
+        return {k: _check_type(v, args[1], f"{where}.{k}") for k, v in value.items()}
+    if hint is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if hint is int and isinstance(value, bool) or not isinstance(value, hint):
+        raise ManifestError(f"{where}: expected {hint.__name__}, got {type(value).__name__}")
+    return value
+
+def _from_dict(cls, data, where):
+    if not isinstance(data, dict):
+        raise ManifestError(f"{where}: expected an object, got {type(data).__name__}")
+    hints = typing.get_type_hints(cls)
+    fields = {f.name: f for f in dataclasses.fields(cls)}
+    unknown = set(data) - set(fields)
+    if unknown:
+        raise ManifestError(f"{where}: unknown field(s) {', '.join(sorted(unknown))}")
+    values = {}
+    for name, spec in fields.items():
+        if name not in data:
+            if spec.default is dataclasses.MISSING and spec.default_factory is dataclasses.MISSING:
+                raise ManifestError(f"{where}.{name}: required field missing")
+            continue
+        values[name] = _check_type(data[name], hints[name], f"{where}.{name}")
+    return cls(**values)
+
+def entry_from_dict(data):
+    """Build and validate a ModelEntry from parsed JSON"""
+    entry = _from_dict(ModelEntry, data, data.get("id", "<entry>") if isinstance(data, dict) else "<entry>")
+    entry.validate()
+    return entry
+
+def _file_mode(path):
+    """Mode for a rewritten file: the existing file's, else 0o666 minus the umask"""
+    try:
+        return path.stat().st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def atomic_write_json(path, data, indent=2):
+    """Write JSON to a temp file in the same directory, fsync, then rename over path"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    mode = _file_mode(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w") as f:
+            if indent is None:
+                json.dump(data, f, separators=(",", ":"))
+            else:
+                json.dump(data, f, indent=indent)
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600; keep the file readable like the one it replaces
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ChecksumCache:
+    """
+    SHA-256 digests keyed by path and reused while size and mtime are unchanged.
+
+    Kept outside the manifest records so that checkouts (which reset mtimes)
+    never show up as manifest changes.
+    """
+
+    def __init__(self, path=CHECKSUM_CACHE):
+        self.path = Path(path)
+        self.dirty = False
+        try:
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def sha256(self, path):
+        path = Path(path)
+        stat = path.stat()
+        key = str(path.resolve())
+        cached = self.entries.get(key)
+        if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+        checksum = sha256_file(path)
+        self.entries[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": checksum}
+        self.dirty = True
+        return checksum
+
+    def save(self):
+        if self.dirty:
+            atomic_write_json(self.path, self.entries, indent=None)
+            self.dirty = False
+
+def file_record(relative_path, assets_dir=ASSETS_DIR, previous=None, required=True, expected_bytes=None,
+                cache=None):
+    """
+    Describe one asset file.
+
+    If the file exists, size and checksum are taken from disk (through the
+    checksum cache when given). Missing files keep their previous (or
+    expected) size and have no checksum.
+    """
+    path = Path(assets_dir) / relative_path
+    required = required if previous is None else previous.required
+    if not path.exists():
+        size = previous.size_bytes if previous else int(expected_bytes or 0)
+        return ModelFile(relative_path, size, None, required)
+
+    checksum = cache.sha256(path) if cache is not None else sha256_file(path)
+    return ModelFile(relative_path, path.stat().st_size, checksum, required)
+
+def _utc_now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _deep_merge(base, patch):
+    """Merge patch into base: objects merge recursively, everything else is replaced"""
+    merged = dict(base)
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+def fragment_path(model_id, fragments_dir=FRAGMENTS_DIR):
+    return Path(fragments_dir) / f"{model_id}.json"
+
+def load_entry(model_id, fragments_dir=FRAGMENTS_DIR):
+    """Load one model's record, or None if it does not exist"""
+    path = fragment_path(model_id, fragments_dir)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return entry_from_dict(json.load(f))
+
+def save_entry(entry, fragments_dir=FRAGMENTS_DIR):
+    entry.validate()
+    atomic_write_json(fragment_path(entry.id, fragments_dir), dataclasses.asdict(entry))
+
+def refresh_files(entry, assets_dir=ASSETS_DIR, cache=None):
+    """Re-stat every file of an entry; only changed files are rehashed"""
+    entry.files = [file_record(f.path, assets_dir, previous=f, cache=cache) for f in entry.files]
+    return entry
+
+def update_model(model_id, patch, fragments_dir=FRAGMENTS_DIR, assets_dir=ASSETS_DIR, cache=None):
+    """
+    Patch a single model's record and write it back atomically.
+
+    `patch` is deep-merged into the stored record (or creates it, in which
+    case it must contain every required field). `files` may be given as
+    plain asset paths; sizes and checksums are filled in from disk.
+
+    Returns the updated ModelEntry.
+    """
+    cache = cache or ChecksumCache()
+    current = load_entry(model_id, fragments_dir)
+    base = dataclasses.asdict(current) if current else {"id": model_id}
+    previous_files = {f.path: f for f in current.files} if current else {}
+
+    patch = dict(patch)
+    if "files" in patch:
+        patch["files"] = [
+            dataclasses.asdict(file_record(item, assets_dir, previous_files.get(item), cache=cache))
+            if isinstance(item, str) else item
+            for item in patch["files"]
+        ]
+
+    merged = _deep_merge(base, patch)
+    merged["updated_at"] = _utc_now()
+    entry = refresh_files(entry_from_dict(merged), assets_dir, cache)
+    save_entry(entry, fragments_dir)
+    cache.save()
+    return entry
+
+def _fragment_paths(fragments_dir):
+    return sorted(Path(fragments_dir).glob("*.json"))
+
+def _inputs_fingerprint(paths):
+    # Content-based, so checkouts that only touch mtimes do not recompile
+    digest = hashlib.sha256(str(FORMAT_VERSION).encode())
+    for path in paths:
+        digest.update(path.name.encode() + b"\0" + path.read_bytes())
+    return digest.hexdigest()
+
+def compile_manifest(fragments_dir=FRAGMENTS_DIR, output=COMPILED_MANIFEST, force=False):
+    """
+    Combine all model records into the single app manifest.
+
+    Skipped when no record changed since the last compile. Returns True
+    if the manifest was written.
+    """
+    paths = _fragment_paths(fragments_dir)
+    fingerprint = _inputs_fingerprint(paths)
+    output = Path(output)
+    if not force and output.exists():
+        try:
+            with open(output, "r") as f:
+                if json.load(f).get("inputs_fingerprint") == fingerprint:
+                    return False
+        except ValueError:
+            pass
+
+    models = {}
+    for path in paths:
+        with open(path, "r") as f:
+            entry = entry_from_dict(json.load(f))
+        if entry.id != path.stem:
+            raise ManifestError(f"{path}: id '{entry.id}' does not match the file name")
+        models[entry.id] = dataclasses.asdict(entry)
+
+    updated = [m["updated_at"] for m in models.values() if m["updated_at"]]
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "generated_at": max(updated) if updated else None,
+        "inputs_fingerprint": fingerprint,
+        "models": models,
+    }
+    atomic_write_json(output, manifest, indent=None)
+    return True
+
+def verify(fragments_dir=FRAGMENTS_DIR, assets_dir=ASSETS_DIR):
+    """Check every record validates and every present file matches its checksum"""
+    cache = ChecksumCache()
+    problems = []
+    for path in _fragment_paths(fragments_dir):
+        try:
+            with open(path, "r") as f:
+                entry = entry_from_dict(json.load(f))
+        except (ManifestError, ValueError) as e:
+            problems.append(f"{path}: {e}")
+            continue
+        for model_file in entry.files:
+            asset = Path(assets_dir) / model_file.path
+            if not asset.exists():
+                if model_file.required:
+                    problems.append(f"{entry.id}: required file {model_file.path} is missing")
+            elif model_file.sha256 is None or asset.stat().st_size != model_file.size_bytes \
+                    or cache.sha256(asset) != model_file.sha256:
+                problems.append(f"{entry.id}: {model_file.path} does not match its recorded checksum")
+    cache.save()
+    return problems
+
+def import_legacy(assets_dir=ASSETS_DIR, fragments_dir=FRAGMENTS_DIR):
+    """
+    One-off migration from model_metadata.json, model_info.json,
+    hazard_classes.json (dict or list form) and decoder_config.json.
+    """
+    assets_dir = Path(assets_dir)
+    cache = ChecksumCache()
+
+    def read(name):
+        path = assets_dir / name
+        if not path.exists():
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    metadata = read("model_metadata.json")
+    model_info = read("model_info.json")
+    decoder_config = read("decoder_config.json")
+    hazard_classes = normalize_classes(read("hazard_classes.json"))
+    files_meta = metadata.get("model_files", {})
+    architecture = metadata.get("architecture", {})
+
+    def legacy_file(name):
+        meta = files_meta.get(name, {})
+        return file_record(name, assets_dir, required=meta.get("required", True),
+                           expected_bytes=meta.get("size_mb", 0) * 1024 * 1024, cache=cache)
+
+    entries = []
+    decoder = architecture.get("text_decoder", {})
+    decoder_meta = files_meta.get(decoder.get("model_file"), {})
+    # model_metadata.json lists a decoder file (and size) that was never shipped; only record it if present
+    decoder_file = decoder.get("model_file", "decoder_model_merged_q4.onnx")
+    decoder_files = [legacy_file(decoder_file)] if (assets_dir / decoder_file).exists() else []
+    decoder_files += [legacy_file(p.name) for p in sorted(assets_dir.glob("*.onnx.data"))]
+    entries.append(ModelEntry(
+        id="gemma_decoder", role="text_decoder", format="onnx", version=metadata.get("model_version", "1.0.0"),
+        files=decoder_files, description=decoder_meta.get("description", ""),
+        source=decoder_meta.get("source_repo"), quantization=decoder.get("quantization"),
+        config={**decoder_config, "max_sequence_length": decoder.get("max_sequence_length")},
+        stats={k: v for k, v in metadata.get("performance", {}).items()
+               if k.startswith(("min_ram", "target_", "memory_", "measured_"))},
+    ))
+
+    encoder = architecture.get("vision_encoder", {})
+    entries.append(ModelEntry(
+        id="vision_encoder", role="vision_encoder", format="onnx", version=metadata.get("model_version", "1.0.0"),
+        files=[legacy_file(encoder.get("model_file", "vision_encoder.onnx"))],
+        description=files_meta.get(encoder.get("model_file"), {}).get("description", ""),
+        input_size=list(encoder.get("input_size", [])), config={"preprocessing": encoder.get("preprocessing", {})},
+    ))
+
+    if "tokenizer.json" in files_meta:
+        entries.append(ModelEntry(
+            id="gemma_tokenizer", role="tokenizer", format="json", version=metadata.get("model_version", "1.0.0"),
+            files=[legacy_file("tokenizer.json")], description=files_meta["tokenizer.json"].get("description", ""),
+        ))
+
+    entries.append(ModelEntry(
+        id="hazard_detector", role="hazard_detector", format=model_info.get("format", "tflite"),
+        version=model_info.get("version", "1.0.0"), files=[legacy_file("hazard_detection_model.tflite")],
+        description=model_info.get("description", ""), input_size=list(model_info.get("input_size", [])),
+        classes=hazard_classes,
+    ))
+
+    for name, description in (("osha_reference.sqlite", "OSHA Part 1926 reference bundle"),
+                              ("hazard_mapping.json", "Hazard class to OSHA citation tables")):
+        if (assets_dir / name).exists():
+            entries.append(ModelEntry(
+                id=Path(name).stem, role="reference_data", format=Path(name).suffix.lstrip("."),
+                version="1", files=[file_record(name, assets_dir, cache=cache)], description=description,
+            ))
+
+    for entry in entries:
+        entry.updated_at = _utc_now()
+        save_entry(entry, fragments_dir)
+    cache.save()
+    return entries
+
+def normalize_classes(data):
+    """Class names by id from either hazard_classes.json shape ({"classes": [...]} or {name: id})"""
+    if isinstance(data, list):
+        return list(data)
+    if "classes" in data:
+        return normalize_classes(data["classes"])
+    return [name for name, _ in sorted(data.items(), key=lambda item: item[1])]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the unified model manifest")
+    parser.add_argument("--fragments-dir", default=str(FRAGMENTS_DIR), help="Per-model record directory")
+    parser.add_argument("--assets-dir", default=str(ASSETS_DIR), help="Android assets directory")
+    parser.add_argument("--output", default=str(COMPILED_MANIFEST), help="Compiled app manifest")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("import-legacy", help="Create records from the old metadata files")
+    patch = subparsers.add_parser("patch", help="Deep-merge a JSON patch into one model's record")
+    patch.add_argument("model_id")
+    patch.add_argument("patch", help="JSON object")
+    refresh = subparsers.add_parser("refresh", help="Re-stat files and rehash changed ones")
+    refresh.add_argument("model_ids", nargs="*")
+    compile_parser = subparsers.add_parser("compile", help="Write the single app manifest")
+    compile_parser.add_argument("--force", action="store_true")
+    subparsers.add_parser("verify", help="Validate records and checksums")
+
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "import-legacy":
+            for entry in import_legacy(args.assets_dir, args.fragments_dir):
+                print(f"✅ {entry.id}: {len(entry.files)} file(s)")
+        elif args.command == "patch":
+            entry = update_model(args.model_id, json.loads(args.patch), args.fragments_dir, args.assets_dir)
+            print(f"✅ Updated {entry.id}")
+        elif args.command == "refresh":
+            ids = args.model_ids or [p.stem for p in _fragment_paths(args.fragments_dir)]
+            cache = ChecksumCache()
+            for model_id in ids:
+                entry = load_entry(model_id, args.fragments_dir)
+                if entry is None:
+                    print(f"❌ {model_id}: no record")
+                    return False
+                before = dataclasses.asdict(entry)
+                if dataclasses.asdict(refresh_files(entry, args.assets_dir, cache)) != before:
+                    save_entry(entry, args.fragments_dir)
+                    print(f"✅ {model_id}: refreshed")
+                else:
+                    print(f"⏭️  {model_id}: unchanged")
+            cache.save()
+        elif args.command == "verify":
+            problems = verify(args.fragments_dir, args.assets_dir)
+            for problem in problems:
+                print(f"⚠️  {problem}")
+            print(f"{'✅' if not problems else '❌'} {len(problems)} problem(s)")
+            return not problems
+
+        if args.command != "verify":
+            force = getattr(args, "force", False)
+            if compile_manifest(args.fragments_dir, args.output, force):
+                print(f"📦 Wrote {args.output}")
+            else:
+                print(f"⏭️  {args.output} is up to date")
+    except ManifestError as e:
+        print(f"❌ Invalid manifest: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
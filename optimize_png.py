@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Lossless PNG optimization for Android resources
+
+Re-encodes PNGs with the smallest combination of:
+- color type: RGBA -> RGB / gray+alpha / gray when lossless, or an indexed
+  palette (1/2/4/8-bit, with tRNS) when there are at most 256 colors
+- row filters: each fixed PNG filter plus the per-row minimum-sum heuristic
+- zlib strategies: default, filtered and RLE at level 9
+
+Only critical chunks (plus tRNS) are written, so metadata is stripped. A
+file is replaced only if the result is smaller and decodes to exactly the
+same RGBA pixels.
+
+Usage:
+    python optimize_png.py                       # mipmap-* dirs and hazardhawk_*dpi_*.png
+    python optimize_png.py path/to/res other.png --workers 4
+
+Requires: pip install pillow numpy
+"""
+import argparse
+import glob
+import io
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError as e:
+    print(f"Missing required module: {e}")
+    print("Please install with: pip install pillow numpy")
+    sys.exit(1)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+DEFAULT_TARGETS = [
+    'HazardHawk/androidApp/src/main/res',
+    'hazardhawk_*dpi_*.png',
+]
+
+ZLIB_STRATEGIES = {
+    'default': zlib.Z_DEFAULT_STRATEGY,
+    'filtered': zlib.Z_FILTERED,
+    'rle': zlib.Z_RLE,
+}
+
+FILTER_NAMES = ['none', 'sub', 'up', 'average', 'paeth', 'adaptive']
+
+def _chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+def _pack_indices(indices, depth):
+    """Pack palette indices into scanlines of the given bit depth"""
+    if depth == 8:
+        return indices.astype(np.uint8)
+    per_byte = 8 // depth
+    height, width = indices.shape
+    pad = (-width) % per_byte
+    values = np.pad(indices.astype(np.uint8), ((0, 0), (0, pad)))
+    values = values.reshape(height, -1, per_byte)
+    shifts = (8 - depth * (np.arange(per_byte) + 1)).astype(np.uint8)
+    return np.bitwise_or.reduce(values << shifts, axis=2).astype(np.uint8)
+
+def color_candidates(rgba):
+    """
+    Lossless encodings of an RGBA pixel array.
+
+    Returns a list of dicts with color_type, bit_depth, scanlines (2-D uint8
+    array), bytes-per-pixel for filtering and optional PLTE/tRNS payloads.
+    """
+    height, width = rgba.shape[:2]
+    opaque = bool((rgba[..., 3] == 255).all())
+    gray = bool((rgba[..., 0] == rgba[..., 1]).all() and (rgba[..., 1] == rgba[..., 2]).all())
+
+    if gray and opaque:
+        color_type, pixels = 0, rgba[..., :1]
+    elif gray:
+        color_type, pixels = 4, rgba[..., [0, 3]]
+    elif opaque:
+        color_type, pixels = 2, rgba[..., :3]
+    else:
+        color_type, pixels = 6, rgba
+
+    channels = pixels.shape[2]
+    candidates = [{
+        'color_type': color_type,
+        'bit_depth': 8,
+        'scanlines': np.ascontiguousarray(pixels).reshape(height, width * channels),
+        'bpp': channels,
+        'plte': None,
+        'trns': None,
+    }]
+
+    flat = np.ascontiguousarray(rgba).reshape(-1, 4).view(np.uint32).ravel()
+    colors, inverse = np.unique(flat, return_inverse=True)
+    if len(colors) <= 256:
+        palette = colors.view(np.uint8).reshape(-1, 4)
+        # Translucent entries first so tRNS can be truncated after them
+        order = np.argsort(palette[:, 3] == 255, kind='stable')
+        remap = np.empty_like(order)
+        remap[order] = np.arange(len(order))
+        palette = palette[order]
+        indices = remap[inverse.ravel()].reshape(height, width)
+
+        count = len(palette)
+        depth = 1 if count <= 2 else 2 if count <= 4 else 4 if count <= 16 else 8
+        translucent = int((palette[:, 3] < 255).sum())
+        candidates.append({
+            'color_type': 3,
+            'bit_depth': depth,
+            'scanlines': _pack_indices(indices, depth),
+            'bpp': 1,
+            'plte': palette[:, :3].tobytes(),
+            'trns': palette[:translucent, 3].tobytes() if translucent else None,
+        })
+
+    return candidates
+
+def filter_scanlines(scanlines, bpp):
+    """
+    Apply all five PNG filters to every row at once.
+
+    Filters only depend on unfiltered neighbours, so they vectorize across
+    the whole image. Returns an array of shape (5, height, stride).
+    """
+    raw = scanlines.astype(np.int16)
+    left = np.zeros_like(raw)
+    left[:, bpp:] = raw[:, :-bpp]
+    up = np.zeros_like(raw)
+    up[1:] = raw[:-1]
+    upper_left = np.zeros_like(raw)
+    upper_left[1:, bpp:] = raw[:-1, :-bpp]
+
+    estimate = left + up - upper_left
+    dist_left = np.abs(estimate - left)
+    dist_up = np.abs(estimate - up)
+    dist_upper_left = np.abs(estimate - upper_left)
+    paeth = np.where(
+        (dist_left <= dist_up) & (dist_left <= dist_upper_left),
+        left,
+        np.where(dist_up <= dist_upper_left, up, upper_left),
+    )
+
+    filtered = np.stack([
+        raw,
+        raw - left,
+        raw - up,
+        raw - ((left + up) >> 1),
+        raw - paeth,
+    ])
+    return (filtered & 0xff).astype(np.uint8)
+
+def filtered_streams(scanlines, bpp):
+    """Yield (filter_name, raw IDAT payload) for each filter strategy"""
+    filtered = filter_scanlines(scanlines, bpp)
+    height = scanlines.shape[0]
+
+    for filter_type in range(5):
+        rows = np.empty((height, scanlines.shape[1] + 1), dtype=np.uint8)
+        rows[:, 0] = filter_type
+        rows[:, 1:] = filtered[filter_type]
+        yield FILTER_NAMES[filter_type], rows.tobytes()
+
+    # Minimum sum of absolute differences per row (libpng's heuristic)
+    cost = np.abs(filtered.view(np.int8).astype(np.int32)).sum(axis=2)
+    choice = cost.argmin(axis=0)
+    rows = np.empty((height, scanlines.shape[1] + 1), dtype=np.uint8)
+    rows[:, 0] = choice
+    rows[:, 1:] = filtered[choice, np.arange(height)]
+    yield 'adaptive', rows.tobytes()
+
+def encode_png(rgba):
+    """
+    Find the smallest lossless PNG encoding of an RGBA array.
+
+    Returns (png_bytes, description) for the winning combination.
+    """
+    height, width = rgba.shape[:2]
+    best = None
+
+    for candidate in color_candidates(rgba):
+        for filter_name, payload in filtered_streams(candidate['scanlines'], candidate['bpp']):
+            for strategy_name, strategy in ZLIB_STRATEGIES.items():
+                compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+                idat = compressor.compress(payload) + compressor.flush()
+                if best is None or len(idat) < len(best[0]):
+                    best = (idat, candidate, f"{filter_name}/{strategy_name}")
+
+    idat, candidate, combo = best
+    ihdr = struct.pack('>IIBBBBB', width, height, candidate['bit_depth'], candidate['color_type'], 0, 0, 0)
+    parts = [PNG_SIGNATURE, _chunk(b'IHDR', ihdr)]
+    if candidate['plte'] is not None:
+        parts.append(_chunk(b'PLTE', candidate['plte']))
+    if candidate['trns'] is not None:
+        parts.append(_chunk(b'tRNS', candidate['trns']))
+    parts.append(_chunk(b'IDAT', idat))
+    parts.append(_chunk(b'IEND', b''))
+
+    description = f"type {candidate['color_type']}/{candidate['bit_depth']}-bit, {combo}"
+    return b''.join(parts), description
+
+def load_rgba(path):
+    """Decode a PNG to an RGBA array, or None if it is not 8-bit (not losslessly handled)"""
+    with Image.open(path) as img:
+        if img.mode not in ('1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA'):
+            return None
+        return np.array(img.convert('RGBA'))
+
+def optimize_file(path):
+    """
+    Optimize one PNG in place if a smaller identical encoding exists.
+
+    Returns a dict with the original/optimized sizes for reporting.
+    """
+    path = Path(path)
+    original_size = path.stat().st_size
+    result = {'path': str(path), 'original_size': original_size, 'optimized_size': original_size}
+
+    try:
+        rgba = load_rgba(path)
+        if rgba is None:
+            result['note'] = 'skipped (not 8-bit)'
+            return result
+
+        png_bytes, description = encode_png(rgba)
+
+        # Never trust the encoder blindly: the output must decode to the same pixels
+        with Image.open(io.BytesIO(png_bytes)) as check:
+            if not np.array_equal(np.array(check.convert('RGBA')), rgba):
+                result['error'] = 'round-trip mismatch'
+                return result
+
+        if len(png_bytes) < original_size:
+            tmp_path = path.with_name(path.name + '.tmp')
+            tmp_path.write_bytes(png_bytes)
+            os.replace(tmp_path, path)
+            result['optimized_size'] = len(png_bytes)
+            result['note'] = description
+        else:
+            result['note'] = 'already optimal'
+    except Exception as e:
+        result['error'] = str(e) or repr(e)
+
+    return result
+
+def collect_pngs(targets):
+    """Expand res directories (mipmap-* only), files and globs into PNG paths"""
+    files = set()
+    for target in targets:
+        path = Path(target)
+        if path.is_dir():
+            mipmaps = [d for d in path.glob('mipmap-*') if d.is_dir()]
+            for directory in mipmaps or [path]:
+                files.update(directory.rglob('*.png'))
+        elif path.is_file():
+            files.add(path)
+        else:
+            files.update(Path(p) for p in glob.glob(target, recursive=True))
+    # Nine-patch PNGs carry layout data in their border and must not be touched
+    return sorted(f for f in files if f.suffix.lower() == '.png' and not f.name.endswith('.9.png'))
+
+def optimize_paths(paths, workers=None):
+    """Optimize PNGs in parallel, print per-file savings and return the results"""
+    if not paths:
+        print("⚠️ No PNG files found")
+        return []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(optimize_file, [str(p) for p in paths]))
+
+    total_before = 0
+    total_after = 0
+    for result in results:
+        before, after = result['original_size'], result['optimized_size']
+        total_before += before
+        total_after += after
+        if 'error' in result:
+            print(f"✗ {result['path']}: {result['error']}")
+        else:
+            saved = (before - after) / before * 100 if before else 0.0
+            print(f"✓ {result['path']}: {before:,} → {after:,} bytes (-{saved:.1f}%) [{result['note']}]")
+
+    if total_before:
+        print(f"\n📦 PNG total: {total_before:,} → {total_after:,} bytes "
+              f"(saved {total_before - total_after:,}, {(total_before - total_after) / total_before * 100:.1f}%)")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Losslessly optimize Android PNG resources")
+    parser.add_argument('targets', nargs='*', default=DEFAULT_TARGETS,
+                        help="res directories (mipmap-* are scanned), PNG files or globs")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    results = optimize_paths(collect_pngs(args.targets), args.workers)
+    return not any('error' in r for r in results)
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
@@ -3,67 +3,527 @@
 from PIL import Image
 import sys
 import os
+import glob
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
 
-def optimize_image(input_path, output_path=None, quality=80, max_width=1568, max_height=1176):
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff'}
+OPTIMIZED_SUFFIX = '_claude_optimized'
+
+# Rough per-worker overhead (interpreter, Pillow, numpy) for the memory ceiling
+WORKER_BASE_MB = 60
+
+def fit_size(size, max_width=1568, max_height=1176):
+    """
+    Size that fits within the bounds while maintaining aspect ratio
+    """
+    width, height = size
+    if width <= max_width and height <= max_height:
+        return width, height
+    ratio = min(max_width / width, max_height / height)
+    return int(width * ratio), int(height * ratio)
+
+def draft_size(img, max_width=1568, max_height=1176):
+    """
+    Size a JPEG decodes to when DCT-scaled to about 2x the target size
+    """
+    target_width, target_height = fit_size(img.size, max_width, max_height)
+    scale = 1
+    while (scale < 8
+           and img.width // (scale * 2) >= target_width * 2
+           and img.height // (scale * 2) >= target_height * 2):
+        scale *= 2
+    return -(-img.width // scale), -(-img.height // scale)
+
+def open_image(img, max_width=1568, max_height=1176, low_memory=False):
+    """
+    Decode an opened image, optionally in low-memory mode.
+
+    In low-memory mode JPEGs are decoded with draft mode (libjpeg DCT
+    scaling) to about 2x the target size, so the full resolution buffer is
+    never allocated. Other formats are still decoded at full resolution and
+    then box-reduced by an integer factor to about 2x the target; that
+    shrinks the buffers the resize and convert steps work on, but the full
+    decode briefly coexists with the reduced copy.
+    """
+    if not low_memory:
+        img.load()
+        return img
+
+    target_width, target_height = fit_size(img.size, max_width, max_height)
+    if img.format == 'JPEG' and (target_width, target_height) != img.size:
+        img.draft('RGB', (target_width * 2, target_height * 2))
+    img.load()
+
+    factor = min(img.width // (target_width * 2), img.height // (target_height * 2))
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+def flatten_alpha(img):
+    """
+    Flatten transparency onto white without allocating a background canvas.
+
+    White is pasted through the inverted alpha channel directly into the
+    image (c*a + 255*(1-a)), then the alpha band is dropped.
+    """
+    if img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    if img.mode in ('RGBA', 'LA'):
+        from PIL import ImageChops
+
+        color_mode = img.mode[:-1]
+        inverted_alpha = ImageChops.invert(img.getchannel('A'))
+        img.paste((255,) * len(color_mode), mask=inverted_alpha)
+        del inverted_alpha
+        img = img.convert(color_mode)
+    return img
+
+def prepare_image(img, max_width=1568, max_height=1176):
+    """
+    Resize an opened image to fit the bounds and flatten it to RGB
+    """
+    new_size = fit_size(img.size, max_width, max_height)
+    if new_size != img.size:
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+    # Convert to RGB if necessary
+    img = flatten_alpha(img)
+    if img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+
+    return img
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MB, or None if unavailable
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def estimate_decode_mb(input_path, max_width=1568, max_height=1176, low_memory=False):
+    """
+    Estimate the working memory needed to process one image from its header
+    """
+    with Image.open(input_path) as img:
+        if low_memory and img.format == 'JPEG':
+            width, height = draft_size(img, max_width, max_height)
+        else:
+            width, height = img.size
+        channels = len(img.getbands())
+    # Decoded buffer plus the transient reduce/resize/convert copies
+    return width * height * max(channels, 3) * 2 / (1024 * 1024)
+
+def optimize_image(input_path, output_path=None, quality=80, max_width=1568, max_height=1176,
+                   low_memory=False):
     """
     Optimize an image by resizing and compressing it
     """
     if output_path is None:
         name, ext = os.path.splitext(input_path)
-        output_path = f"{name}_claude_optimized{ext}"
-    
+        output_path = f"{name}{OPTIMIZED_SUFFIX}{ext}"
+
     try:
         with Image.open(input_path) as img:
             # Get original dimensions
             original_width, original_height = img.size
             original_size = os.path.getsize(input_path)
-            
+
             print(f"Original: {original_width}x{original_height}, {original_size/1024:.1f} KB")
-            
-            # Calculate new dimensions while maintaining aspect ratio
-            if original_width > max_width or original_height > max_height:
-                ratio = min(max_width / original_width, max_height / original_height)
-                new_width = int(original_width * ratio)
-                new_height = int(original_height * ratio)
-                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                print(f"Resized to: {new_width}x{new_height}")
-            
-            # Convert to RGB if necessary
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if 'A' in img.mode else None)
-                img = background
-            
+
+            img = open_image(img, max_width, max_height, low_memory)
+            img = prepare_image(img, max_width, max_height)
+            if img.size != (original_width, original_height):
+                print(f"Resized to: {img.size[0]}x{img.size[1]}")
+
             # Save with optimization
             img.save(output_path, 'JPEG', quality=quality, optimize=True)
-            
+
             # Show results
             optimized_size = os.path.getsize(output_path)
             compression_ratio = (original_size - optimized_size) / original_size * 100
-            
+
             print(f"Optimized: {optimized_size/1024:.1f} KB")
             print(f"Compression: {compression_ratio:.1f}% reduction")
             print(f"Saved as: {output_path}")
-            
+            peak = peak_rss_mb()
+            if peak is not None:
+                print(f"Peak RSS: {peak:.1f} MB")
+
             return output_path
-            
+
     except Exception as e:
         print(f"Error optimizing image: {e}")
         return None
 
+def encode_jpeg(img, quality):
+    """
+    Encode an RGB image as an optimized JPEG in memory
+    """
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def compute_ssim(reference, candidate, block=8):
+    """
+    Mean structural similarity of two same-sized images on the luma channel.
+
+    Statistics are computed over non-overlapping block x block windows with
+    numpy, which tracks the Gaussian-window SSIM closely enough to steer the
+    quality search at a fraction of the cost.
+    """
+    import numpy as np
+
+    a = np.asarray(reference.convert('L'), dtype=np.float64)
+    b = np.asarray(candidate.convert('L'), dtype=np.float64)
+
+    height = (a.shape[0] // block) * block
+    width = (a.shape[1] // block) * block
+    if height == 0 or width == 0:
+        return 1.0 if np.array_equal(a, b) else 0.0
+
+    shape = (height // block, block, width // block, block)
+    a = a[:height, :width].reshape(shape)
+    b = b[:height, :width].reshape(shape)
+
+    mu_a = a.mean(axis=(1, 3), keepdims=True)
+    mu_b = b.mean(axis=(1, 3), keepdims=True)
+    var_a = ((a - mu_a) ** 2).mean(axis=(1, 3))
+    var_b = ((b - mu_b) ** 2).mean(axis=(1, 3))
+    covariance = ((a - mu_a) * (b - mu_b)).mean(axis=(1, 3))
+    mu_a = mu_a[:, 0, :, 0]
+    mu_b = mu_b[:, 0, :, 0]
+
+    c1 = (0.01 * 255) ** 2
+    c2 = (0.03 * 255) ** 2
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * covariance + c2)) / (
+        (mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2)
+    )
+    return float(ssim_map.mean())
+
+def search_quality(img, target_ssim=None, max_bytes=None, min_quality=30, max_quality=95):
+    """
+    Binary-search the JPEG quality for an image.
+
+    With target_ssim, finds the lowest quality whose SSIM reaches the target.
+    With max_bytes, finds the highest quality that fits the byte budget. When
+    both are given the byte budget wins.
+
+    Returns:
+        (quality, encoded_bytes, ssim) for the chosen setting
+    """
+    cache = {}
+
+    def encode(quality):
+        if quality not in cache:
+            data = encode_jpeg(img, quality)
+            score = None
+            if target_ssim is not None:
+                with Image.open(io.BytesIO(data)) as decoded:
+                    score = compute_ssim(img, decoded)
+            cache[quality] = (data, score)
+        return cache[quality]
+
+    quality = max_quality
+
+    if target_ssim is not None:
+        low, high = min_quality, max_quality
+        while low < high:
+            mid = (low + high) // 2
+            if encode(mid)[1] >= target_ssim:
+                high = mid
+            else:
+                low = mid + 1
+        quality = low
+
+    if max_bytes is not None and len(encode(quality)[0]) > max_bytes:
+        low, high = min_quality, quality
+        while low < high:
+            mid = (low + high + 1) // 2
+            if len(encode(mid)[0]) <= max_bytes:
+                low = mid
+            else:
+                high = mid - 1
+        quality = low
+
+    data, score = encode(quality)
+    return quality, data, score
+
+def collect_inputs(patterns):
+    """
+    Expand directories and glob patterns into a sorted list of image files
+    """
+    files = set()
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = path.rglob('*')
+        elif path.is_file():
+            candidates = [path]
+        else:
+            candidates = (Path(p) for p in glob.glob(pattern, recursive=True))
+
+        for candidate in candidates:
+            if (candidate.is_file()
+                    and candidate.suffix.lower() in IMAGE_EXTENSIONS
+                    and OPTIMIZED_SUFFIX not in candidate.stem):
+                files.add(candidate)
+
+    return sorted(files)
+
+def batch_output_path(input_path, output_dir=None, keep_extension=False):
+    """
+    Output JPEG path for an input file in batch mode.
+
+    keep_extension puts the source extension in the name (a_png_...jpg) to
+    tell apart inputs that share a stem, such as a.png and a.jpg.
+    """
+    input_path = Path(input_path)
+    stem = f"{input_path.stem}_{input_path.suffix.lstrip('.').lower()}" if keep_extension else input_path.stem
+    name = f"{stem}{OPTIMIZED_SUFFIX}.jpg"
+    if output_dir is None:
+        return input_path.with_name(name)
+    return Path(output_dir) / name
+
+def batch_output_paths(files, output_dir=None):
+    """
+    Output paths for all batch inputs, without collisions.
+
+    Inputs sharing a stem get their extension in the name. Inputs that
+    would still write the same file (same name in different directories
+    with --output-dir) map to None.
+    """
+    from collections import Counter
+
+    plain = {f: batch_output_path(f, output_dir) for f in files}
+    plain_counts = Counter(plain.values())
+    paths = {f: batch_output_path(f, output_dir, keep_extension=plain_counts[path] > 1)
+             for f, path in plain.items()}
+    counts = Counter(paths.values())
+    return {f: path if counts[path] == 1 else None for f, path in paths.items()}
+
+def _save_extra_format(img, jpeg_path, fmt, quality):
+    """
+    Save a WebP/AVIF sibling of the JPEG output, returning its size or None
+    """
+    if fmt == 'avif':
+        try:
+            import pillow_avif  # noqa: F401  (registers AVIF on Pillow < 11.3)
+        except ImportError:
+            pass
+
+    output_path = Path(jpeg_path).with_suffix(f'.{fmt}')
+    try:
+        img.save(output_path, fmt.upper(), quality=quality)
+    except (KeyError, OSError, ValueError) as e:
+        print(f"⚠️  {fmt.upper()} not written for {jpeg_path}: {e}")
+        return None
+    return os.path.getsize(output_path)
+
+def _optimize_batch_item(job):
+    """
+    Process-pool worker: optimize one file and return its statistics
+    """
+    input_path, output_path, options = job
+    input_path = Path(input_path)
+    output_path = Path(output_path)
+    original_size = input_path.stat().st_size
+
+    if (not options['force'] and output_path.exists()
+            and output_path.stat().st_mtime >= input_path.stat().st_mtime):
+        return {'input': str(input_path), 'skipped': True, 'original_size': original_size}
+
+    try:
+        with Image.open(input_path) as img:
+            img = open_image(img, options['max_width'], options['max_height'], options['low_memory'])
+            img = prepare_image(img, options['max_width'], options['max_height'])
+
+        if options['target_ssim'] is None and options['max_bytes'] is None:
+            quality = options['quality']
+            data = encode_jpeg(img, quality)
+            score = None
+        else:
+            quality, data, score = search_quality(
+                img, options['target_ssim'], options['max_bytes'],
+                options['min_quality'], options['max_quality']
+            )
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_bytes(data)
+
+        extra_sizes = {}
+        for fmt in options['formats']:
+            size = _save_extra_format(img, output_path, fmt, quality)
+            if size is not None:
+                extra_sizes[fmt] = size
+
+        return {
+            'input': str(input_path),
+            'output': str(output_path),
+            'skipped': False,
+            'original_size': original_size,
+            'optimized_size': len(data),
+            'quality': quality,
+            'ssim': score,
+            'extra_sizes': extra_sizes,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+    except Exception as e:
+        return {'input': str(input_path), 'skipped': False, 'error': str(e) or repr(e), 'original_size': original_size}
+
+def optimize_batch(patterns, output_dir=None, quality=80, target_ssim=None, max_bytes=None,
+                   formats=(), workers=None, force=False, max_width=1568, max_height=1176,
+                   min_quality=30, max_quality=95, low_memory=False, memory_ceiling_mb=None):
+    """
+    Optimize every image matched by the patterns in a process pool.
+
+    Files whose output is newer than the input are skipped unless force is
+    set. With memory_ceiling_mb, low-memory decoding is enabled and the
+    worker count is capped so that the largest expected image per worker
+    fits under the ceiling. Returns the list of per-file results.
+    """
+    files = collect_inputs(patterns)
+    if not files:
+        print("⚠️ No images matched")
+        return []
+
+    options = {
+        'quality': quality,
+        'target_ssim': target_ssim,
+        'max_bytes': max_bytes,
+        'formats': tuple(formats),
+        'force': force,
+        'max_width': max_width,
+        'max_height': max_height,
+        'min_quality': min_quality,
+        'max_quality': max_quality,
+        'low_memory': low_memory or memory_ceiling_mb is not None,
+    }
+    outputs = batch_output_paths(files, output_dir)
+    conflicts = [f for f in files if outputs[f] is None]
+    for f in conflicts:
+        print(f"⚠️  {f}: another input would write the same output; not processed")
+    files = [f for f in files if outputs[f] is not None]
+    jobs = [(str(f), str(outputs[f]), options) for f in files]
+
+    if memory_ceiling_mb is not None:
+        largest_mb = max(
+            (estimate_decode_mb(f, max_width, max_height, options['low_memory']) for f in files), default=0
+        )
+        per_worker_mb = WORKER_BASE_MB + largest_mb
+        allowed = max(1, int(memory_ceiling_mb // per_worker_mb))
+        workers = min(workers or os.cpu_count() or 1, allowed)
+        print(f"🧮 Memory ceiling {memory_ceiling_mb:.0f} MB: ~{per_worker_mb:.0f} MB per worker, "
+              f"using {workers} workers")
+
+    print(f"🖼️  Optimizing {len(jobs)} images with {workers or os.cpu_count()} workers")
+    start = time.perf_counter()
+    results = [{'input': str(f), 'skipped': False, 'error': 'output name collides with another input',
+                'original_size': f.stat().st_size} for f in conflicts]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_optimize_batch_item, job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if 'error' in result:
+                print(f"✗ {result['input']}: {result['error']}")
+            elif not result['skipped']:
+                ssim_text = f", SSIM {result['ssim']:.4f}" if result['ssim'] is not None else ""
+                print(f"✓ {result['input']}: {result['original_size']/1024:.1f} KB → "
+                      f"{result['optimized_size']/1024:.1f} KB (q={result['quality']}{ssim_text})")
+
+    elapsed = time.perf_counter() - start
+    print_batch_report(results, elapsed)
+    return results
+
+def print_batch_report(results, elapsed):
+    """
+    Print aggregate bytes saved and throughput for a batch run
+    """
+    processed = [r for r in results if not r['skipped'] and 'error' not in r]
+    skipped = sum(1 for r in results if r['skipped'])
+    failed = sum(1 for r in results if 'error' in r)
+
+    original_total = sum(r['original_size'] for r in processed)
+    optimized_total = sum(r['optimized_size'] for r in processed)
+    saved = original_total - optimized_total
+
+    print("\n📊 Batch report")
+    print(f"  Processed: {len(processed)}  Skipped (up to date): {skipped}  Failed: {failed}")
+    print(f"  Original: {original_total/1024/1024:.2f} MB → Optimized: {optimized_total/1024/1024:.2f} MB")
+    if original_total:
+        print(f"  Saved: {saved/1024/1024:.2f} MB ({saved / original_total * 100:.1f}%)")
+    for fmt in sorted({fmt for r in processed for fmt in r['extra_sizes']}):
+        fmt_total = sum(r['extra_sizes'][fmt] for r in processed if fmt in r['extra_sizes'])
+        print(f"  {fmt.upper()} total: {fmt_total/1024/1024:.2f} MB")
+    peaks = [r['peak_rss_mb'] for r in processed if r.get('peak_rss_mb') is not None]
+    if peaks:
+        print(f"  Peak worker RSS: {max(peaks):.1f} MB")
+    if elapsed > 0:
+        print(f"  Throughput: {len(processed) / elapsed:.1f} files/sec ({elapsed:.1f}s)")
+
+def main_batch(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="optimize_screenshot.py batch",
+        description="Optimize directories or globs of images in parallel"
+    )
+    parser.add_argument("inputs", nargs='+', help="Image files, directories or glob patterns")
+    parser.add_argument("--output-dir", help="Write outputs here instead of next to the inputs")
+    parser.add_argument("--quality", type=int, default=80, help="Fixed JPEG quality when no target is set")
+    parser.add_argument("--target-ssim", type=float, help="Lowest quality reaching this SSIM (e.g. 0.95)")
+    parser.add_argument("--max-bytes", type=int, help="Per-image byte budget for the JPEG")
+    parser.add_argument("--min-quality", type=int, default=30, help="Lower bound of the quality search")
+    parser.add_argument("--max-quality", type=int, default=95, help="Upper bound of the quality search")
+    parser.add_argument("--formats", nargs='*', default=[], choices=['webp', 'avif'],
+                        help="Also write these formats next to each JPEG")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action='store_true', help="Reprocess files whose output is newer")
+    parser.add_argument("--max-width", type=int, default=1568)
+    parser.add_argument("--max-height", type=int, default=1176)
+    parser.add_argument("--low-memory", action='store_true',
+                        help="Draft-decode JPEGs to ~2x the target before resizing")
+    parser.add_argument("--memory-ceiling-mb", type=float,
+                        help="Cap workers so the batch stays under this memory (implies --low-memory)")
+    args = parser.parse_args(argv)
+
+    results = optimize_batch(
+        args.inputs, args.output_dir, args.quality, args.target_ssim, args.max_bytes,
+        args.formats, args.workers, args.force, args.max_width, args.max_height,
+        args.min_quality, args.max_quality, args.low_memory, args.memory_ceiling_mb
+    )
+    if any('error' in r for r in results):
+        sys.exit(1)
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        main_batch(sys.argv[2:])
+        sys.exit(0)
+
+    low_memory = '--low-memory' in sys.argv
+    if low_memory:
+        sys.argv.remove('--low-memory')
+
     if len(sys.argv) < 2:
-        print("Usage: python optimize_screenshot.py <image_path> [output_path] [quality]")
+        print("Usage: python optimize_screenshot.py <image_path> [output_path] [quality] [--low-memory]")
+        print("       python optimize_screenshot.py batch <dirs|globs...> [--target-ssim 0.95] [--max-bytes N]")
         sys.exit(1)
-    
+
     input_path = sys.argv[1]
     output_path = sys.argv[2] if len(sys.argv) > 2 else None
     quality = int(sys.argv[3]) if len(sys.argv) > 3 else 80
-    
+
     if not os.path.exists(input_path):
         print(f"Error: File {input_path} not found")
         sys.exit(1)
-    
-    optimize_image(input_path, output_path, quality)
\ No newline at end of file
+
+    optimize_image(input_path, output_path, quality, low_memory=low_memory)
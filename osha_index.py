@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Searchable index over the OSHA Title 29 tree in title-29.json
+
+title-29.json is a deeply nested Title -> Subtitle -> Chapter -> Part ->
+Subpart -> Section tree. Resolving a citation such as "1926.501" against it
+means loading and walking the whole file. This builds a compact SQLite
+index once and answers lookups from it:
+
+- nodes: one row per tree node, numbered in pre-order. `parent` and `end`
+  (the last descendant's number) are hierarchy offsets, so ancestors are a
+  short parent walk and a subtree is the range id+1..end.
+- postings: an inverted index of terms from labels and descriptions.
+
+The source is read with ijson's streaming parser when it is installed and
+falls back to json otherwise. The index remembers the source's size and
+mtime and is rebuilt automatically when the JSON changes.
+
+Usage:
+    python osha_index.py build
+    python osha_index.py lookup 1926.501 "1926 Subpart M" "29 CFR 1926.95(a)"
+    python osha_index.py search fall protection
+    python osha_index.py bench
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_SOURCE = Path("title-29.json")
+DEFAULT_INDEX = Path("models/cache/osha/title-29.sqlite")
+
+# Bump when the schema or tokenization changes so old indexes get rebuilt
+SCHEMA_VERSION = 1
+
+NODE_FIELDS = ("identifier", "type", "label", "label_level", "label_description", "reserved", "size")
+
+SCALAR_EVENTS = ("string", "number", "boolean", "null", "scalar")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+
+STOPWORDS = frozenset(
+    "a an and as at by for from in into of on or other than the their to under with".split()
+)
+
+CITATION_PATTERNS = [
+    ("section", re.compile(r"^(\d+\.\d+[a-z0-9-]*)(?:\(.*)?$", re.I)),
+    ("subpart", re.compile(r"^(?:part\s*)?(\d+)\s*,?\s*subpart\s+([a-z]+)$", re.I)),
+    ("part", re.compile(r"^(?:part\s*)?(\d+)$", re.I)),
+]
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    end INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    identifier TEXT,
+    part TEXT,
+    label TEXT,
+    description TEXT,
+    reserved INTEGER NOT NULL,
+    size INTEGER
+);
+CREATE TABLE postings (term TEXT NOT NULL, node INTEGER NOT NULL, PRIMARY KEY (term, node)) WITHOUT ROWID;
+"""
+
+INDEXES = """
+CREATE INDEX nodes_identifier ON nodes (identifier, type, part);
+CREATE INDEX nodes_parent ON nodes (parent);
+"""
+
+def tokenize(text):
+    """Lower-case terms; dotted numbers such as 1926.501 stay one term"""
+    return [t for t in TOKEN_PATTERN.findall((text or "").lower()) if t not in STOPWORDS]
+
+def _tree_events(value, prefix=""):
+    """ijson-style (prefix, event, value) events for an already parsed tree"""
+    if isinstance(value, dict):
+        yield prefix, "start_map", None
+        for key, item in value.items():
+            yield from _tree_events(item, f"{prefix}.{key}" if prefix else key)
+        yield prefix, "end_map", None
+    elif isinstance(value, list):
+        yield prefix, "start_array", None
+        for item in value:
+            yield from _tree_events(item, f"{prefix}.item" if prefix else "item")
+        yield prefix, "end_array", None
+    else:
+        yield prefix, "scalar", value
+
+def _events(f):
+    try:
+        import ijson
+    except ImportError:
+        return _tree_events(json.load(f))
+    return ijson.parse(f)
+
+def iter_nodes(source):
+    """
+    Stream the tree and yield one record per node in post-order.
+
+    Each record is (id, parent, depth, end, part, fields) where id is the
+    node's pre-order number, end its last descendant's number and part the
+    identifier of the enclosing Part (if any).
+    """
+    stack = []  # [id, prefix, fields] for the node and its ancestors
+    next_id = 0
+
+    with open(source, "rb") as f:
+        for prefix, event, value in _events(f):
+            is_node = prefix == "" or prefix.endswith("children.item")
+            if event == "start_map" and is_node:
+                stack.append([next_id, prefix, {}])
+                next_id += 1
+            elif event == "end_map" and is_node:
+                node_id, _, fields = stack.pop()
+                part = next(
+                    (a[2].get("identifier") for a in reversed(stack + [[node_id, prefix, fields]])
+                     if a[2].get("type") == "part"),
+                    None,
+                )
+                parent = stack[-1][0] if stack else None
+                yield node_id, parent, len(stack), next_id - 1, part, fields
+            elif event in SCALAR_EVENTS and stack:
+                node_prefix, _, key = prefix.rpartition(".")
+                if node_prefix == stack[-1][1] and key in NODE_FIELDS:
+                    stack[-1][2][key] = value
+
+def _source_stamp(source):
+    stat = os.stat(source)
+    return f"{SCHEMA_VERSION}:{stat.st_size}:{int(stat.st_mtime)}"
+
+def build_index(source=DEFAULT_SOURCE, index_path=DEFAULT_INDEX):
+    """
+    Build the SQLite index from title-29.json.
+
+    The index is written to a temporary file and moved into place, so
+    readers never see a half-built index. Returns build statistics.
+    """
+    start = time.perf_counter()
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    conn.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + SCHEMA)
+
+    rows = []
+    postings = set()
+    for node_id, parent, depth, end, part, fields in iter_nodes(source):
+        description = fields.get("label_description")
+        rows.append((
+            node_id, parent, end, depth, fields.get("type"), fields.get("identifier"), part,
+            (fields.get("label") or "").strip(), description,
+            int(bool(fields.get("reserved"))), int(fields["size"]) if fields.get("size") is not None else None,
+        ))
+        terms = tokenize(fields.get("label")) + tokenize(description)
+        if fields.get("identifier"):
+            terms.append(str(fields["identifier"]).lower())
+        postings.update((term, node_id) for term in terms)
+
+    conn.executemany("INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.executemany("INSERT INTO postings VALUES (?, ?)", sorted(postings))
+    conn.executescript(INDEXES)
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ("source", str(source)),
+        ("stamp", _source_stamp(source)),
+        ("built_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+    ])
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    os.replace(tmp_path, index_path)
+
+    return {
+        "nodes": len(rows),
+        "postings": len(postings),
+        "bytes": index_path.stat().st_size,
+        "seconds": time.perf_counter() - start,
+    }
+
+def parse_citation(citation):
+    """
+    Normalize a citation to (type, identifier, part).
+
+    Accepts forms like "1926.501", "§ 1926.501(b)(1)", "29 CFR 1926.501",
+    "1926", "Part 1926" and "1926 Subpart M". Returns None if unrecognized.
+    """
+    text = re.sub(r"^\s*(?:29\s*c\.?f\.?r\.?)?\s*(?:§+)?\s*", "", citation, flags=re.I).strip()
+    for kind, pattern in CITATION_PATTERNS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        if kind == "section":
+            return "section", match.group(1), None
+        if kind == "subpart":
+            return "subpart", match.group(2).upper(), match.group(1)
+        return "part", match.group(1), match.group(1)
+    return None
+
+class OshaIndex:
+    """Read-only access to a built index"""
+
+    COLUMNS = "id, parent, end, depth, type, identifier, part, label, description, reserved, size"
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        self.index_path = Path(index_path)
+        self.conn = sqlite3.connect(f"file:{self.index_path}?mode=ro", uri=True, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def get(self, node_id):
+        row = self.conn.execute(f"SELECT {self.COLUMNS} FROM nodes WHERE id = ?", (node_id,)).fetchone()
+        return dict(row) if row else None
+
+    def lookup(self, citation):
+        """Resolve a citation to its node dict, or None"""
+        parsed = parse_citation(citation)
+        if parsed is None:
+            return None
+        kind, identifier, part = parsed
+        if kind == "section":
+            row = self.conn.execute(
+                f"SELECT {self.COLUMNS} FROM nodes WHERE identifier = ? AND type = 'section'", (identifier,)
+            ).fetchone()
+        else:
+            row = self.conn.execute(
+                f"SELECT {self.COLUMNS} FROM nodes WHERE identifier = ? AND type = ? AND part = ?",
+                (identifier, kind, part),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def ancestors(self, node_id):
+        """Ancestors of a node from the root down (excluding the node itself)"""
+        rows = self.conn.execute(f"""
+            WITH RECURSIVE chain(id) AS (
+                SELECT parent FROM nodes WHERE id = ?
+                UNION ALL
+                SELECT nodes.parent FROM nodes JOIN chain ON nodes.id = chain.id
+                WHERE nodes.parent IS NOT NULL
+            )
+            SELECT {self.COLUMNS} FROM nodes WHERE id IN (SELECT id FROM chain) ORDER BY id
+        """, (node_id,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def children(self, node_id):
+        rows = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM nodes WHERE parent = ? ORDER BY id", (node_id,)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def descendants(self, node_id, types=None):
+        """Every node in the subtree (pre-order), optionally filtered by type"""
+        node = self.get(node_id)
+        if node is None:
+            return []
+        rows = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM nodes WHERE id > ? AND id <= ? ORDER BY id", (node_id, node["end"])
+        ).fetchall()
+        return [dict(r) for r in rows if types is None or r["type"] in types]
+
+    def search(self, query, limit=20, types=None):
+        """
+        Keyword search over labels and descriptions.
+
+        Every query term must match (as a prefix, so "scaffold" also finds
+        "scaffolds"). Results come back in document order.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        selects = " INTERSECT ".join(
+            "SELECT node FROM postings WHERE term >= ? AND term < ?" for _ in terms
+        )
+        params = [bound for term in terms for bound in (term, term + "\uffff")]
+        type_filter = ""
+        if types:
+            type_filter = f" AND type IN ({', '.join('?' for _ in types)})"
+            params.extend(types)
+        rows = self.conn.execute(
+            f"SELECT {self.COLUMNS} FROM nodes WHERE id IN ({selects}){type_filter} ORDER BY id LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+def open_index(source=DEFAULT_SOURCE, index_path=DEFAULT_INDEX, rebuild=False):
+    """Open the index, (re)building it first if it is missing or older than the source"""
+    index_path = Path(index_path)
+    if not rebuild and index_path.exists():
+        index = OshaIndex(index_path)
+        if not Path(source).exists() or index.meta("stamp") == _source_stamp(source):
+            return index
+        index.close()
+    build_index(source, index_path)
+    return OshaIndex(index_path)
+
+def format_node(node, index=None):
+    path = ""
+    if index is not None:
+        path = " > ".join(a["label"] for a in index.ancestors(node["id"]) if a["type"] in ("part", "subpart"))
+        path = f"  [{path}]" if path else ""
+    return f"{node['label']}{path}"
+
+def _time_us(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def benchmark(source=DEFAULT_SOURCE, index_path=DEFAULT_INDEX, repeat=1000):
+    """Compare index lookups and searches against loading and walking the raw JSON"""
+    citations = ["1926.501", "1926.95", "1926.1412", "1926 Subpart M", "1910.134"]
+
+    def walk_json():
+        with open(source, "r") as f:
+            pending = [json.load(f)]
+        while pending:
+            node = pending.pop()
+            if node.get("identifier") == "1926.501":
+                return node
+            pending.extend(node.get("children") or [])
+
+    json_ms = _time_us(walk_json, 3) / 1000
+    with open_index(source, index_path) as index:
+        lookup_us = _time_us(lambda: [index.lookup(c) for c in citations], repeat) / len(citations)
+        ancestors_us = _time_us(lambda: index.ancestors(index.lookup("1926.501")["id"]), repeat)
+        search_ms = _time_us(lambda: index.search("fall protection"), repeat // 10) / 1000
+
+    print(f"📄 Raw JSON load + walk for one citation: {json_ms:.1f} ms")
+    print(f"⚡ Index lookup:            {lookup_us:.1f} µs per citation")
+    print(f"⚡ Lookup + ancestor chain: {ancestors_us:.1f} µs")
+    print(f"🔍 Keyword search:          {search_ms:.2f} ms ('fall protection')")
+    return {"json_ms": json_ms, "lookup_us": lookup_us, "ancestors_us": ancestors_us, "search_ms": search_ms}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and query the OSHA Title 29 tree")
+    parser.add_argument("--source", default=str(DEFAULT_SOURCE), help="title-29.json path")
+    parser.add_argument("--index", default=str(DEFAULT_INDEX), help="SQLite index path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("build", help="(Re)build the index")
+    lookup = subparsers.add_parser("lookup", help="Resolve citations such as 1926.501")
+    lookup.add_argument("citations", nargs="+")
+    search = subparsers.add_parser("search", help="Keyword search over labels")
+    search.add_argument("terms", nargs="+")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--sections-only", action="store_true")
+    subparsers.add_parser("bench", help="Time lookups against parsing the raw JSON")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        stats = build_index(args.source, args.index)
+        print(f"✅ Indexed {stats['nodes']:,} nodes, {stats['postings']:,} postings "
+              f"→ {args.index} ({stats['bytes'] / 1024:.0f} KB) in {stats['seconds']:.2f}s")
+        return True
+
+    if args.command == "bench":
+        benchmark(args.source, args.index)
+        return True
+
+    with open_index(args.source, args.index) as index:
+        if args.command == "lookup":
+            found = True
+            for citation in args.citations:
+                node = index.lookup(citation)
+                if node is None:
+                    print(f"❌ {citation}: not found")
+                    found = False
+                else:
+                    print(f"✅ {citation}: {format_node(node, index)}")
+            return found
+
+        results = index.search(" ".join(args.terms), args.limit, ["section"] if args.sections_only else None)
+        for node in results:
+            print(f"  {format_node(node, index)}")
+        print(f"🔍 {len(results)} result(s)")
+        return bool(results)
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -91,11 +91,19 @@ def main():
     parser.add_argument("--model", default="google/gemma-2b-it", help="Model to convert")
     parser.add_argument("--output-dir", default="./models/gemma_lightweight_onnx", help="Output directory")
     parser.add_argument("--cache-dir", default="./model_cache", help="Cache directory")
+    parser.add_argument("--dedupe-weights", action="store_true",
+                        help="Share tied embedding/LM-head weights in the exported model.onnx")
     
     args = parser.parse_args()
     
     success = convert_lightweight_model(args.model, args.output_dir, args.cache_dir)
     
+    if success and args.dedupe_weights:
+        from onnx_weight_dedup import dedupe_weights
+        
+        stats = dedupe_weights(str(Path(args.output_dir) / "model.onnx"), remove_stale_data=True)
+        logger.info(f"🔗 Deduplicated weights: saved {stats['bytes_saved'] / (1024 * 1024):.1f} MB")
+    
     if success:
         logger.info("🎉 Lightweight conversion completed!")
         print(f"Model saved to: {args.output_dir}")
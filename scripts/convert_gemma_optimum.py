@@ -134,6 +134,11 @@ def main():
         default="./model_cache",
         help="Model cache directory"
     )
+    parser.add_argument(
+        "--dedupe-weights",
+        action="store_true",
+        help="Share tied embedding/LM-head weights in the exported model.onnx"
+    )
     
     args = parser.parse_args()
     
@@ -144,6 +149,12 @@ def main():
         # Convert the model
         success = converter.convert_and_save(args.output_dir)
         
+        if success and args.dedupe_weights:
+            from onnx_weight_dedup import dedupe_weights
+            
+            stats = dedupe_weights(str(Path(args.output_dir) / "model.onnx"), remove_stale_data=True)
+            logger.info(f"🔗 Deduplicated weights: saved {stats['bytes_saved'] / (1024 * 1024):.1f} MB")
+        
         if success:
             # Print model information
             output_path = Path(args.output_dir)
@@ -14,18 +14,12 @@ import logging
 import os
 import sys
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import TYPE_CHECKING, Optional, Tuple
 
-import torch
-from transformers import (
-    AutoTokenizer, 
-    AutoModelForCausalLM, 
-    AutoConfig,
-    GemmaForCausalLM
-)
-import onnx
-import onnxruntime as ort
-from onnxruntime.tools import convert_onnx_models_to_ort
+# torch, transformers, onnx and onnxruntime are imported inside the methods
+# that need them; importing this module must stay cheap for model_tools.py.
+if TYPE_CHECKING:
+    import torch
 
 # Configure logging
 logging.basicConfig(
@@ -52,12 +46,16 @@ class GemmaToONNXConverter:
         self.tokenizer = None
         self.model = None
         self.config = None
+        self.token_map = None  # original id -> pruned id, set by prune_vocabulary()
         
     def load_model(self) -> None:
         """Load the Gemma model and tokenizer."""
         logger.info(f"Loading model: {self.model_name}")
         
         try:
+            import torch
+            from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
             # Load tokenizer
             self.tokenizer = AutoTokenizer.from_pretrained(
                 self.model_name,
@@ -93,6 +91,66 @@ class GemmaToONNXConverter:
             logger.error(f"Failed to load model: {str(e)}")
             raise
     
+    def truncate_layers(self, num_layers: int) -> None:
+        """
+        Keep only the first decoder layers, producing a draft model for
+        speculative decoding that shares the tokenizer and embeddings.
+        
+        Args:
+            num_layers: Decoder layers to keep
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        
+        layers = self.model.model.layers
+        if not 0 < num_layers < len(layers):
+            raise ValueError(f"Draft must keep between 1 and {len(layers) - 1} of {len(layers)} layers")
+        self.model.model.layers = layers[:num_layers]
+        self.model.config.num_hidden_layers = num_layers
+        logger.info(f"Truncated decoder to {num_layers} of {len(layers)} layers for drafting")
+    
+    def prune_vocabulary(self, vocab_map_path: str) -> None:
+        """
+        Slice the embedding (and the tied LM head) to a pruned vocabulary.
+        
+        Args:
+            vocab_map_path: vocab_map.json written by vocab_pruning.py; the
+                matching tokenizer.json must be shipped with the export
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        
+        import json
+        import torch
+        
+        with open(vocab_map_path, "r") as f:
+            kept_ids = torch.tensor(json.load(f)["kept_ids"], dtype=torch.long)
+        
+        embeddings = self.model.get_input_embeddings()
+        pruned = torch.nn.Embedding(len(kept_ids), embeddings.embedding_dim, padding_idx=None)
+        pruned.weight.data = embeddings.weight.data[kept_ids].clone()
+        self.model.set_input_embeddings(pruned)
+        
+        head = self.model.get_output_embeddings()
+        if head is not None and head.weight.data_ptr() != embeddings.weight.data_ptr():
+            # Untied head: slice its rows (and bias) separately
+            head.weight = torch.nn.Parameter(head.weight.data[kept_ids].clone())
+            if head.bias is not None:
+                head.bias = torch.nn.Parameter(head.bias.data[kept_ids].clone())
+            head.out_features = len(kept_ids)
+        else:
+            self.model.tie_weights()
+        
+        old_to_new = {int(old): new for new, old in enumerate(kept_ids)}
+        self.token_map = torch.full((embeddings.num_embeddings,), -1, dtype=torch.long)
+        self.token_map[kept_ids] = torch.arange(len(kept_ids))
+        self.model.config.vocab_size = len(kept_ids)
+        for name in ("pad_token_id", "bos_token_id", "eos_token_id"):
+            token_id = getattr(self.model.config, name, None)
+            if isinstance(token_id, int):
+                setattr(self.model.config, name, old_to_new[token_id])
+        logger.info(f"Pruned vocabulary to {len(kept_ids)} tokens")
+    
     def create_construction_safety_prompt(self) -> str:
         """Create a construction safety analysis prompt for model preparation."""
         return """
@@ -106,7 +164,7 @@ class GemmaToONNXConverter:
         Respond with JSON containing detected hazards, PPE compliance status, and safety recommendations.
         """
     
-    def prepare_sample_inputs(self) -> Tuple[torch.Tensor, torch.Tensor]:
+    def prepare_sample_inputs(self) -> Tuple["torch.Tensor", "torch.Tensor"]:
         """
         Prepare sample inputs for ONNX conversion.
         
@@ -127,7 +185,13 @@ class GemmaToONNXConverter:
             max_length=512  # Reasonable length for construction safety prompts
         )
         
-        return inputs["input_ids"], inputs["attention_mask"]
+        input_ids = inputs["input_ids"]
+        if self.token_map is not None:
+            input_ids = self.token_map[input_ids]
+            if (input_ids < 0).any():
+                raise ValueError("Sample prompt uses tokens outside the pruned vocabulary")
+        
+        return input_ids, inputs["attention_mask"]
     
     def convert_to_onnx(
         self, 
@@ -149,6 +213,8 @@ class GemmaToONNXConverter:
             raise ValueError("Model not loaded. Call load_model() first.")
         
         try:
+            import torch
+
             # Prepare sample inputs
             input_ids, attention_mask = self.prepare_sample_inputs()
             
@@ -197,6 +263,8 @@ class GemmaToONNXConverter:
         logger.info("Optimizing ONNX model for mobile deployment")
         
         try:
+            import onnx
+
             # Load the ONNX model
             onnx_model = onnx.load(model_path)
             
@@ -229,6 +297,9 @@ class GemmaToONNXConverter:
         logger.info(f"Validating ONNX model: {onnx_path}")
         
         try:
+            import onnx
+            import onnxruntime as ort
+
             # Load and check ONNX model
             onnx_model = onnx.load(onnx_path)
             onnx.checker.check_model(onnx_model)
@@ -254,47 +325,40 @@ class GemmaToONNXConverter:
             logger.error(f"ONNX model validation failed: {str(e)}")
             return False
     
-    def convert_to_ort_format(self, onnx_path: str, output_dir: str) -> str:
+    def convert_to_ort_format(self, onnx_path: str, output_dir: str, target_platform: str = "arm") -> dict:
         """
         Convert ONNX model to ORT format for optimized mobile deployment.
         
+        Produces both optimization styles: Fixed (fully optimized, for the CPU
+        execution provider) and Runtime (optimizations replayed at session
+        creation, for NNAPI). Each comes with the required-operators config
+        used for a reduced-operator ONNX Runtime build.
+        
         Args:
             onnx_path: Path to the ONNX model file
-            output_dir: Directory to save the ORT model
+            output_dir: Directory to save the ORT models and configs
+            target_platform: 'arm' for devices, 'amd64' for desktop testing
             
         Returns:
-            Path to the converted ORT model
+            Dictionary with 'fixed'/'runtime' model paths and their
+            'fixed_config'/'runtime_config' operator configs
         """
         logger.info(f"Converting ONNX model to ORT format")
         
         try:
-            output_dir = Path(output_dir)
-            output_dir.mkdir(exist_ok=True)
-            
-            # Convert to ORT format
-            convert_onnx_models_to_ort(
-                model_path=onnx_path,
-                output_dir=str(output_dir),
-                optimization_style='Fixed',
-                target_device='mobile'
-            )
-            
-            # Find the generated ORT file
-            ort_files = list(output_dir.glob('*.ort'))
-            if ort_files:
-                ort_path = str(ort_files[0])
-                logger.info(f"ORT model saved to: {ort_path}")
-                return ort_path
-            else:
-                raise FileNotFoundError("ORT conversion did not produce expected output file")
+            from ort_format import convert_to_ort
+
+            outputs = convert_to_ort(onnx_path, output_dir, target_platform=target_platform)
+            for key, path in outputs.items():
+                logger.info(f"ORT {key.replace('_', ' ')} saved to: {path}")
+            return outputs
                 
         except Exception as e:
             logger.error(f"Failed to convert to ORT format: {str(e)}")
             raise
 
-def main():
-    """Main function to run the conversion process."""
-    parser = argparse.ArgumentParser(description="Convert Gemma models to ONNX for HazardHawk")
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Register the conversion options on a parser (shared with model_tools.py)."""
     parser.add_argument(
         "--model", 
         type=str, 
@@ -324,19 +388,50 @@ def main():
         action="store_true",
         help="Skip model optimization for mobile"
     )
+    parser.add_argument(
+        "--draft-layers",
+        type=int,
+        help="Export a speculative-decoding draft model with only the first N decoder layers"
+    )
+    parser.add_argument(
+        "--vocab-map",
+        type=str,
+        help="vocab_map.json from vocab_pruning.py: export with the pruned vocabulary"
+    )
+    parser.add_argument(
+        "--dedupe-weights",
+        action="store_true",
+        help="Share tied embedding/LM-head weights that the export serialized twice"
+    )
+    parser.add_argument(
+        "--external-data-alignment",
+        type=int,
+        choices=[4096, 16384, 65536],
+        help="Rewrite the weights into one page-aligned, first-use ordered .onnx.data file"
+    )
+    parser.add_argument(
+        "--sequence-buckets",
+        type=str,
+        help="Also write static-shape prefill graphs for these lengths, e.g. 64,128,256,512"
+    )
     parser.add_argument(
         "--create-ort", 
         action="store_true",
         help="Also create ORT format for mobile deployment"
     )
+    parser.add_argument(
+        "--benchmark-ort",
+        action="store_true",
+        help="With --create-ort, compare cold-start latency of the ONNX and ORT models"
+    )
     parser.add_argument(
         "--validate-only", 
         type=str,
         help="Only validate an existing ONNX model (provide path)"
     )
-    
-    args = parser.parse_args()
-    
+
+def run(args: argparse.Namespace) -> None:
+    """Run the conversion process for parsed arguments."""
     # Validation only mode
     if args.validate_only:
         converter = GemmaToONNXConverter("google/gemma-2b")  # Dummy for validation
@@ -355,6 +450,11 @@ def main():
         # Load the model
         converter.load_model()
         
+        if args.vocab_map:
+            converter.prune_vocabulary(args.vocab_map)
+        if args.draft_layers:
+            converter.truncate_layers(args.draft_layers)
+        
         # Convert to ONNX
         converter.convert_to_onnx(
             args.output, 
@@ -362,6 +462,22 @@ def main():
             optimize_for_mobile=not args.skip_optimization
         )
         
+        # Tied embedding/LM-head weights are exported as two initializers
+        if args.dedupe_weights:
+            from onnx_weight_dedup import dedupe_weights
+            
+            stats = dedupe_weights(args.output, alignment=args.external_data_alignment or 16384,
+                                   remove_stale_data=True)
+            logger.info(f"🔗 Deduplicated weights: saved {stats['bytes_saved'] / (1024 * 1024):.1f} MB")
+        
+        # Lay out external weights for zero-copy mapping on device
+        if args.external_data_alignment and not args.dedupe_weights:
+            from onnx_external_data import align_external_data
+            
+            stats = align_external_data(args.output, alignment=args.external_data_alignment)
+            logger.info(f"📐 {stats['tensors']} tensors aligned to {args.external_data_alignment // 1024} KB "
+                        f"({stats['padding_bytes'] / 1024:.1f} KB padding)")
+        
         # Validate the converted model
         if converter.validate_onnx_model(args.output):
             logger.info("✅ Model conversion and validation successful")
@@ -369,10 +485,25 @@ def main():
             logger.error("❌ Model validation failed")
             sys.exit(1)
         
+        # Static-shape graph family sharing the exported weights
+        if args.sequence_buckets:
+            from onnx_static_shapes import export_buckets
+            
+            buckets = [int(b) for b in args.sequence_buckets.split(",")]
+            bucket_dir = Path(args.output).parent / "sequence_buckets"
+            export_buckets(args.output, str(bucket_dir), buckets,
+                           alignment=args.external_data_alignment or 16384)
+        
         # Create ORT format if requested
         if args.create_ort:
             ort_dir = Path(args.output).parent / "ort_models"
-            converter.convert_to_ort_format(args.output, str(ort_dir))
+            ort_outputs = converter.convert_to_ort_format(args.output, str(ort_dir))
+            
+            if args.benchmark_ort:
+                from ort_format import benchmark, log_report
+                
+                results = benchmark([args.output, ort_outputs["fixed"], ort_outputs["runtime"]])
+                log_report(results, {k: v for k, v in ort_outputs.items() if k.endswith("_config")})
         
         # Print model information
         model_size = Path(args.output).stat().st_size / (1024 * 1024)  # MB
@@ -385,5 +516,11 @@ def main():
         logger.error(f"❌ Conversion failed: {str(e)}")
         sys.exit(1)
 
+def main():
+    """Main function to run the conversion process."""
+    parser = argparse.ArgumentParser(description="Convert Gemma models to ONNX for HazardHawk")
+    add_arguments(parser)
+    run(parser.parse_args())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Confidence-gated cascade over the lite/gpu/full YOLO variants
+
+download_real_ppe_models.py produces construction_safety_lite (n@320),
+construction_safety_gpu (s@480) and construction_safety_full (m@640). The
+cascade runs lite on every photo and only pays for the larger models where
+lite is unsure:
+
+- Each class has a decision threshold from model_config.json
+  (ppe_requirements, else the PPE hazard category, else --default-threshold).
+- A detection is uncertain when its score lies in
+  [threshold - band, threshold + band). A photo with uncertain detections is
+  escalated to the next stage, either whole or (region mode) as
+  native-resolution windows of the next model's input size around the
+  uncertain boxes.
+- The last stage run decides. In image mode the escalated stage re-detects
+  the whole photo and its output replaces the earlier stage's; in region
+  mode only the windows are re-examined, and earlier detections outside
+  them (confident ones included) are kept as they are.
+
+`tune` picks the per-stage band widths on a labelled val set: every stage
+is run once per photo, then every band combination is simulated and the
+cheapest one meeting --target-recall wins. Region mode cannot be simulated
+from whole-photo outputs, so `tune --mode region` runs the real region
+cascade for the cheapest image-mode candidates and keeps the first that
+meets the target (else image mode is recorded). The result is written to
+model_config.json under "cascade" for the app to read.
+
+Usage:
+    python detection_cascade.py tune --images data/val/images --labels data/val/labels --target-recall 0.9
+    python detection_cascade.py run ./uploads --mode region
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sliced_inference import load_labels, match_recall
+from yolo_runtime import Detections, YoloDetector, batched_nms, load_image
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = Path("HazardHawk/androidApp/src/main/assets/models/litert")
+CONFIG_PATH = MODELS_DIR / "model_config.json"
+STAGES = ("construction_safety_lite", "construction_safety_gpu", "construction_safety_full")
+
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_BANDS = (0.2, 0.1)
+BAND_GRID = tuple(round(0.05 * i, 2) for i in range(11))
+REGION_CONTEXT = 1.5
+MERGE_IOU = 0.5
+REGION_CANDIDATES = 5
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[^a-z]", "", name.lower().replace("hardhat", "hard_hat"))
+
+
+def class_thresholds(config: Dict, names: Sequence[str], default: float = DEFAULT_THRESHOLD) -> List[float]:
+    """
+    Decision threshold per class name.
+
+    "no-hardhat" and "hardhat" both take ppe_requirements.hard_hat; classes
+    without a requirement take the PPE compliance category threshold.
+    """
+    requirements = {_normalize(k): v["confidence_threshold"]
+                    for k, v in config.get("ppe_requirements", {}).items() if "confidence_threshold" in v}
+    categories = {c["id"]: c["confidence_threshold"] for c in config.get("hazard_categories", [])
+                  if "confidence_threshold" in c}
+    fallback = categories.get("ppe_compliance", default)
+    thresholds = []
+    for name in names:
+        key = _normalize(name)
+        if key.startswith("no"):
+            key = key[2:]
+        thresholds.append(requirements.get(key, fallback))
+    return thresholds
+
+
+def load_config(path: str = str(CONFIG_PATH)) -> Dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def stage_paths(config: Dict, models_dir: str, overrides: Optional[Sequence[str]] = None) -> List[str]:
+    """Model files for the stages, from model_config.json unless given explicitly"""
+    if overrides:
+        return list(overrides)
+    paths = []
+    for name in STAGES:
+        entry = config.get("models", {}).get(name)
+        if entry is None:
+            raise ValueError(f"{name} is missing from model_config.json; pass --stage paths explicitly")
+        paths.append(str(Path(models_dir) / entry["filename"]))
+    return paths
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def _window(box, size: Tuple[int, int], width: int, height: int):
+    """
+    Native-resolution window around a box: the model input size, or the box
+    plus context when the box is larger, shifted to stay inside the image.
+    """
+    cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+    win_h = int(min(height, max(size[0], (box[3] - box[1]) * REGION_CONTEXT)))
+    win_w = int(min(width, max(size[1], (box[2] - box[0]) * REGION_CONTEXT)))
+    x0 = int(min(max(0, cx - win_w / 2), width - win_w))
+    y0 = int(min(max(0, cy - win_h / 2), height - win_h))
+    return x0, y0, x0 + win_w, y0 + win_h
+
+
+class Cascade:
+    """Runs detector stages cheapest first, escalating uncertain photos or regions."""
+
+    def __init__(self, detectors: Sequence[YoloDetector], thresholds: Sequence[float],
+                 bands: Sequence[float] = DEFAULT_BANDS, mode: str = "image"):
+        if len(bands) != len(detectors) - 1:
+            raise ValueError(f"Need {len(detectors) - 1} band widths for {len(detectors)} stages")
+        import numpy as np
+
+        self.detectors = list(detectors)
+        self.thresholds = np.asarray(thresholds, dtype=np.float32)
+        self.bands = list(bands)
+        self.mode = mode
+        # Scores below the lowest band edge can never matter
+        self.floor = float(max(0.01, self.thresholds.min() - max(self.bands + [0.0])))
+
+    def uncertain(self, detections: Detections, band: float):
+        threshold = self.thresholds[detections.classes]
+        return (detections.scores >= threshold - band) & (detections.scores < threshold + band)
+
+    def confident(self, detections: Detections) -> Detections:
+        return detections.select(detections.scores >= self.thresholds[detections.classes])
+
+    def _regions(self, detector: YoloDetector, image, boxes) -> Tuple[Detections, List]:
+        """Run a stage on windows around boxes; returns detections in image coordinates"""
+        import numpy as np
+
+        height, width = image.shape[:2]
+        regions, parts = [], []
+        for box in boxes:
+            if any(box[0] >= r[0] and box[1] >= r[1] and box[2] <= r[2] and box[3] <= r[3] for r in regions):
+                continue
+            x0, y0, x1, y1 = _window(box, detector.input_shape, width, height)
+            if (x0, y0, x1, y1) in regions:
+                continue
+            regions.append((x0, y0, x1, y1))
+            found = detector.detect(image[y0:y1, x0:x1], self.floor)
+            found.boxes = found.boxes + np.array([x0, y0, x0, y0], dtype=np.float32)
+            parts.append(found)
+        return Detections.concatenate(parts), regions
+
+    def run(self, image) -> Tuple[Detections, Dict]:
+        """
+        Returns:
+            (final detections, trace with per-stage latency and escalation)
+        """
+        import numpy as np
+
+        detections, elapsed = _timed(self.detectors[0].detect, image, self.floor)
+        trace = {"stages_run": 1, "latency_ms": [elapsed]}
+        for stage, band in enumerate(self.bands, start=1):
+            unsure = self.uncertain(detections, band)
+            if not unsure.any():
+                break
+            detector = self.detectors[stage]
+            if self.mode == "region":
+                (found, regions), elapsed = _timed(self._regions, detector, image, detections.boxes[unsure])
+                # Keep earlier decisions outside the re-examined regions
+                sure = detections.select(~unsure)
+                merged = Detections.concatenate([found, sure])
+                keep = batched_nms(merged.boxes, merged.scores, merged.classes, MERGE_IOU)
+                detections = merged.select(np.sort(keep))
+                trace.setdefault("regions", []).append(len(regions))
+            else:
+                detections, elapsed = _timed(detector.detect, image, self.floor)
+            trace["latency_ms"].append(elapsed)
+            trace["stages_run"] = stage + 1
+        return self.confident(detections), trace
+
+
+def collect(detectors: Sequence[YoloDetector], floor: float, images_dir: str, labels_dir: str,
+            limit: Optional[int] = None) -> List[Dict]:
+    """Run every stage on every val photo once (image mode) for tuning"""
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if limit:
+        paths = paths[:limit]
+    if not paths:
+        raise ValueError(f"No images in {images_dir}")
+    records = []
+    for path in paths:
+        image = load_image(str(path))
+        gt = load_labels(Path(labels_dir) / f"{path.stem}.txt", image.shape[1], image.shape[0])
+        outputs, latency = [], []
+        for detector in detectors:
+            detector.detect(image, floor)  # warm-up
+            found, elapsed = _timed(detector.detect, image, floor)
+            outputs.append(found)
+            latency.append(elapsed)
+        records.append({"image": str(path), "gt": gt, "outputs": outputs, "latency_ms": latency})
+    return records
+
+
+def simulate(cascade: Cascade, records: Sequence[Dict]) -> Dict:
+    """Image-mode cascade outcome for given bands, from collected stage outputs"""
+    found = objects = 0
+    costs, escalated = [], [0] * len(cascade.bands)
+    for record in records:
+        stage = 0
+        for index, band in enumerate(cascade.bands):
+            if not cascade.uncertain(record["outputs"][stage], band).any():
+                break
+            stage = index + 1
+            escalated[index] += 1
+        costs.append(sum(record["latency_ms"][:stage + 1]))
+        recall = match_recall(cascade.confident(record["outputs"][stage]), *record["gt"])
+        found += recall["found"]
+        objects += recall["objects"]
+    return {
+        "recall": found / objects if objects else 1.0,
+        "mean_cost_ms": statistics.mean(costs),
+        "escalation_share": [count / len(records) for count in escalated],
+    }
+
+
+def tune(detectors: Sequence[YoloDetector], thresholds: Sequence[float], records: Sequence[Dict],
+         target_recall: float, grid: Sequence[float] = BAND_GRID) -> Dict:
+    """
+    Cheapest band combination whose recall meets the target.
+
+    Falls back to the highest-recall combination when none does.
+    """
+    baselines = {}
+    for index, detector in enumerate(detectors):
+        only = Cascade([detector], thresholds, [])
+        single = [dict(r, outputs=[r["outputs"][index]], latency_ms=[r["latency_ms"][index]]) for r in records]
+        baselines[Path(detector.model_path).stem] = simulate(only, single)
+
+    best = None
+    meeting = []
+    for bands in itertools.product(grid, repeat=len(detectors) - 1):
+        outcome = simulate(Cascade(detectors, thresholds, bands), records)
+        outcome["bands"] = list(bands)
+        meets = outcome["recall"] >= target_recall
+        if meets:
+            meeting.append(outcome)
+        key = (not meets, outcome["mean_cost_ms"] if meets else -outcome["recall"])
+        if best is None or key < best[0]:
+            best = (key, outcome)
+    result = best[1]
+    result["target_met"] = not best[0][0]
+    result["baselines"] = baselines
+    result["candidates"] = [o["bands"] for o in sorted(meeting, key=lambda o: o["mean_cost_ms"])]
+    return result
+
+
+def evaluate(cascade: Cascade, records: Sequence[Dict]) -> Dict:
+    """Measured outcome of running the cascade (any mode) on the collected val photos"""
+    found = objects = 0
+    costs, escalated = [], [0] * len(cascade.bands)
+    for record in records:
+        detections, trace = cascade.run(load_image(record["image"]))
+        costs.append(sum(trace["latency_ms"]))
+        for index in range(trace["stages_run"] - 1):
+            escalated[index] += 1
+        recall = match_recall(detections, *record["gt"])
+        found += recall["found"]
+        objects += recall["objects"]
+    return {
+        "recall": found / objects if objects else 1.0,
+        "mean_cost_ms": statistics.mean(costs),
+        "escalation_share": [count / len(records) for count in escalated],
+    }
+
+
+def tune_region(detectors: Sequence[YoloDetector], thresholds: Sequence[float], records: Sequence[Dict],
+                target_recall: float, candidates: Sequence[Sequence[float]]) -> Optional[Dict]:
+    """
+    Region-mode bands: the cheapest image-mode candidates are run for real
+    in region mode and the first whose measured recall meets the target wins.
+    """
+    for bands in candidates[:REGION_CANDIDATES]:
+        outcome = evaluate(Cascade(detectors, thresholds, bands, "region"), records)
+        outcome["bands"] = list(bands)
+        logger.info(f"   region bands {outcome['bands']}: recall {outcome['recall']:.3f}, "
+                    f"{outcome['mean_cost_ms']:.1f} ms/image")
+        if outcome["recall"] >= target_recall:
+            return outcome
+    return None
+
+
+def write_cascade_config(config_path: str, stages: Sequence[str], thresholds: Sequence[float],
+                         names: Sequence[str], tuned: Dict, target_recall: float, mode: str) -> None:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from model_manifest import atomic_write_json
+
+    config = load_config(config_path)
+    config["cascade"] = {
+        "stages": [Path(s).stem for s in stages],
+        "mode": mode,
+        "class_thresholds": {name: float(t) for name, t in zip(names, thresholds)},
+        "uncertainty_bands": tuned["bands"],
+        "target_recall": target_recall,
+        "measured": {
+            "recall": round(tuned["recall"], 4),
+            "mean_cost_ms": round(tuned["mean_cost_ms"], 1),
+            "escalation_share": [round(s, 3) for s in tuned["escalation_share"]],
+        },
+    }
+    atomic_write_json(config_path, config)
+
+
+def log_tuning(tuned: Dict) -> None:
+    for name, baseline in tuned["baselines"].items():
+        logger.info(f"   {name:28s} recall {baseline['recall']:.3f}, {baseline['mean_cost_ms']:.1f} ms/image")
+    status = "✅" if tuned["target_met"] else "⚠️ "
+    logger.info(f"{status} Cascade bands {tuned['bands']}: recall {tuned['recall']:.3f}, "
+                f"{tuned['mean_cost_ms']:.1f} ms/image, escalated "
+                + ", ".join(f"{s * 100:.1f}%" for s in tuned["escalation_share"]))
+
+
+def _bands(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confidence-gated lite/gpu/full detection cascade")
+    parser.add_argument("--config", default=str(CONFIG_PATH), help="model_config.json")
+    parser.add_argument("--models-dir", default=str(MODELS_DIR), help="Directory of the stage models")
+    parser.add_argument("--stage", action="append", help="Stage model path, cheapest first (repeat; overrides config)")
+    parser.add_argument("--default-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Threshold for classes model_config.json does not cover")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tune_parser = subparsers.add_parser("tune", help="Tune uncertainty bands on a labelled val set")
+    tune_parser.add_argument("--images", required=True, help="Directory of val photos")
+    tune_parser.add_argument("--labels", required=True, help="Directory of YOLO-format labels")
+    tune_parser.add_argument("--target-recall", type=float, default=0.9)
+    tune_parser.add_argument("--mode", choices=["image", "region"], default="image",
+                             help="Escalation mode to tune and record for the app")
+    tune_parser.add_argument("--limit", type=int, help="Only use the first N images")
+    tune_parser.add_argument("--dry-run", action="store_true", help="Do not write model_config.json")
+
+    run_parser = subparsers.add_parser("run", help="Detect with the cascade")
+    run_parser.add_argument("inputs", nargs="+", help="Photos or directories")
+    run_parser.add_argument("--mode", choices=["image", "region"], help="Escalate whole photos or regions")
+    run_parser.add_argument("--bands", type=_bands, help="Comma-separated band widths (default: tuned values)")
+
+    args = parser.parse_args()
+
+    try:
+        config = load_config(args.config)
+        paths = stage_paths(config, args.models_dir, args.stage)
+        detectors = [YoloDetector(p) for p in paths]
+        names = detectors[0].names or config.get("models", {}).get(STAGES[0], {}).get("classes", [])
+        thresholds = class_thresholds(config, names, args.default_threshold)
+
+        if args.command == "tune":
+            floor = max(0.01, min(thresholds) - max(BAND_GRID))
+            records = collect(detectors, floor, args.images, args.labels, args.limit)
+            tuned = tune(detectors, thresholds, records, args.target_recall)
+            log_tuning(tuned)
+            mode = args.mode
+            if mode == "region":
+                region = tune_region(detectors, thresholds, records, args.target_recall, tuned["candidates"])
+                if region:
+                    tuned.update(region)
+                    logger.info(f"✅ Region mode bands {tuned['bands']}: recall {tuned['recall']:.3f}, "
+                                f"{tuned['mean_cost_ms']:.1f} ms/image")
+                else:
+                    mode = "image"
+                    logger.warning("⚠️  Region mode misses the target recall for every candidate; recording image mode")
+            if not args.dry_run:
+                write_cascade_config(args.config, paths, thresholds, names, tuned, args.target_recall, mode)
+                logger.info(f"📝 Cascade settings written to {args.config}")
+        else:
+            tuned = config.get("cascade", {})
+            bands = args.bands or tuned.get("uncertainty_bands") or list(DEFAULT_BANDS)[:len(detectors) - 1]
+            cascade = Cascade(detectors, thresholds, bands, args.mode or tuned.get("mode", "image"))
+            inputs = []
+            for item in args.inputs:
+                item = Path(item)
+                inputs += sorted(p for p in item.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png")) \
+                    if item.is_dir() else [item]
+            costs, stages = [], []
+            for path in inputs:
+                detections, trace = cascade.run(load_image(str(path)))
+                costs.append(sum(trace["latency_ms"]))
+                stages.append(trace["stages_run"])
+                print(json.dumps({"image": str(path), "stages_run": trace["stages_run"],
+                                  "detections": detections.to_json(names)}))
+            if inputs:
+                escalated = [sum(s > i for s in stages) / len(stages) for i in range(1, len(detectors))]
+                logger.info(f"💰 {statistics.mean(costs):.1f} ms/image; escalated "
+                            + ", ".join(f"{e * 100:.1f}%" for e in escalated))
+    except Exception as e:
+        logger.error(f"❌ Cascade {args.command} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Gemma export to LiteRT (TFLite) with KV cache and int4/int8 weights
+
+The app runs on LiteRT, but the Gemma tooling only produced ONNX. This
+script re-authors Gemma with ai-edge-torch's generative layers and converts
+it to a single .tflite with one signature per phase:
+
+    prefill_<L>   tokens[1, L], input_pos[L], kv_cache_{k,v}_<i>  -> kv_cache_{k,v}_<i>
+    decode        tokens[1, 1], input_pos[1], kv_cache_{k,v}_<i>  -> logits, kv_cache_{k,v}_<i>
+
+The KV cache is a fixed-size (kv_cache_max_len) tensor per layer that the
+runner threads from each call's outputs into the next call's inputs, so a
+decode step costs one token regardless of how long the context is.
+
+Weights are quantized at conversion time (int8 per-channel or int4 with
+block size 32, both with dynamic-range activations). The tokenizer is the
+same tokenizer.json used by the ONNX exports and the model is recorded in
+the manifest next to them (`gemma_decoder_tflite`), pointing at the shared
+`gemma_tokenizer` entry and reusing the `gemma_decoder` config.
+
+Usage:
+    python gemma_tflite.py convert --model google/gemma-2b-it --output-dir ./models/gemma_tflite --quantize int4
+    python gemma_tflite.py benchmark ./models/gemma_tflite/gemma-2b-it_int4.tflite --tokenizer tokenizer.json
+"""
+
+import argparse
+import inspect
+import json
+import logging
+import re
+import shutil
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --quantize choice -> ai-edge-torch quantization recipe name
+QUANTIZATION = {
+    "fp32": "none",
+    "int8": "dynamic_int8",
+    "int4": "dynamic_int4_block32",
+}
+
+DEFAULT_PREFILL_LENGTHS = (128, 512)
+DEFAULT_KV_CACHE_MAX_LEN = 1024
+
+MANIFEST_ID = "gemma_decoder_tflite"
+
+
+def model_builder(model_name: str):
+    """Pick the ai-edge-torch builder for a Gemma checkpoint"""
+    name = model_name.lower()
+    # "gemma-2b-it" is Gemma 1; the Gemma 2/3 families are "gemma-2-2b", "gemma-3-1b"
+    if re.search(r"gemma-3-1b", name):
+        from ai_edge_torch.generative.examples.gemma3 import gemma3
+        return gemma3.build_model_1b
+    if re.search(r"gemma-2-2b", name):
+        from ai_edge_torch.generative.examples.gemma import gemma2
+        return gemma2.build_2b_model
+    if re.search(r"gemma-2b(-it)?$", name):
+        from ai_edge_torch.generative.examples.gemma import gemma1
+        return gemma1.build_2b_model
+    raise ValueError(f"No ai-edge-torch builder for {model_name}; supported: gemma-2b(-it), gemma-2-2b, gemma-3-1b")
+
+
+def build_model(model_name: str, checkpoint_dir: str, kv_cache_max_len: int):
+    """Build the re-authored Gemma and load the Hugging Face safetensors into it"""
+    builder = model_builder(model_name)
+    # The KV cache length argument was renamed across ai-edge-torch releases
+    parameters = inspect.signature(builder).parameters
+    kwargs = {}
+    for name in ("kv_cache_max_len", "mask_cache_size"):
+        if name in parameters:
+            kwargs[name] = kv_cache_max_len
+    return builder(checkpoint_dir, **kwargs)
+
+
+def download_checkpoint(model_name: str, cache_dir: str) -> Path:
+    """Fetch the safetensors checkpoint, config and tokenizer"""
+    from huggingface_hub import snapshot_download
+
+    path = snapshot_download(
+        model_name,
+        cache_dir=cache_dir,
+        allow_patterns=["*.safetensors", "*.json", "tokenizer.model"],
+    )
+    return Path(path)
+
+
+def convert(model_name: str, output_dir: str, cache_dir: str = "./model_cache", quantize: str = "int4",
+            prefill_lengths: Sequence[int] = DEFAULT_PREFILL_LENGTHS,
+            kv_cache_max_len: int = DEFAULT_KV_CACHE_MAX_LEN) -> Dict:
+    """
+    Convert a Gemma checkpoint to a multi-signature .tflite.
+
+    Returns:
+        Export summary: tflite path, tokenizer path, signatures and sizes
+    """
+    from ai_edge_torch.generative.utilities import converter
+
+    if quantize not in QUANTIZATION:
+        raise ValueError(f"Unknown quantization '{quantize}'; choose from {', '.join(QUANTIZATION)}")
+    if max(prefill_lengths) > kv_cache_max_len:
+        raise ValueError(f"Prefill length {max(prefill_lengths)} exceeds kv_cache_max_len {kv_cache_max_len}")
+
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    checkpoint = download_checkpoint(model_name, cache_dir)
+
+    logger.info(f"Building {model_name} with a {kv_cache_max_len}-token KV cache...")
+    model = build_model(model_name, str(checkpoint), kv_cache_max_len)
+
+    prefix = model_name.split("/")[-1]
+    before = set(output.glob("*.tflite"))
+    logger.info(f"Converting to TFLite ({quantize}, prefill {', '.join(map(str, prefill_lengths))})...")
+    converter.convert_to_tflite(
+        model,
+        output_path=str(output),
+        output_name_prefix=prefix,
+        prefill_seq_len=list(prefill_lengths),
+        quantize=QUANTIZATION[quantize],
+    )
+
+    # The converter encodes quantization and cache size in its own file name
+    produced = sorted(set(output.glob("*.tflite")) - before, key=lambda p: p.stat().st_mtime)
+    if not produced:
+        raise RuntimeError(f"ai-edge-torch did not write a .tflite into {output}")
+    tflite_path = output / f"{prefix}_{quantize}.tflite"
+    produced[-1].replace(tflite_path)
+
+    tokenizer_path = output / "tokenizer.json"
+    if not tokenizer_path.exists():
+        shutil.copyfile(checkpoint / "tokenizer.json", tokenizer_path)
+
+    # Single-length exports name the signature plain "prefill"; read what was written
+    signatures = sorted(load_interpreter(str(tflite_path)).get_signature_list())
+
+    summary = {
+        "model": model_name,
+        "tflite": str(tflite_path),
+        "tokenizer": str(tokenizer_path),
+        "quantization": quantize,
+        "prefill_lengths": sorted(prefill_lengths),
+        "kv_cache_max_len": kv_cache_max_len,
+        "signatures": signatures,
+        "size_mb": round(tflite_path.stat().st_size / (1024 * 1024), 1),
+    }
+    logger.info(f"✅ TFLite model saved to: {tflite_path} ({summary['size_mb']} MB)")
+    return summary
+
+
+def load_interpreter(model_path: str, num_threads: int = 4):
+    """LiteRT interpreter, falling back to the one bundled with TensorFlow"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite.python.interpreter import Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+
+class TFLiteCausalLM:
+    """Greedy decoder over the prefill/decode signatures with a threaded KV cache."""
+
+    def __init__(self, model_path: str, num_threads: int = 4):
+        import numpy as np
+
+        self.np = np
+        self.interpreter = load_interpreter(model_path, num_threads)
+        signatures = self.interpreter.get_signature_list()
+        if "decode" not in signatures:
+            raise ValueError(f"{model_path} has no 'decode' signature (found: {', '.join(signatures)})")
+
+        self.decode_runner = self.interpreter.get_signature_runner("decode")
+        self.prefill_runners = {}
+        for name in signatures:
+            if name.startswith("prefill"):
+                runner = self.interpreter.get_signature_runner(name)
+                self.prefill_runners[int(runner.get_input_details()["tokens"]["shape"][1])] = runner
+
+        self.cache_details = {
+            name: detail for name, detail in self.decode_runner.get_input_details().items()
+            if name.startswith("kv_cache_")
+        }
+        first = next(iter(self.cache_details.values()))
+        # kv_cache_k_<i>: [batch, kv_cache_max_len, kv_heads, head_dim]
+        self.kv_cache_max_len = int(first["shape"][1])
+        self.reset()
+
+    def reset(self) -> None:
+        self.cache = {
+            name: self.np.zeros(detail["shape"], dtype=detail["dtype"])
+            for name, detail in self.cache_details.items()
+        }
+        self.position = 0
+
+    def _mask(self, runner, positions):
+        """Causal mask for graphs exported with an explicit mask input"""
+        detail = runner.get_input_details().get("mask")
+        if detail is None:
+            return {}
+        np = self.np
+        columns = np.arange(detail["shape"][-1])
+        allowed = columns[None, :] <= np.asarray(positions)[:, None]
+        mask = np.where(allowed, 0.0, np.finfo(np.float32).min).astype(detail["dtype"])
+        return {"mask": mask.reshape(detail["shape"])}
+
+    def _run(self, runner, tokens, positions):
+        np = self.np
+        outputs = runner(
+            tokens=np.asarray([tokens], dtype=np.int32),
+            input_pos=np.asarray(positions, dtype=np.int32),
+            **self._mask(runner, positions),
+            **self.cache,
+        )
+        self.cache = {name: outputs[name] for name in self.cache}
+        return outputs
+
+    def prefill(self, token_ids: List[int]) -> None:
+        """Write the prompt into the KV cache with the smallest prefill signature that fits"""
+        fitting = [length for length in self.prefill_runners if length >= len(token_ids)]
+        if not fitting:
+            raise ValueError(f"Prompt of {len(token_ids)} tokens exceeds the largest prefill signature "
+                             f"({max(self.prefill_runners)})")
+        length = min(fitting)
+        # Padded slots are written past the prompt and overwritten by decode before they are attended
+        tokens = list(token_ids) + [0] * (length - len(token_ids))
+        self._run(self.prefill_runners[length], tokens, list(range(self.position, self.position + length)))
+        self.position += len(token_ids)
+
+    def decode(self, token_id: int):
+        """One decode step; returns the logits for the next token"""
+        if self.position >= self.kv_cache_max_len:
+            raise ValueError(f"KV cache full ({self.kv_cache_max_len} tokens)")
+        logits = self._run(self.decode_runner, [token_id], [self.position])["logits"]
+        self.position += 1
+        return logits.reshape(-1)
+
+    def generate(self, prompt_ids: List[int], max_new_tokens: int, eos_token_id: Optional[int] = None) -> List[int]:
+        self.reset()
+        if len(prompt_ids) > 1:
+            self.prefill(prompt_ids[:-1])
+        token = prompt_ids[-1]
+        generated = []
+        for _ in range(max_new_tokens):
+            token = int(self.decode(token).argmax())
+            generated.append(token)
+            if token == eos_token_id:
+                break
+        return generated
+
+
+def benchmark(model_path: str, tokenizer_path: Optional[str] = None, prompt: Optional[str] = None,
+              prompt_tokens: int = 64, new_tokens: int = 32, num_threads: int = 4, repeat: int = 3) -> Dict:
+    """
+    Prefill latency and decode tokens/sec on the CPU interpreter.
+
+    Without a tokenizer the prompt is `prompt_tokens` copies of token 2.
+    """
+    if tokenizer_path:
+        from tokenizers import Tokenizer
+
+        text = prompt or "Identify the fall protection hazards on this scaffold and cite the OSHA standard."
+        prompt_ids = Tokenizer.from_file(tokenizer_path).encode(text).ids
+    else:
+        prompt_ids = [2] * prompt_tokens
+
+    start = time.perf_counter()
+    lm = TFLiteCausalLM(model_path, num_threads)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    prefill_ms, decode_tps = [], []
+    for _ in range(repeat + 1):  # first round is warm-up
+        lm.reset()
+        start = time.perf_counter()
+        lm.prefill(prompt_ids[:-1])
+        prefill = (time.perf_counter() - start) * 1000
+
+        token = prompt_ids[-1]
+        start = time.perf_counter()
+        for _ in range(new_tokens):
+            token = int(lm.decode(token).argmax())
+        elapsed = time.perf_counter() - start
+        prefill_ms.append(prefill)
+        decode_tps.append(new_tokens / elapsed)
+
+    return {
+        "model": model_path,
+        "size_mb": round(Path(model_path).stat().st_size / (1024 * 1024), 1),
+        "prompt_tokens": len(prompt_ids),
+        "new_tokens": new_tokens,
+        "threads": num_threads,
+        "load_ms": round(load_ms, 1),
+        "prefill_ms": round(statistics.median(prefill_ms[1:]), 1),
+        "tokens_per_second": round(statistics.median(decode_tps[1:]), 2),
+    }
+
+
+def record_in_manifest(summary: Dict, stats: Optional[Dict] = None, assets_dir: Optional[str] = None) -> None:
+    """Add the TFLite decoder to the manifest, sharing the ONNX decoder's config and tokenizer"""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import model_manifest
+
+    assets_dir = Path(assets_dir or model_manifest.ASSETS_DIR).resolve()
+    tflite = Path(summary["tflite"]).resolve()
+    try:
+        relative = str(tflite.relative_to(assets_dir))
+    except ValueError:
+        raise ValueError(f"{tflite} is not inside the assets directory {assets_dir}")
+
+    onnx_decoder = model_manifest.load_entry("gemma_decoder")
+    config = {k: v for k, v in (onnx_decoder.config if onnx_decoder else {}).items()
+              if k not in ("quantization", "inference_framework", "sequence_buckets")}
+    config.update({
+        "inference_framework": "litert",
+        "tokenizer": "gemma_tokenizer",
+        "signatures": {
+            "prefill": [name for name in summary["signatures"] if name.startswith("prefill")],
+            "decode": "decode",
+        },
+        "prefill_lengths": summary["prefill_lengths"],
+        "kv_cache_max_len": summary["kv_cache_max_len"],
+    })
+
+    patch = {
+        "role": "text_decoder",
+        "format": "tflite",
+        "version": onnx_decoder.version if onnx_decoder else "1.0.0",
+        "files": [relative],
+        "description": f"{summary['model']} converted with ai-edge-torch ({summary['quantization']} weights)",
+        "source": summary["model"],
+        "quantization": summary["quantization"],
+        "config": config,
+    }
+    if stats:
+        patch["stats"] = {
+            "measured_tokens_per_second": stats["tokens_per_second"],
+            "measured_prefill_ms": stats["prefill_ms"],
+            "measured_prompt_tokens": stats["prompt_tokens"],
+        }
+    model_manifest.update_model(MANIFEST_ID, patch, assets_dir=assets_dir)
+    model_manifest.compile_manifest()
+
+
+def log_benchmark(result: Dict) -> None:
+    logger.info(f"📏 {result['model']}: {result['size_mb']} MB, loaded in {result['load_ms']} ms")
+    logger.info(f"⚡ Prefill {result['prompt_tokens']} tokens: {result['prefill_ms']} ms")
+    logger.info(f"🚀 Decode: {result['tokens_per_second']} tokens/s ({result['threads']} threads)")
+
+
+def _lengths(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gemma export to LiteRT/TFLite with KV cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    conv = subparsers.add_parser("convert", help="Convert a Gemma checkpoint to a prefill/decode .tflite")
+    conv.add_argument("--model", default="google/gemma-2b-it", help="Hugging Face model name")
+    conv.add_argument("--output-dir", default="./models/gemma_tflite", help="Output directory")
+    conv.add_argument("--cache-dir", default="./model_cache", help="Model cache directory")
+    conv.add_argument("--quantize", choices=sorted(QUANTIZATION), default="int4", help="Weight quantization")
+    conv.add_argument("--prefill-lengths", type=_lengths, default=list(DEFAULT_PREFILL_LENGTHS),
+                      help="Comma-separated prefill signature lengths")
+    conv.add_argument("--kv-cache-max-len", type=int, default=DEFAULT_KV_CACHE_MAX_LEN,
+                      help="KV cache size in tokens (prompt + generated)")
+    conv.add_argument("--benchmark", action="store_true", help="Measure tokens/sec after converting")
+    conv.add_argument("--update-manifest", action="store_true",
+                      help="Record the model in the manifest (output must be inside the app assets)")
+
+    bench = subparsers.add_parser("benchmark", help="Measure prefill latency and decode tokens/sec")
+    bench.add_argument("model", help="Path to the .tflite model")
+    bench.add_argument("--tokenizer", help="tokenizer.json to encode --prompt with")
+    bench.add_argument("--prompt", help="Prompt text (needs --tokenizer)")
+    bench.add_argument("--prompt-tokens", type=int, default=64, help="Synthetic prompt length without a tokenizer")
+    bench.add_argument("--new-tokens", type=int, default=32)
+    bench.add_argument("--threads", type=int, default=4)
+    bench.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "convert":
+            summary = convert(args.model, args.output_dir, args.cache_dir, args.quantize,
+                              args.prefill_lengths, args.kv_cache_max_len)
+            stats = None
+            if args.benchmark:
+                stats = benchmark(summary["tflite"], summary["tokenizer"])
+                log_benchmark(stats)
+            if args.update_manifest:
+                record_in_manifest(summary, stats)
+                logger.info(f"📝 Manifest entry '{MANIFEST_ID}' updated")
+        else:
+            result = benchmark(args.model, args.tokenizer, args.prompt, args.prompt_tokens,
+                               args.new_tokens, args.threads)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                log_benchmark(result)
+    except Exception as e:
+        logger.error(f"❌ TFLite {args.command} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
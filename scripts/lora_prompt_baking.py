@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Bake the OSHA system prompt into Gemma with a merged LoRA adapter
+
+Every request re-encodes the instruction block from
+`GemmaToONNXConverter.create_construction_safety_prompt`, and prefill cost
+grows with prompt length. This stage fine-tunes a small LoRA adapter so the
+model produces the report from the short request alone, merges the adapter
+into the base weights and exports the merged model through the regular
+`convert_to_onnx` path. Production prompts can then drop the preamble.
+
+Training data is JSONL, one pair per line:
+
+    {"prompt": "Worker on scaffold edge, no harness", "report": "{\"hazards\": [...]}"}
+
+Pairs without a "report" are completed by the base model from the full
+(preamble + prompt) input first, so the adapter learns to reproduce what
+the long prompt would have produced.
+
+Training runs on CPU in float32 with small ranks (r=4..16 on q/k/v/o
+projections); only the adapter weights are trained.
+
+Usage:
+    python lora_prompt_baking.py --pairs safety_pairs.jsonl --output gemma2b_baked.onnx --rank 8 --epochs 2
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_TARGET_MODULES = ("q_proj", "k_proj", "v_proj", "o_proj")
+IGNORE_INDEX = -100
+
+
+def load_pairs(path: str) -> List[Dict[str, str]]:
+    """Read (prompt, report) pairs from JSONL"""
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "prompt" not in record:
+                raise ValueError(f"{path}:{number}: missing 'prompt'")
+            pairs.append(record)
+    if not pairs:
+        raise ValueError(f"{path} contains no pairs")
+    return pairs
+
+
+def full_prompt(preamble: str, prompt: str) -> str:
+    return f"{preamble.strip()}\n\n{prompt.strip()}\n"
+
+
+def short_prompt(prompt: str) -> str:
+    return f"{prompt.strip()}\n"
+
+
+def complete_missing_reports(model, tokenizer, pairs: List[Dict[str, str]], preamble: str,
+                             max_new_tokens: int = 256) -> int:
+    """Fill pairs without a report with the base model's output for the full prompt"""
+    import torch
+
+    completed = 0
+    for pair in pairs:
+        if pair.get("report"):
+            continue
+        inputs = tokenizer(full_prompt(preamble, pair["prompt"]), return_tensors="pt")
+        with torch.no_grad():
+            output = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False)
+        pair["report"] = tokenizer.decode(output[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True)
+        completed += 1
+    return completed
+
+
+def build_examples(tokenizer, pairs: List[Dict[str, str]], max_length: int = 512) -> List[Dict[str, List[int]]]:
+    """Tokenize short prompt + report; the loss only covers the report tokens"""
+    examples = []
+    for pair in pairs:
+        prompt_ids = tokenizer(short_prompt(pair["prompt"]), add_special_tokens=True)["input_ids"]
+        report_ids = tokenizer(pair["report"], add_special_tokens=False)["input_ids"] + [tokenizer.eos_token_id]
+        input_ids = (prompt_ids + report_ids)[:max_length]
+        labels = ([IGNORE_INDEX] * len(prompt_ids) + report_ids)[:max_length]
+        examples.append({"input_ids": input_ids, "labels": labels})
+    return examples
+
+
+def train_lora(model, tokenizer, examples: List[Dict[str, List[int]]], rank: int = 8, alpha: int = 16,
+               dropout: float = 0.05, epochs: int = 2, learning_rate: float = 2e-4,
+               batch_size: int = 1, gradient_accumulation: int = 8,
+               target_modules=DEFAULT_TARGET_MODULES):
+    """
+    Fine-tune a LoRA adapter on CPU.
+
+    Returns:
+        The PEFT model (adapter attached, not merged)
+    """
+    import torch
+    from peft import LoraConfig, get_peft_model
+
+    config = LoraConfig(r=rank, lora_alpha=alpha, lora_dropout=dropout, target_modules=list(target_modules),
+                        bias="none", task_type="CAUSAL_LM")
+    model = get_peft_model(model, config)
+    trainable = sum(p.numel() for p in model.parameters() if p.requires_grad)
+    total = sum(p.numel() for p in model.parameters())
+    logger.info(f"LoRA r={rank}: {trainable:,} trainable of {total:,} parameters ({trainable / total * 100:.3f}%)")
+
+    optimizer = torch.optim.AdamW([p for p in model.parameters() if p.requires_grad], lr=learning_rate)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    model.train()
+
+    step = 0
+    for epoch in range(epochs):
+        order = torch.randperm(len(examples)).tolist()
+        losses = []
+        for start in range(0, len(order), batch_size):
+            batch = [examples[i] for i in order[start:start + batch_size]]
+            width = max(len(e["input_ids"]) for e in batch)
+            input_ids = torch.tensor([e["input_ids"] + [pad_id] * (width - len(e["input_ids"])) for e in batch])
+            labels = torch.tensor([e["labels"] + [IGNORE_INDEX] * (width - len(e["labels"])) for e in batch])
+            attention_mask = (torch.arange(width)[None, :] < torch.tensor([len(e["input_ids"]) for e in batch])[:, None]).long()
+
+            loss = model(input_ids=input_ids, attention_mask=attention_mask, labels=labels).loss
+            (loss / gradient_accumulation).backward()
+            losses.append(loss.item())
+            step += 1
+            if step % gradient_accumulation == 0:
+                optimizer.step()
+                optimizer.zero_grad()
+        if step % gradient_accumulation:
+            optimizer.step()
+            optimizer.zero_grad()
+        logger.info(f"Epoch {epoch + 1}/{epochs}: mean loss {statistics.mean(losses):.4f}")
+
+    model.eval()
+    return model
+
+
+def measure_prefill(model_path: str, token_lists: List[List[int]], repeat: int = 5) -> float:
+    """Median prefill latency in ms over the given prompts, on the exported ONNX model"""
+    import numpy as np
+    from onnx_generation import OrtCausalLM
+
+    decoder = OrtCausalLM(model_path)
+    timings = []
+    for tokens in token_lists:
+        input_ids = np.array([tokens], dtype=np.int64)
+        decoder.forward(input_ids)  # warm-up
+        for _ in range(repeat):
+            start = time.perf_counter()
+            decoder.forward(input_ids)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def bake(model_name: str, pairs_path: str, output: str, cache_dir: str = "./model_cache", rank: int = 8,
+         alpha: int = 16, epochs: int = 2, learning_rate: float = 2e-4, gradient_accumulation: int = 8,
+         max_length: int = 512, opset_version: int = 17) -> Dict[str, float]:
+    """
+    Train, merge and export; returns the prompt-length and prefill report.
+    """
+    from convert_gemma_to_onnx import GemmaToONNXConverter
+
+    converter = GemmaToONNXConverter(model_name, cache_dir)
+    converter.load_model()
+    converter.model.float()
+    preamble = converter.create_construction_safety_prompt()
+    tokenizer = converter.tokenizer
+
+    pairs = load_pairs(pairs_path)
+    completed = complete_missing_reports(converter.model, tokenizer, pairs, preamble)
+    if completed:
+        logger.info(f"Generated {completed} missing report(s) from the full prompt")
+
+    examples = build_examples(tokenizer, pairs, max_length)
+    peft_model = train_lora(converter.model, tokenizer, examples, rank, alpha, epochs=epochs,
+                            learning_rate=learning_rate, gradient_accumulation=gradient_accumulation)
+
+    adapter_dir = Path(output).with_suffix("").with_name(Path(output).stem + "_lora_adapter")
+    peft_model.save_pretrained(str(adapter_dir))
+    logger.info(f"Adapter saved to: {adapter_dir}")
+
+    # Fold B·A into the base weights; the export sees a plain Gemma model
+    converter.model = peft_model.merge_and_unload()
+    converter.model.eval()
+    converter.convert_to_onnx(output, opset_version)
+
+    full_tokens = [tokenizer(full_prompt(preamble, p["prompt"]))["input_ids"] for p in pairs]
+    short_tokens = [tokenizer(short_prompt(p["prompt"]))["input_ids"] for p in pairs]
+    full_lengths = [len(t) for t in full_tokens]
+    short_lengths = [len(t) for t in short_tokens]
+
+    sample = slice(0, min(len(pairs), 8))
+    report = {
+        "pairs": len(pairs),
+        "rank": rank,
+        "adapter": str(adapter_dir),
+        "mean_prompt_tokens_before": round(statistics.mean(full_lengths), 1),
+        "mean_prompt_tokens_after": round(statistics.mean(short_lengths), 1),
+        "mean_prompt_tokens_saved": round(statistics.mean(f - s for f, s in zip(full_lengths, short_lengths)), 1),
+        "prefill_ms_before": round(measure_prefill(output, full_tokens[sample]), 2),
+        "prefill_ms_after": round(measure_prefill(output, short_tokens[sample]), 2),
+    }
+    with open(Path(output).with_suffix(".baking_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake the OSHA system prompt into Gemma via a merged LoRA adapter")
+    parser.add_argument("--model", default="google/gemma-2b-it", help="Hugging Face base model")
+    parser.add_argument("--pairs", required=True, help="JSONL of {prompt, report} pairs")
+    parser.add_argument("--output", default="gemma2b_baked.onnx", help="Output ONNX model path")
+    parser.add_argument("--cache-dir", default="./model_cache", help="Model cache directory")
+    parser.add_argument("--rank", type=int, default=8, help="LoRA rank")
+    parser.add_argument("--alpha", type=int, default=16, help="LoRA alpha")
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--learning-rate", type=float, default=2e-4)
+    parser.add_argument("--gradient-accumulation", type=int, default=8)
+    parser.add_argument("--max-length", type=int, default=512, help="Max tokens per training example")
+    parser.add_argument("--opset-version", type=int, default=17)
+
+    args = parser.parse_args()
+
+    try:
+        report = bake(args.model, args.pairs, args.output, args.cache_dir, args.rank, args.alpha, args.epochs,
+                      args.learning_rate, args.gradient_accumulation, args.max_length, args.opset_version)
+    except Exception as e:
+        logger.error(f"❌ Prompt baking failed: {str(e)}")
+        sys.exit(1)
+
+    logger.info(f"✂️  Prompt tokens: {report['mean_prompt_tokens_before']:.0f} → "
+                f"{report['mean_prompt_tokens_after']:.0f} (saved {report['mean_prompt_tokens_saved']:.0f} per request)")
+    logger.info(f"⚡ Prefill: {report['prefill_ms_before']:.1f} ms → {report['prefill_ms_after']:.1f} ms")
+    logger.info(f"🎉 Merged model exported to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Model Tooling CLI
+
+Single entry point for the YOLO and Gemma model tooling. Every subcommand
+imports its heavy dependencies (torch, ultralytics, transformers, onnx,
+onnxruntime, ...) only when it runs, so `--help` and argument errors return
+immediately.
+
+Usage:
+    python model_tools.py yolo --model-size n --deploy-to ../HazardHawk/androidApp/src/main/assets
+    python model_tools.py gemma --model google/gemma-2b --create-ort
+    python model_tools.py gemma --validate-only gemma2b_construction_safety.onnx
+    python model_tools.py bench-startup --max-seconds 1.0
+"""
+
+import argparse
+import logging
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_PATH = Path(__file__).resolve()
+
+# Modules that must never be imported just to build the parser.
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "ultralytics",
+    "onnx",
+    "onnxruntime",
+    "cv2",
+    "PIL",
+    "numpy",
+    "optimum",
+    "tensorflow",
+]
+
+# Command lines timed by `bench-startup`; none of them should do real work.
+STARTUP_BENCHMARK_COMMANDS = [
+    ["--help"],
+    ["yolo", "--help"],
+    ["gemma", "--help"],
+]
+
+
+def _run_yolo(args: argparse.Namespace) -> None:
+    import setup_yolo_hazard_detection
+
+    setup_yolo_hazard_detection.run(args)
+
+
+def _run_gemma(args: argparse.Namespace) -> None:
+    import convert_gemma_to_onnx
+
+    convert_gemma_to_onnx.run(args)
+
+
+def measure_startup(argv: List[str], repeat: int = 5) -> float:
+    """
+    Measure the wall-clock time of `model_tools.py <argv>` in a fresh interpreter.
+
+    Args:
+        argv: Arguments passed to this script
+        repeat: Number of runs; the fastest one is reported
+
+    Returns:
+        Best startup time in seconds
+
+    Raises:
+        RuntimeError: If a run exits non-zero, so a crash never counts as fast
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, str(SCRIPT_PATH), *argv],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        timings.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"model_tools.py {' '.join(argv)} exited with {result.returncode}: "
+                f"{result.stderr.strip()}"
+            )
+    return min(timings)
+
+
+def find_eager_heavy_imports() -> List[str]:
+    """
+    Build the full parser in a fresh interpreter and report heavy modules it loaded.
+
+    Returns:
+        Names from HEAVY_MODULES that were imported while building the parser
+    """
+    probe = (
+        "import sys; "
+        f"sys.path.insert(0, {str(SCRIPT_PATH.parent)!r}); "
+        "import model_tools; "
+        "model_tools.build_parser(); "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    output = result.stdout.strip()
+    return output.split(",") if output else []
+
+
+def _run_bench_startup(args: argparse.Namespace) -> None:
+    failed = False
+
+    eager = find_eager_heavy_imports()
+    if eager:
+        logger.error(f"❌ Heavy modules imported at startup: {', '.join(eager)}")
+        failed = True
+    else:
+        logger.info("✅ No heavy modules imported while building the CLI")
+
+    for argv in STARTUP_BENCHMARK_COMMANDS:
+        try:
+            elapsed = measure_startup(argv, args.repeat)
+        except RuntimeError as e:
+            logger.error(f"❌ {str(e)}")
+            failed = True
+            continue
+        status = "✅" if elapsed <= args.max_seconds else "❌"
+        logger.info(f"{status} model_tools.py {' '.join(argv)}: {elapsed * 1000:.0f} ms")
+        if elapsed > args.max_seconds:
+            failed = True
+
+    if failed:
+        logger.error(f"❌ Startup regression (budget {args.max_seconds:.2f}s)")
+        sys.exit(1)
+    logger.info("🚀 Startup within budget")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the CLI parser. Must not import any module listed in HEAVY_MODULES."""
+    import convert_gemma_to_onnx
+    import setup_yolo_hazard_detection
+
+    parser = argparse.ArgumentParser(description="HazardHawk model tooling")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    yolo = subparsers.add_parser("yolo", help="Download, train and export YOLOv8 hazard detection models")
+    setup_yolo_hazard_detection.add_arguments(yolo)
+    yolo.set_defaults(func=_run_yolo)
+
+    gemma = subparsers.add_parser("gemma", help="Convert and validate Gemma ONNX models")
+    convert_gemma_to_onnx.add_arguments(gemma)
+    gemma.set_defaults(func=_run_gemma)
+
+    bench = subparsers.add_parser("bench-startup", help="Benchmark CLI startup and fail on import-time regressions")
+    bench.add_argument("--max-seconds", type=float, default=1.0, help="Startup budget per command")
+    bench.add_argument("--repeat", type=int, default=5, help="Runs per command (fastest is reported)")
+    bench.set_defaults(func=_run_bench_startup)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    sys.path.insert(0, str(SCRIPT_PATH.parent))
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
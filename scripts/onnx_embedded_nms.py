@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Embed box decoding, top-k and class-aware NMS in YOLOv8 ONNX graphs
+
+Exports emit the raw head [1, 4+nc, N], so every consumer (Kotlin, Python)
+re-implements decoding and NMS on the host. This rewrites the graph to end
+in ONNX's NonMaxSuppression instead:
+
+    output0 [1, 4+nc, N]
+      -> cxcywh to xyxy (one MatMul), best class per anchor (ReduceMax mask)
+      -> NonMaxSuppression (per class, IoU / score threshold, max per class)
+      -> TopK over the survivors (max detections)
+    detections [K, 6]   x1, y1, x2, y2, score, class   (model input pixels)
+
+Thresholds are baked in from model_config.json ("nms": iou_threshold,
+score_threshold, max_detections). Without a score_threshold the lowest
+class confidence_threshold is used, since nothing below it is ever acted on.
+
+Only the best class per anchor competes, matching the host path in
+yolo_runtime.py (argmax, then class-aware NMS); `check` verifies that both
+produce the same detections and `benchmark` compares end-to-end latency.
+
+Usage:
+    python onnx_embedded_nms.py embed best.onnx --config model_config.json
+    python onnx_embedded_nms.py check best.onnx best_nms.onnx --images val/images
+    python onnx_embedded_nms.py benchmark best.onnx best_nms.onnx --images val/images
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = Path("HazardHawk/androidApp/src/main/assets/models/litert/model_config.json")
+DEFAULT_SETTINGS = {"iou_threshold": 0.45, "score_threshold": 0.25, "max_detections": 300}
+OUTPUT_NAME = "detections"
+MIN_OPSET = 13
+METADATA_KEY = "embedded_nms"
+
+
+def nms_settings(config_path: Optional[str] = str(CONFIG_PATH)) -> Dict:
+    """IoU/score thresholds and max detections from model_config.json, with defaults"""
+    settings = dict(DEFAULT_SETTINGS)
+    if not config_path or not Path(config_path).exists():
+        logger.warning(f"⚠️  {config_path} not found; using default NMS settings {settings}")
+        return settings
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    configured = config.get("nms", {})
+    if "score_threshold" not in configured:
+        thresholds = [c["confidence_threshold"] for c in config.get("hazard_categories", [])
+                      if "confidence_threshold" in c]
+        thresholds += [r["confidence_threshold"] for r in config.get("ppe_requirements", {}).values()
+                       if "confidence_threshold" in r]
+        if thresholds:
+            settings["score_threshold"] = min(thresholds)
+    settings.update({k: configured[k] for k in DEFAULT_SETTINGS if k in configured})
+    settings["max_detections"] = int(settings["max_detections"])
+    return settings
+
+
+def embed_nms(model_path: str, output_path: Optional[str] = None, iou_threshold: float = 0.45,
+              score_threshold: float = 0.25, max_detections: int = 300) -> str:
+    """
+    Append decode + NMS + top-k to a raw YOLOv8 ONNX head (batch 1).
+
+    Returns:
+        Path of the end-to-end model
+    """
+    import numpy as np
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    output_path = output_path or str(Path(model_path).with_name(f"{Path(model_path).stem}_nms.onnx"))
+    model = onnx.load(model_path)
+    graph = model.graph
+    opset = next(o.version for o in model.opset_import if o.domain in ("", "ai.onnx"))
+    if opset < MIN_OPSET:
+        raise ValueError(f"{model_path} uses opset {opset}; embedding NMS needs opset >= {MIN_OPSET}")
+    if len(graph.output) != 1:
+        raise ValueError(f"{model_path} has {len(graph.output)} outputs; expected the raw head only")
+
+    raw = graph.output[0].name
+    dims = graph.output[0].type.tensor_type.shape.dim
+    if len(dims) != 3 or (dims[0].dim_value not in (0, 1)):
+        raise ValueError(f"{model_path}: expected a [1, 4+nc, N] head")
+
+    def const(name, values, dtype=np.int64):
+        graph.initializer.append(numpy_helper.from_array(np.asarray(values, dtype=dtype), f"nms_{name}"))
+        return f"nms_{name}"
+
+    def node(op, inputs, outputs=None, **attrs):
+        outputs = outputs or [f"nms_{op.lower()}_{len(graph.node)}"]
+        graph.node.append(helper.make_node(op, inputs, outputs, name=outputs[0], **attrs))
+        return outputs[0]
+
+    def reduce_max(x, axis):
+        if opset >= 18:
+            return node("ReduceMax", [x, const("reduce_axis", [axis])], keepdims=1)
+        return node("ReduceMax", [x], axes=[axis], keepdims=1)
+
+    head = node("Squeeze", [raw, const("axis0", [0])])                                      # [4+nc, N]
+    box_rows = node("Slice", [head, const("box_start", [0]), const("box_end", [4]), const("slice_axis", [0])])
+    score_rows = node("Slice", [head, const("score_start", [4]), const("score_end", [np.iinfo(np.int64).max]),
+                                const("slice_axis0", [0])])                                  # [nc, N]
+
+    # cxcywh -> xyxy as one [N, 4] x [4, 4] product
+    to_xyxy = const("to_xyxy", [[1, 0, 1, 0], [0, 1, 0, 1], [-0.5, 0, 0.5, 0], [0, -0.5, 0, 0.5]], np.float32)
+    boxes = node("MatMul", [node("Transpose", [box_rows], perm=[1, 0]), to_xyxy])          # [N, 4]
+
+    # Only the best class of each anchor may be selected
+    best = reduce_max(score_rows, 0)
+    mask = node("Cast", [node("Equal", [score_rows, best])], to=TensorProto.FLOAT)
+    scores = node("Mul", [score_rows, mask])                                                # [nc, N]
+
+    selected = node("NonMaxSuppression", [
+        node("Unsqueeze", [boxes, const("axis0_b", [0])]),
+        node("Unsqueeze", [scores, const("axis0_s", [0])]),
+        const("max_per_class", [max_detections]),
+        const("iou", [iou_threshold], np.float32),
+        const("score", [score_threshold], np.float32),
+    ], center_point_box=0)                                                                  # [K, 3]
+    classes = node("Gather", [selected, const("col_class", 1)], axis=1)                    # [K]
+    anchors = node("Gather", [selected, const("col_box", 2)], axis=1)                      # [K]
+
+    anchor_count = node("Gather", [node("Shape", [score_rows]), const("dim1", 1)])
+    flat = node("Add", [node("Mul", [classes, anchor_count]), anchors])
+    selected_scores = node("Gather", [node("Reshape", [scores, const("flatten", [-1])]), flat])
+    selected_boxes = node("Gather", [boxes, anchors], axis=0)
+
+    k = node("Min", [node("Shape", [selected_scores]), const("max_detections", [max_detections])])
+    top_scores, top_index = "nms_top_scores", "nms_top_index"
+    graph.node.append(helper.make_node("TopK", [selected_scores, k], [top_scores, top_index],
+                                       name="nms_topk", axis=0, largest=1, sorted=1))
+    top_boxes = node("Gather", [selected_boxes, top_index], axis=0)
+    top_classes = node("Cast", [node("Gather", [classes, top_index], axis=0)], to=TensorProto.FLOAT)
+    node("Concat", [
+        top_boxes,
+        node("Unsqueeze", [top_scores, const("axis1_s", [1])]),
+        node("Unsqueeze", [top_classes, const("axis1_c", [1])]),
+    ], [OUTPUT_NAME], axis=1)
+
+    del graph.output[:]
+    graph.output.append(helper.make_tensor_value_info(OUTPUT_NAME, TensorProto.FLOAT, ["num_detections", 6]))
+    settings = {"iou_threshold": iou_threshold, "score_threshold": score_threshold,
+                "max_detections": max_detections, "layout": "x1,y1,x2,y2,score,class"}
+    model.metadata_props.add(key=METADATA_KEY, value=json.dumps(settings))
+
+    onnx.checker.check_model(model)
+    onnx.save(model, output_path)
+    logger.info(f"✅ Embedded NMS (IoU {iou_threshold}, score {score_threshold}, max {max_detections}): {output_path}")
+    return output_path
+
+
+def _session(path: str, threads: Optional[int] = None):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+
+def _inputs(session, images_dir: Optional[str], count: int):
+    """Letterboxed NCHW float batches of real photos, or seeded noise"""
+    import numpy as np
+    from yolo_runtime import letterbox, load_image
+
+    _, _, height, width = session.get_inputs()[0].shape
+    arrays = []
+    if images_dir:
+        paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        arrays = [letterbox(load_image(str(p)), (height, width))[0] for p in paths[:count]]
+    if not arrays:
+        rng = np.random.default_rng(0)
+        arrays = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+    return [(a.astype(np.float32) / 255.0).transpose(2, 0, 1)[None] for a in arrays]
+
+
+def _host_nms(raw_output, settings: Dict):
+    from yolo_runtime import batched_nms, decode
+
+    boxes, scores, classes = decode(raw_output, settings["score_threshold"])
+    keep = batched_nms(boxes, scores, classes, settings["iou_threshold"], settings["max_detections"])
+    return boxes[keep], scores[keep], classes[keep]
+
+
+def check_parity(raw_path: str, e2e_path: str, images_dir: Optional[str] = None, count: int = 8,
+                 atol: float = 1e-3) -> Dict:
+    """Embedded vs host NMS on the same inputs: same boxes, scores and classes"""
+    import numpy as np
+
+    raw, e2e = _session(raw_path), _session(e2e_path)
+    settings = json.loads(e2e.get_modelmeta().custom_metadata_map[METADATA_KEY])
+    mismatched = []
+    total = 0
+    for index, batch in enumerate(_inputs(raw, images_dir, count)):
+        boxes, scores, classes = _host_nms(raw.run(None, {raw.get_inputs()[0].name: batch})[0], settings)
+        embedded = e2e.run(None, {e2e.get_inputs()[0].name: batch})[0]
+        total += len(scores)
+        host = np.concatenate([boxes, scores[:, None], classes[:, None].astype(np.float32)], axis=1)
+        same = host.shape == embedded.shape and np.allclose(
+            host[np.lexsort(host.T[::-1])], embedded[np.lexsort(embedded.T[::-1])], atol=atol)
+        if not same:
+            mismatched.append({"input": index, "host": len(host), "embedded": len(embedded)})
+    return {"inputs": count, "detections": total, "mismatched": mismatched, "settings": settings}
+
+
+def benchmark(raw_path: str, e2e_path: str, images_dir: Optional[str] = None, count: int = 8,
+              repeat: int = 20, threads: Optional[int] = None) -> Dict:
+    """End-to-end latency: raw head + host decode/NMS vs embedded NMS"""
+    raw, e2e = _session(raw_path, threads), _session(e2e_path, threads)
+    settings = json.loads(e2e.get_modelmeta().custom_metadata_map[METADATA_KEY])
+    inputs = _inputs(raw, images_dir, count)
+
+    def host(batch):
+        start = time.perf_counter()
+        output = raw.run(None, {raw.get_inputs()[0].name: batch})[0]
+        model_done = time.perf_counter()
+        _host_nms(output, settings)
+        return model_done - start, time.perf_counter() - model_done
+
+    def embedded(batch):
+        start = time.perf_counter()
+        e2e.run(None, {e2e.get_inputs()[0].name: batch})
+        return time.perf_counter() - start
+
+    for batch in inputs:  # warm-up
+        host(batch)
+        embedded(batch)
+    model_ms, nms_ms, e2e_ms = [], [], []
+    for _ in range(repeat):
+        for batch in inputs:
+            model_time, nms_time = host(batch)
+            model_ms.append(model_time * 1000)
+            nms_ms.append(nms_time * 1000)
+            e2e_ms.append(embedded(batch) * 1000)
+    return {
+        "host_model_ms": round(statistics.median(model_ms), 2),
+        "host_postprocess_ms": round(statistics.median(nms_ms), 2),
+        "host_total_ms": round(statistics.median([m + n for m, n in zip(model_ms, nms_ms)]), 2),
+        "embedded_total_ms": round(statistics.median(e2e_ms), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed decode + NMS in YOLOv8 ONNX exports")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    emb = subparsers.add_parser("embed", help="Write an end-to-end model with NMS in the graph")
+    emb.add_argument("model", help="Raw YOLOv8 ONNX export")
+    emb.add_argument("--output", help="Output path (default: <model>_nms.onnx)")
+    emb.add_argument("--config", default=str(CONFIG_PATH),
+                     help="model_config.json with an \"nms\" block / class thresholds")
+    emb.add_argument("--check", action="store_true", help="Verify parity with host NMS afterwards")
+
+    chk = subparsers.add_parser("check", help="Compare embedded and host NMS detections")
+    chk.add_argument("raw", help="Raw YOLOv8 ONNX export")
+    chk.add_argument("e2e", help="Model with embedded NMS")
+    chk.add_argument("--images", help="Directory of photos (default: random inputs)")
+    chk.add_argument("--count", type=int, default=8)
+
+    bench = subparsers.add_parser("benchmark", help="Compare end-to-end latency")
+    bench.add_argument("raw", help="Raw YOLOv8 ONNX export")
+    bench.add_argument("e2e", help="Model with embedded NMS")
+    bench.add_argument("--images", help="Directory of photos (default: random inputs)")
+    bench.add_argument("--count", type=int, default=8)
+    bench.add_argument("--threads", type=int, help="Intra-op threads")
+    bench.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "embed":
+            settings = nms_settings(args.config)
+            e2e = embed_nms(args.model, args.output, **settings)
+            if args.check:
+                result = check_parity(args.model, e2e)
+                if result["mismatched"]:
+                    raise RuntimeError(f"Embedded NMS differs from host NMS: {result['mismatched']}")
+                logger.info(f"✅ Parity with host NMS on {result['inputs']} inputs ({result['detections']} detections)")
+        elif args.command == "check":
+            result = check_parity(args.raw, args.e2e, args.images, args.count)
+            if result["mismatched"]:
+                logger.error(f"❌ {len(result['mismatched'])} of {result['inputs']} inputs differ: {result['mismatched']}")
+                sys.exit(1)
+            logger.info(f"✅ Parity with host NMS on {result['inputs']} inputs ({result['detections']} detections)")
+        else:
+            result = benchmark(args.raw, args.e2e, args.images, args.count, threads=args.threads)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                logger.info(f"🐢 Host: {result['host_model_ms']} ms model + {result['host_postprocess_ms']} ms "
+                            f"decode/NMS = {result['host_total_ms']} ms")
+                logger.info(f"🚀 Embedded: {result['embedded_total_ms']} ms end to end")
+    except SystemExit:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Embedded NMS {args.command} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Page-aligned external data layout for ONNX weights
+
+Rewrites a model's external data file (`model.onnx.data`) so the runtime can
+map the weights straight from storage:
+
+- Every tensor of at least one page starts on a page boundary (4 KB, 16 KB
+  or 64 KB; 16 KB-page Android devices need 16 KB). Smaller tensors are
+  packed at 64-byte alignment to keep SIMD loads aligned without wasting
+  a page each.
+- Tensors are written in order of first use by the graph (including If/Loop
+  subgraphs), so a decode pass touches the file front to back.
+
+The copy is streamed tensor by tensor, so multi-GB decoders never have to
+fit in memory. `verify` checks offsets, bounds, lengths and overlaps, and
+`benchmark` compares a buffered load (weights read into process memory)
+against a mapped load with an ORT session in fresh processes.
+
+ONNX Runtime's MatMul weight prepacking copies mapped weights into heap
+memory; the mapped benchmark therefore sets `session.disable_prepacking`
+unless --prepack is given.
+
+Usage:
+    python onnx_external_data.py align model.onnx --alignment 16384
+    python onnx_external_data.py verify model.onnx --alignment 16384
+    python onnx_external_data.py benchmark model.onnx
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+ALIGNMENTS = (4096, 16384, 65536)
+DEFAULT_ALIGNMENT = 16384
+SMALL_TENSOR_ALIGNMENT = 64
+COPY_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def _graphs(graph):
+    """Yield a graph and all of its If/Loop/Scan subgraphs"""
+    yield graph
+    for node in graph.node:
+        for attribute in node.attribute:
+            if attribute.g.ByteSize():
+                yield from _graphs(attribute.g)
+            for subgraph in attribute.graphs:
+                yield from _graphs(subgraph)
+
+
+def first_use_order(model) -> List[str]:
+    """
+    Initializer names in the order the graph first reads them.
+
+    Nodes are walked in their stored (topological) order, descending into
+    subgraphs at the node that owns them. Initializers that are never read
+    go last.
+    """
+    initializers = {t.name for g in _graphs(model.graph) for t in g.initializer}
+    order = {}
+
+    def visit(graph):
+        for node in graph.node:
+            for name in node.input:
+                if name in initializers and name not in order:
+                    order[name] = len(order)
+            for attribute in node.attribute:
+                if attribute.g.ByteSize():
+                    visit(attribute.g)
+                for subgraph in attribute.graphs:
+                    visit(subgraph)
+
+    visit(model.graph)
+    unused = [t.name for g in _graphs(model.graph) for t in g.initializer if t.name not in order]
+    return sorted(order, key=order.get) + unused
+
+
+def _external_info(tensor) -> Dict[str, str]:
+    return {entry.key: entry.value for entry in tensor.external_data}
+
+
+def _expected_bytes(tensor) -> Optional[int]:
+    """Raw byte length implied by dims and data type, or None if not fixed-width"""
+    from onnx import TensorProto, helper
+
+    count = 1
+    for dim in tensor.dims:
+        count *= dim
+    packed = {getattr(TensorProto, name) for name in ("INT4", "UINT4", "FLOAT4E2M1") if hasattr(TensorProto, name)}
+    if tensor.data_type in packed:
+        return (count + 1) // 2
+    if tensor.data_type == TensorProto.STRING:
+        return None
+    return count * helper.tensor_dtype_to_np_dtype(tensor.data_type).itemsize
+
+
+def _tensor_alignment(length: int, alignment: int) -> int:
+    return alignment if length >= alignment else SMALL_TENSOR_ALIGNMENT
+
+
+def align_external_data(model_path: str, output_path: Optional[str] = None,
+                        alignment: int = DEFAULT_ALIGNMENT, size_threshold: int = 1024) -> Dict[str, int]:
+    """
+    Rewrite a model's weights into one aligned, first-use ordered data file.
+
+    Args:
+        model_path: Source model (external data, inline weights or a mix)
+        output_path: Output model; defaults to rewriting model_path in place.
+            The data file is written next to it as '<name>.data'
+        alignment: Page alignment for tensors of at least one page
+        size_threshold: Tensors smaller than this stay inline in the graph
+
+    Returns:
+        Layout statistics: tensors, data_bytes, padding_bytes, file_bytes
+    """
+    import onnx
+    from onnx import TensorProto, numpy_helper
+
+    if alignment % SMALL_TENSOR_ALIGNMENT:
+        raise ValueError(f"Alignment must be a multiple of {SMALL_TENSOR_ALIGNMENT} bytes")
+
+    model_path = Path(model_path)
+    output_path = Path(output_path) if output_path else model_path
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    data_name = output_path.name + ".data"
+    tmp_data = output_path.with_name(data_name + ".tmp")
+    tmp_model = output_path.with_name(output_path.name + ".tmp")
+
+    model = onnx.load(str(model_path), load_external_data=False)
+    tensors = {t.name: t for g in _graphs(model.graph) for t in g.initializer}
+
+    stats = {"tensors": 0, "data_bytes": 0, "padding_bytes": 0}
+    offset = 0
+    sources = {}
+    try:
+        with open(tmp_data, "wb") as out:
+            for name in first_use_order(model):
+                tensor = tensors[name]
+                if tensor.data_type == TensorProto.STRING:
+                    continue
+
+                external = tensor.data_location == TensorProto.EXTERNAL
+                if external:
+                    info = _external_info(tensor)
+                    length = int(info.get("length") or _expected_bytes(tensor))
+                elif tensor.HasField("raw_data"):
+                    length = len(tensor.raw_data)
+                else:
+                    # Typed fields (float_data, int32_data, ...): normalize to raw_data first
+                    tensor.CopyFrom(numpy_helper.from_array(numpy_helper.to_array(tensor), name))
+                    length = len(tensor.raw_data)
+
+                # Shape-like int tensors must stay inline for ORT's shape inference
+                shape_like = tensor.data_type in (TensorProto.INT64, TensorProto.INT32) and len(tensor.dims) <= 1
+                if length < size_threshold or (shape_like and length < SMALL_TENSOR_ALIGNMENT):
+                    if external:
+                        with open(model_path.parent / info["location"], "rb") as f:
+                            f.seek(int(info.get("offset", 0)))
+                            tensor.raw_data = f.read(length)
+                        del tensor.external_data[:]
+                        tensor.data_location = TensorProto.DEFAULT
+                    continue
+
+                padding = -offset % _tensor_alignment(length, alignment)
+                out.write(b"\0" * padding)
+                offset += padding
+                stats["padding_bytes"] += padding
+
+                if external:
+                    location = model_path.parent / info["location"]
+                    if location not in sources:
+                        sources[location] = open(location, "rb")
+                    source = sources[location]
+                    source.seek(int(info.get("offset", 0)))
+                    remaining = length
+                    while remaining:
+                        chunk = source.read(min(COPY_CHUNK_BYTES, remaining))
+                        if not chunk:
+                            raise ValueError(f"{name}: external data ends before {length} bytes")
+                        out.write(chunk)
+                        remaining -= len(chunk)
+                else:
+                    out.write(tensor.raw_data)
+                    tensor.ClearField("raw_data")
+
+                del tensor.external_data[:]
+                for key, value in (("location", data_name), ("offset", str(offset)), ("length", str(length))):
+                    entry = tensor.external_data.add()
+                    entry.key = key
+                    entry.value = value
+                tensor.data_location = TensorProto.EXTERNAL
+
+                offset += length
+                stats["tensors"] += 1
+                stats["data_bytes"] += length
+            out.flush()
+            os.fsync(out.fileno())
+    finally:
+        for source in sources.values():
+            source.close()
+
+    stale = {location.name for location in sources} - {data_name}
+    if model_path == output_path and stale:
+        logger.info(f"Previous data file(s) no longer referenced by {output_path.name}: {', '.join(sorted(stale))}")
+
+    onnx.save(model, str(tmp_model))
+    # Data first: the old model keeps working until its replacement lands
+    os.replace(tmp_data, output_path.with_name(data_name))
+    os.replace(tmp_model, output_path)
+
+    stats["file_bytes"] = offset
+    return stats
+
+
+def verify_layout(model_path: str, alignment: int = DEFAULT_ALIGNMENT) -> List[str]:
+    """
+    Check every external tensor: alignment, bounds, length and overlaps.
+
+    Returns:
+        List of problems (empty when the layout is valid)
+    """
+    import onnx
+    from onnx import TensorProto
+
+    model_path = Path(model_path)
+    model = onnx.load(str(model_path), load_external_data=False)
+    problems = []
+    extents = {}
+
+    for graph in _graphs(model.graph):
+        for tensor in graph.initializer:
+            if tensor.data_location != TensorProto.EXTERNAL:
+                continue
+            info = _external_info(tensor)
+            location = model_path.parent / info.get("location", "")
+            if not location.is_file():
+                problems.append(f"{tensor.name}: data file {info.get('location')} not found")
+                continue
+            offset = int(info.get("offset", 0))
+            expected = _expected_bytes(tensor)
+            length = int(info.get("length", expected or 0))
+
+            if expected is not None and length != expected:
+                problems.append(f"{tensor.name}: length {length} != {expected} bytes for its shape")
+            if offset + length > location.stat().st_size:
+                problems.append(f"{tensor.name}: [{offset}, {offset + length}) past end of {location.name}")
+            required = _tensor_alignment(length, alignment)
+            if offset % required:
+                problems.append(f"{tensor.name}: offset {offset} not aligned to {required} bytes")
+            extents.setdefault(location.name, []).append((offset, offset + length, tensor.name))
+
+    for location, spans in extents.items():
+        spans.sort()
+        for (_, end, name), (start, _, following) in zip(spans, spans[1:]):
+            if start < end:
+                problems.append(f"{name} overlaps {following} in {location}")
+    return problems
+
+
+def file_order_matches_first_use(model_path: str) -> bool:
+    """True if external tensors are stored in first-use order"""
+    import onnx
+
+    model = onnx.load(str(model_path), load_external_data=False)
+    tensors = {t.name: t for g in _graphs(model.graph) for t in g.initializer if t.external_data}
+    offsets = [int(_external_info(tensors[n]).get("offset", 0)) for n in first_use_order(model) if n in tensors]
+    return offsets == sorted(offsets)
+
+
+def _proc_status() -> Dict[str, float]:
+    """Resident memory counters in MB (Linux)"""
+    status = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmHWM", "VmRSS", "RssAnon", "RssFile"):
+                status[key] = round(int(value.split()[0]) / 1024, 1)
+    return status
+
+
+def measure_load(model_path: str, mode: str, prepack: bool = False) -> Dict[str, float]:
+    """
+    Load a model one way and run it once, in-process (see benchmark()).
+
+    Modes:
+        buffered: read the graph and all weights into memory, build the
+                  session from bytes (weights end up in anonymous memory)
+        mmap:     build the session from the path; ORT maps the data file
+    """
+    import onnx
+    import onnxruntime as ort
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from ort_format import dummy_feeds
+
+    options = ort.SessionOptions()
+    if not prepack:
+        options.add_session_config_entry("session.disable_prepacking", "1")
+
+    start = time.perf_counter()
+    if mode == "buffered":
+        model_bytes = onnx.load(model_path).SerializeToString()
+        session = ort.InferenceSession(model_bytes, options, providers=["CPUExecutionProvider"])
+        del model_bytes
+    else:
+        session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    load_ms = (time.perf_counter() - start) * 1000
+
+    feeds = dummy_feeds(session)
+    start = time.perf_counter()
+    session.run(None, feeds)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    return {"mode": mode, "load_ms": round(load_ms, 2), "first_inference_ms": round(first_ms, 2),
+            **_proc_status()}
+
+
+def benchmark(model_path: str, modes=("buffered", "mmap"), prepack: bool = False,
+              timeout: int = 600) -> List[Dict[str, float]]:
+    """Measure each load mode in a fresh process"""
+    results = []
+    for mode in modes:
+        command = [sys.executable, __file__, "measure", str(model_path), "--mode", mode]
+        if prepack:
+            command.append("--prepack")
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+        lines = [l for l in completed.stdout.splitlines() if l.startswith("{")]
+        if completed.returncode != 0 or not lines:
+            stderr = completed.stderr.strip().splitlines()
+            results.append({"mode": mode, "error": stderr[-1] if stderr else "no output"})
+        else:
+            results.append(json.loads(lines[-1]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page-aligned external data layout for ONNX weights")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    align = subparsers.add_parser("align", help="Rewrite external data aligned and in first-use order")
+    align.add_argument("model")
+    align.add_argument("--output", help="Output model path (default: in place)")
+    align.add_argument("--alignment", type=int, choices=ALIGNMENTS, default=DEFAULT_ALIGNMENT)
+    align.add_argument("--size-threshold", type=int, default=1024, help="Keep smaller tensors inline")
+
+    verify = subparsers.add_parser("verify", help="Check external data offsets")
+    verify.add_argument("model")
+    verify.add_argument("--alignment", type=int, choices=ALIGNMENTS, default=DEFAULT_ALIGNMENT)
+
+    bench = subparsers.add_parser("benchmark", help="Buffered vs mapped load time and RSS (Linux)")
+    bench.add_argument("model")
+    bench.add_argument("--prepack", action="store_true", help="Keep ORT weight prepacking enabled")
+    bench.add_argument("--json", help="Also write results to this file")
+
+    measure = subparsers.add_parser("measure", help=argparse.SUPPRESS)
+    measure.add_argument("model")
+    measure.add_argument("--mode", choices=["buffered", "mmap"], required=True)
+    measure.add_argument("--prepack", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.command == "measure":
+        print(json.dumps(measure_load(args.model, args.mode, args.prepack)))
+        return
+
+    try:
+        if args.command == "align":
+            stats = align_external_data(args.model, args.output, args.alignment, args.size_threshold)
+            output = args.output or args.model
+            logger.info(f"✅ {stats['tensors']} tensors, {stats['data_bytes'] / (1024 * 1024):.1f} MB "
+                        f"→ {output}.data")
+            logger.info(f"📐 {args.alignment // 1024} KB alignment: {stats['padding_bytes'] / 1024:.1f} KB padding "
+                        f"({stats['padding_bytes'] / max(stats['file_bytes'], 1) * 100:.2f}%)")
+            problems = verify_layout(output, args.alignment)
+        elif args.command == "verify":
+            problems = verify_layout(args.model, args.alignment)
+            if not file_order_matches_first_use(args.model):
+                logger.warning("⚠️  Tensors are not stored in first-use order")
+        else:
+            if not sys.platform.startswith("linux"):
+                raise RuntimeError("RSS measurement reads /proc and needs Linux")
+            results = benchmark(args.model, prepack=args.prepack)
+            logger.info(f"{'mode':<10} {'load':>10} {'first':>10} {'peak RSS':>10} {'anon':>10} {'file':>10}")
+            for r in results:
+                if "error" in r:
+                    logger.info(f"{r['mode']:<10} ❌ {r['error']}")
+                    continue
+                logger.info(f"{r['mode']:<10} {r['load_ms']:>8.1f}ms {r['first_inference_ms']:>8.1f}ms "
+                            f"{r['VmHWM']:>8.1f}MB {r['RssAnon']:>8.1f}MB {r['RssFile']:>8.1f}MB")
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump(results, f, indent=2)
+            problems = []
+
+        for problem in problems:
+            logger.error(f"❌ {problem}")
+        if problems:
+            sys.exit(1)
+        if args.command != "benchmark":
+            logger.info("✅ External data layout verified")
+    except Exception as e:
+        logger.error(f"❌ {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - ONNX Runtime causal LM generation and benchmarking
+
+Greedy generation on top of onnxruntime for the decoder graphs we export or
+download: plain `input_ids/attention_mask -> logits` graphs (as produced by
+convert_gemma_to_onnx.py) and KV-cache graphs with `past_key_values.*`
+inputs and `present.*` outputs (Optimum / onnx-community exports).
+
+Speculative decoding pairs the target decoder with a small draft decoder
+sharing its tokenizer (e.g. a truncated-layer Gemma from
+`convert_gemma_to_onnx.py --draft-layers`). The draft proposes k tokens,
+the target scores them all in one forward pass, and the longest prefix
+matching the target's own greedy choice is accepted plus one target token.
+The output is identical to plain greedy decoding with the target.
+
+The benchmark command is meant to be run in a fresh process per model so
+that peak RSS reflects that model alone:
+
+Usage:
+    python onnx_generation.py benchmark model.onnx --prompt-tokens 64 --new-tokens 16 --json
+    python onnx_generation.py speculative target.onnx draft.onnx --k 2,4,6
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+ORT_TYPES = {
+    "tensor(int64)": "int64",
+    "tensor(int32)": "int32",
+    "tensor(float)": "float32",
+    "tensor(float16)": "float16",
+    "tensor(bool)": "bool",
+}
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None if unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class OrtCausalLM:
+    """Greedy decoder over an ONNX causal LM graph, with or without KV cache."""
+
+    def __init__(self, model_path: str, providers: Optional[List[str]] = None,
+                 intra_op_threads: Optional[int] = None):
+        """
+        Load the graph into an inference session.
+
+        Args:
+            model_path: Path to the ONNX decoder
+            providers: Execution providers (CPU by default)
+            intra_op_threads: Optional intra-op thread count
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+
+        self.model_path = str(model_path)
+        self.session = ort.InferenceSession(
+            self.model_path, options, providers=providers or ["CPUExecutionProvider"]
+        )
+        self.inputs = {i.name: i for i in self.session.get_inputs()}
+        self.output_names = [o.name for o in self.session.get_outputs()]
+        self.logits_name = "logits" if "logits" in self.output_names else self.output_names[0]
+        self.past_names = [n for n in self.inputs if n.startswith(("past_key_values", "past."))]
+        self.present_names = {
+            name: name.replace("past_key_values", "present").replace("past.", "present.")
+            for name in self.past_names
+        }
+
+    @property
+    def use_cache(self) -> bool:
+        return bool(self.past_names)
+
+    def vocab_size(self) -> int:
+        """Logits dimension; probed with a one-token forward pass when symbolic"""
+        import numpy as np
+
+        size = next(o.shape[-1] for o in self.session.get_outputs() if o.name == self.logits_name)
+        if not isinstance(size, int):
+            size = self.forward(np.zeros((1, 1), dtype=np.int64))[0].shape[-1]
+        return size
+
+    def _empty_past(self) -> Dict[str, "np.ndarray"]:
+        import numpy as np
+
+        past = {}
+        for name in self.past_names:
+            node = self.inputs[name]
+            shape = []
+            for axis, dim in enumerate(node.shape):
+                if isinstance(dim, int):
+                    shape.append(dim)
+                else:
+                    # Symbolic dims: batch -> 1, past sequence length -> 0
+                    shape.append(1 if axis == 0 or "batch" in str(dim) else 0)
+            past[name] = np.zeros(shape, dtype=ORT_TYPES.get(node.type, "float32"))
+        return past
+
+    def forward(self, input_ids: "np.ndarray", past: Optional[Dict[str, "np.ndarray"]] = None,
+                past_length: int = 0) -> Tuple["np.ndarray", Dict[str, "np.ndarray"]]:
+        """
+        Run one forward pass.
+
+        Args:
+            input_ids: Token ids of shape [1, T]
+            past: KV cache from the previous step (cache graphs only)
+            past_length: Number of tokens already in the cache
+
+        Returns:
+            Tuple of (logits [1, T, vocab], present KV cache)
+        """
+        import numpy as np
+
+        length = input_ids.shape[1]
+        feeds = {"input_ids": input_ids.astype(ORT_TYPES.get(self.inputs["input_ids"].type, "int64"))}
+        if "attention_mask" in self.inputs:
+            dtype = ORT_TYPES.get(self.inputs["attention_mask"].type, "int64")
+            feeds["attention_mask"] = np.ones((1, past_length + length), dtype=dtype)
+        if "position_ids" in self.inputs:
+            dtype = ORT_TYPES.get(self.inputs["position_ids"].type, "int64")
+            feeds["position_ids"] = np.arange(past_length, past_length + length, dtype=dtype)[None, :]
+        if "use_cache_branch" in self.inputs:
+            feeds["use_cache_branch"] = np.array([past is not None and past_length > 0])
+        if self.use_cache:
+            feeds.update(past if past is not None else self._empty_past())
+
+        outputs = dict(zip(self.output_names, self.session.run(None, feeds)))
+        present = {name: outputs[present] for name, present in self.present_names.items() if present in outputs}
+        return outputs[self.logits_name], present
+
+    def logits(self, token_ids: List[int]) -> "np.ndarray":
+        """Full-sequence logits [T, vocab] for a token list (no cache reuse)."""
+        import numpy as np
+
+        logits, _ = self.forward(np.array([token_ids], dtype=np.int64))
+        return logits[0]
+
+    def greedy_generate(self, prompt_ids: List[int], max_new_tokens: int,
+                        eos_token_id: Optional[int] = None) -> Tuple[List[int], Dict[str, float]]:
+        """
+        Greedy decode.
+
+        Args:
+            prompt_ids: Prompt token ids
+            max_new_tokens: Number of tokens to generate
+            eos_token_id: Optional id that stops generation
+
+        Returns:
+            Tuple of (generated token ids, timings with prefill_ms and decode_ms)
+        """
+        import numpy as np
+
+        generated: List[int] = []
+        start = time.perf_counter()
+        logits, past = self.forward(np.array([prompt_ids], dtype=np.int64))
+        prefill_ms = (time.perf_counter() - start) * 1000
+
+        decode_start = time.perf_counter()
+        sequence = list(prompt_ids)
+        while len(generated) < max_new_tokens:
+            token = int(np.argmax(logits[0, -1]))
+            generated.append(token)
+            sequence.append(token)
+            if token == eos_token_id or len(generated) == max_new_tokens:
+                break
+            if self.use_cache:
+                logits, past = self.forward(
+                    np.array([[token]], dtype=np.int64), past, past_length=len(sequence) - 1
+                )
+            else:
+                logits, _ = self.forward(np.array([sequence], dtype=np.int64))
+        decode_ms = (time.perf_counter() - decode_start) * 1000
+
+        return generated, {"prefill_ms": prefill_ms, "decode_ms": decode_ms}
+
+
+def truncate_cache(past: Dict[str, "np.ndarray"], length: int, axis: int = 2) -> Dict[str, "np.ndarray"]:
+    """Drop cache entries past `length` tokens (KV tensors are [batch, heads, seq, head_dim])"""
+    return {name: value.take(range(length), axis=axis) if value.shape[axis] > length else value
+            for name, value in past.items()}
+
+
+class _CacheState:
+    """A decoder plus the part of the sequence its KV cache already covers."""
+
+    def __init__(self, model: OrtCausalLM):
+        self.model = model
+        self.past = None
+        self.cached = 0
+
+    def feed(self, sequence: List[int], extra: List[int]) -> "np.ndarray":
+        """
+        Run the uncached tail of `sequence` plus `extra` tokens.
+
+        Returns logits [T, vocab] for exactly those tokens.
+        """
+        import numpy as np
+
+        tokens = sequence[self.cached:] + extra
+        if self.model.use_cache:
+            logits, self.past = self.model.forward(np.array([tokens], dtype=np.int64), self.past, self.cached)
+            logits = logits[0]
+        else:
+            logits = self.model.logits(sequence + extra)[-len(tokens):]
+        self.cached += len(tokens)
+        return logits
+
+    def rollback(self, length: int) -> None:
+        """Forget everything after the first `length` tokens"""
+        if self.cached > length:
+            if self.model.use_cache:
+                self.past = truncate_cache(self.past, length)
+            self.cached = length
+
+
+def speculative_generate(target: OrtCausalLM, draft: OrtCausalLM, prompt_ids: List[int],
+                         max_new_tokens: int, k: int = 4,
+                         eos_token_id: Optional[int] = None) -> Tuple[List[int], Dict[str, float]]:
+    """
+    Greedy decoding with draft proposals verified by the target.
+
+    Args:
+        target: The model whose greedy output is reproduced
+        draft: Cheaper model with the same vocabulary
+        prompt_ids: Prompt token ids
+        max_new_tokens: Number of tokens to generate
+        k: Draft tokens proposed per target pass
+        eos_token_id: Optional id that stops generation
+
+    Returns:
+        Tuple of (generated token ids, stats with proposed/accepted counts,
+        target_passes and timings)
+    """
+    import numpy as np
+
+    target_state, draft_state = _CacheState(target), _CacheState(draft)
+    sequence = list(prompt_ids)
+    generated: List[int] = []
+    stats = {"proposed": 0, "accepted": 0, "target_passes": 0, "draft_ms": 0.0, "target_ms": 0.0}
+
+    start = time.perf_counter()
+    while len(generated) < max_new_tokens:
+        # The target must still see the last token before it can predict the next
+        if target_state.cached == len(sequence):
+            target_state.rollback(len(sequence) - 1)
+        draft_state.rollback(min(draft_state.cached, len(sequence) - 1))
+
+        draft_start = time.perf_counter()
+        proposal: List[int] = []
+        budget = min(k, max_new_tokens - len(generated) - 1)
+        while len(proposal) < budget:
+            logits = draft_state.feed(sequence + proposal[:-1], proposal[-1:])
+            proposal.append(int(np.argmax(logits[-1])))
+            if proposal[-1] == eos_token_id:
+                break
+        stats["draft_ms"] += (time.perf_counter() - draft_start) * 1000
+
+        target_start = time.perf_counter()
+        pending = len(sequence) - target_state.cached
+        logits = target_state.feed(sequence, proposal)[pending - 1:]
+        stats["target_ms"] += (time.perf_counter() - target_start) * 1000
+        stats["target_passes"] += 1
+
+        # logits[i] is the target's prediction after proposal[:i]
+        choices = np.argmax(logits, axis=-1)
+        accepted = 0
+        while accepted < len(proposal) and choices[accepted] == proposal[accepted]:
+            accepted += 1
+        stats["proposed"] += len(proposal)
+        stats["accepted"] += accepted
+
+        new_tokens = proposal[:accepted] + [int(choices[accepted])]
+        target_state.rollback(len(sequence) + accepted)
+        draft_state.rollback(len(sequence) + accepted)
+        for token in new_tokens[:max_new_tokens - len(generated)]:
+            generated.append(token)
+            sequence.append(token)
+            if token == eos_token_id:
+                stats["total_ms"] = (time.perf_counter() - start) * 1000
+                return generated, stats
+
+    stats["total_ms"] = (time.perf_counter() - start) * 1000
+    return generated, stats
+
+
+def random_prompt(rng, model: OrtCausalLM, length: int) -> List[int]:
+    """Random prompt ids inside the model's vocabulary (pruned vocabularies can be far below 1000)"""
+    high = min(model.vocab_size(), 1000)
+    return rng.integers(2 if high > 2 else 0, high, size=length).tolist()
+
+
+def benchmark_speculative(target_path: str, draft_path: str, ks: List[int], prompt_tokens: int = 64,
+                          new_tokens: int = 32, prompts: int = 3,
+                          intra_op_threads: Optional[int] = None) -> List[Dict[str, float]]:
+    """
+    Plain greedy decoding vs speculative decoding for each k.
+
+    Reports acceptance rate, tokens/s and whether the output matched plain
+    greedy decoding exactly on every prompt.
+    """
+    import numpy as np
+
+    target = OrtCausalLM(target_path, intra_op_threads=intra_op_threads)
+    draft = OrtCausalLM(draft_path, intra_op_threads=intra_op_threads)
+    rng = np.random.default_rng(0)
+    prompt_list = [random_prompt(rng, target, prompt_tokens) for _ in range(prompts)]
+
+    baseline = []
+    greedy_ms = 0.0
+    for prompt in prompt_list:
+        start = time.perf_counter()
+        tokens, _ = target.greedy_generate(prompt, new_tokens)
+        greedy_ms += (time.perf_counter() - start) * 1000
+        baseline.append(tokens)
+    results = [{"mode": "greedy", "tokens_per_second": round(sum(map(len, baseline)) / (greedy_ms / 1000), 2)}]
+
+    for k in ks:
+        total_ms = 0.0
+        proposed = accepted = passes = produced = 0
+        exact = True
+        for prompt, expected in zip(prompt_list, baseline):
+            tokens, stats = speculative_generate(target, draft, prompt, new_tokens, k)
+            total_ms += stats["total_ms"]
+            proposed += stats["proposed"]
+            accepted += stats["accepted"]
+            passes += stats["target_passes"]
+            produced += len(tokens)
+            exact &= tokens == expected
+        results.append({
+            "mode": f"speculative k={k}",
+            "tokens_per_second": round(produced / (total_ms / 1000), 2),
+            "acceptance_rate": round(accepted / proposed, 3) if proposed else 0.0,
+            "tokens_per_target_pass": round(produced / passes, 2) if passes else 0.0,
+            "exact_match": exact,
+        })
+    return results
+
+
+def benchmark(model_path: str, prompt_tokens: int = 64, new_tokens: int = 16,
+              intra_op_threads: Optional[int] = None) -> Dict[str, float]:
+    """
+    Measure load time, prefill latency, decode throughput and peak RSS.
+
+    `latency_ms` is the wall time to prefill the prompt and generate all
+    new tokens, i.e. the cost of one short request.
+
+    Args:
+        model_path: ONNX decoder path
+        prompt_tokens: Prompt length
+        new_tokens: Tokens to generate
+        intra_op_threads: Optional intra-op thread count
+
+    Returns:
+        Dictionary of measurements
+    """
+    import numpy as np
+
+    start = time.perf_counter()
+    model = OrtCausalLM(model_path, intra_op_threads=intra_op_threads)
+    load_ms = (time.perf_counter() - start) * 1000
+
+    prompt = random_prompt(np.random.default_rng(0), model, prompt_tokens)
+    generated, timings = model.greedy_generate(prompt, new_tokens)
+
+    decode_steps = max(len(generated) - 1, 1)
+    latency_ms = timings["prefill_ms"] + timings["decode_ms"]
+    return {
+        "model": str(model_path),
+        "kv_cache": model.use_cache,
+        "load_ms": round(load_ms, 2),
+        "prefill_ms": round(timings["prefill_ms"], 2),
+        "decode_ms_per_token": round(timings["decode_ms"] / decode_steps, 2),
+        "tokens_per_second": round(len(generated) / (latency_ms / 1000), 2) if latency_ms else 0.0,
+        "latency_ms": round(latency_ms, 2),
+        "peak_rss_mb": round(peak_rss_mb() or 0.0, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ONNX Runtime causal LM tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bench = subparsers.add_parser("benchmark", help="Benchmark greedy generation for one model")
+    bench.add_argument("model", help="ONNX decoder path")
+    bench.add_argument("--prompt-tokens", type=int, default=64)
+    bench.add_argument("--new-tokens", type=int, default=16)
+    bench.add_argument("--threads", type=int, help="Intra-op threads")
+    bench.add_argument("--json", action="store_true", help="Print a single JSON line")
+
+    spec = subparsers.add_parser("speculative", help="Compare speculative decoding with plain greedy decoding")
+    spec.add_argument("target", help="Target ONNX decoder")
+    spec.add_argument("draft", help="Draft ONNX decoder (same tokenizer)")
+    spec.add_argument("--k", default="4", help="Draft tokens per step, comma separated to sweep")
+    spec.add_argument("--prompt-tokens", type=int, default=64)
+    spec.add_argument("--new-tokens", type=int, default=32)
+    spec.add_argument("--prompts", type=int, default=3)
+    spec.add_argument("--threads", type=int, help="Intra-op threads")
+
+    args = parser.parse_args()
+
+    if args.command == "speculative":
+        try:
+            results = benchmark_speculative(args.target, args.draft, [int(k) for k in args.k.split(",")],
+                                            args.prompt_tokens, args.new_tokens, args.prompts, args.threads)
+        except Exception as e:
+            logger.error(f"❌ Speculative benchmark failed: {str(e)}")
+            sys.exit(1)
+        baseline = results[0]["tokens_per_second"]
+        for r in results:
+            line = f"{r['mode']:<18} {r['tokens_per_second']:>8.1f} tok/s ({r['tokens_per_second'] / baseline:.2f}x)"
+            if "acceptance_rate" in r:
+                line += (f", acceptance {r['acceptance_rate'] * 100:.0f}%, "
+                         f"{r['tokens_per_target_pass']:.2f} tokens/target pass, "
+                         f"{'✅ exact match' if r['exact_match'] else '❌ differs from greedy'}")
+            logger.info(line)
+        if not all(r.get("exact_match", True) for r in results):
+            sys.exit(1)
+        return
+
+    try:
+        result = benchmark(args.model, args.prompt_tokens, args.new_tokens, args.threads)
+    except Exception as e:
+        if args.json:
+            print(json.dumps({"model": args.model, "error": str(e)}))
+        logger.error(f"❌ Benchmark failed: {str(e)}")
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        for key, value in result.items():
+            logger.info(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Sequence-length bucketed static-shape decoder graphs
+
+`convert_to_onnx` exports dynamic `batch_size`/`sequence_length` axes, which
+keeps ONNX Runtime and the mobile runtimes from planning memory ahead of
+time and from folding shape-dependent ops. This tool derives a family of
+static graphs from one exported decoder:
+
+- one prefill graph per bucket (e.g. 64/128/256/512 tokens, batch 1, empty
+  KV cache); prompts are right-padded to the smallest bucket that fits
+- a 1-token decode graph for KV-cache decoders (the past length stays
+  dynamic, since it grows every step)
+- the original dynamic graph, kept as the fallback for longer prompts
+
+All graphs reference the same external weights file (written once, page
+aligned, see onnx_external_data.py), so the family costs a few KB of graph
+protobuf per bucket rather than a copy of the weights. The layout is written
+to `<name>.buckets.json` and, with --manifest-id, into the model manifest.
+
+Usage:
+    python onnx_static_shapes.py export model.onnx --output-dir buckets --buckets 64,128,256,512
+    python onnx_static_shapes.py benchmark buckets/model.buckets.json --lengths 20,64,200
+"""
+
+import argparse
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (64, 128, 256, 512)
+ORT_TYPES = {
+    "tensor(int64)": "int64",
+    "tensor(int32)": "int32",
+    "tensor(float)": "float32",
+    "tensor(float16)": "float16",
+    "tensor(bool)": "bool",
+}
+
+
+def resolve_dim(name: str, sequence: int, past: Optional[int],
+                overrides: Optional[Dict[str, int]] = None) -> Optional[int]:
+    """
+    Value for a symbolic dimension, or None to leave it dynamic.
+
+    Understands the names used by our exporter (batch_size, sequence_length)
+    and by Optimum (past_sequence_length, total_sequence_length and
+    expressions such as 'past_sequence_length + 1').
+    """
+    if overrides and name in overrides:
+        return overrides[name]
+    lowered = name.lower()
+    if "batch" in lowered:
+        return 1
+    if "total" in lowered or ("past" in lowered and "+" in lowered):
+        return None if past is None else past + sequence
+    if "past" in lowered:
+        return past
+    if "seq" in lowered:
+        return sequence
+    if re.fullmatch(r"[\w\s+\-*]+", name):
+        raise ValueError(f"Don't know how to fix dimension '{name}'; pass --dim {name}=VALUE")
+    return None
+
+
+def make_static(model, sequence: int, past: Optional[int], overrides: Optional[Dict[str, int]] = None):
+    """
+    Copy of a decoder graph with fixed input/output dims.
+
+    Args:
+        model: ModelProto loaded without external data
+        sequence: Tokens per call
+        past: Fixed KV-cache length, or None to keep it dynamic
+
+    Returns:
+        The static ModelProto (weights still reference the shared data file)
+    """
+    import onnx
+
+    static = onnx.ModelProto()
+    static.CopyFrom(model)
+    for value in list(static.graph.input) + list(static.graph.output):
+        for dim in value.type.tensor_type.shape.dim:
+            if dim.dim_param:
+                fixed = resolve_dim(dim.dim_param, sequence, past, overrides)
+                if fixed is not None:
+                    dim.dim_value = fixed
+
+    # Intermediate shapes were inferred for the dynamic graph; recompute them
+    del static.graph.value_info[:]
+    try:
+        static = onnx.shape_inference.infer_shapes(static, data_prop=True)
+    except Exception as e:
+        logger.warning(f"Shape inference failed for the {sequence}-token graph: {str(e)}")
+    return static
+
+
+def is_kv_cache_graph(model) -> bool:
+    return any(i.name.startswith(("past_key_values", "past.")) for i in model.graph.input)
+
+
+def export_buckets(model_path: str, output_dir: str, buckets=DEFAULT_BUCKETS, decode: bool = True,
+                   alignment: int = 16384, overrides: Optional[Dict[str, int]] = None) -> Dict:
+    """
+    Write the bucketed graph family and its layout file.
+
+    Args:
+        model_path: Dynamic decoder exported by convert_gemma_to_onnx.py or Optimum
+        output_dir: Destination for the graphs, shared weights and layout
+        buckets: Prefill lengths
+        decode: Also write the 1-token decode graph (KV-cache decoders only)
+        alignment: Page alignment of the shared weights file
+        overrides: Values for symbolic dims the resolver does not know
+
+    Returns:
+        The layout: {weights, fallback, decode, buckets: [{max_length, graph}]}
+    """
+    import onnx
+    from onnx_external_data import align_external_data
+
+    model_path = Path(model_path)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stem = model_path.stem
+
+    # The dynamic graph doubles as the fallback and as the owner of the shared weights
+    fallback = output_dir / f"{stem}.onnx"
+    stats = align_external_data(str(model_path), str(fallback), alignment)
+    logger.info(f"📦 Shared weights: {fallback.name}.data ({stats['data_bytes'] / (1024 * 1024):.1f} MB)")
+
+    model = onnx.load(str(fallback), load_external_data=False)
+    kv_cache = is_kv_cache_graph(model)
+
+    layout = {
+        "source": model_path.name,
+        "weights": f"{fallback.name}.data",
+        "fallback": fallback.name,
+        "kv_cache": kv_cache,
+        "decode": None,
+        "buckets": [],
+    }
+    for length in sorted(set(buckets)):
+        graph = output_dir / f"{stem}.seq{length}.onnx"
+        onnx.save(make_static(model, length, 0 if kv_cache else None, overrides), str(graph))
+        layout["buckets"].append({"max_length": length, "graph": graph.name})
+        logger.info(f"✅ Prefill bucket {length}: {graph.name} ({graph.stat().st_size / 1024:.1f} KB)")
+
+    if decode and kv_cache:
+        graph = output_dir / f"{stem}.decode.onnx"
+        onnx.save(make_static(model, 1, None, overrides), str(graph))
+        layout["decode"] = graph.name
+        logger.info(f"✅ Decode step: {graph.name}")
+    elif decode:
+        logger.info("⏭️  No KV cache inputs: decode steps reuse the prefill buckets")
+
+    with open(output_dir / f"{stem}.buckets.json", "w") as f:
+        json.dump(layout, f, indent=2)
+    return layout
+
+
+def record_in_manifest(layout: Dict, layout_path: str, model_id: str, assets_dir: Optional[str] = None) -> None:
+    """Add the bucket graphs to a model's manifest record (paths relative to the assets dir)"""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import model_manifest
+
+    assets_dir = Path(assets_dir or model_manifest.ASSETS_DIR).resolve()
+    directory = Path(layout_path).resolve().parent
+    try:
+        prefix = directory.relative_to(assets_dir)
+    except ValueError:
+        raise ValueError(f"{directory} is not inside the assets directory {assets_dir}")
+
+    def asset(name):
+        return str(prefix / name) if name else None
+
+    graphs = [layout["fallback"], layout["weights"], layout["decode"]] + [b["graph"] for b in layout["buckets"]]
+    current = model_manifest.load_entry(model_id)
+    files = [f.path for f in current.files] if current else []
+    files += [asset(name) for name in graphs if name and asset(name) not in files]
+
+    model_manifest.update_model(model_id, {
+        "files": files,
+        "config": {"sequence_buckets": {
+            "fallback": asset(layout["fallback"]),
+            "decode": asset(layout["decode"]),
+            "buckets": [{"max_length": b["max_length"], "graph": asset(b["graph"])} for b in layout["buckets"]],
+            "padding_side": "right",
+        }},
+    }, assets_dir=assets_dir)
+    model_manifest.compile_manifest()
+
+
+class BucketedCausalLM:
+    """Greedy decoding over a bucketed graph family (sessions are created on first use)."""
+
+    def __init__(self, layout_path: str, intra_op_threads: Optional[int] = None):
+        with open(layout_path, "r") as f:
+            self.layout = json.load(f)
+        self.directory = Path(layout_path).parent
+        self.intra_op_threads = intra_op_threads
+        self.sessions = {}
+
+    def graph_for(self, length: int) -> str:
+        """Smallest bucket that holds `length` tokens, else the dynamic fallback"""
+        for bucket in self.layout["buckets"]:
+            if length <= bucket["max_length"]:
+                return bucket["graph"]
+        return self.layout["fallback"]
+
+    def session(self, graph: str):
+        if graph not in self.sessions:
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            if self.intra_op_threads:
+                options.intra_op_num_threads = self.intra_op_threads
+            self.sessions[graph] = ort.InferenceSession(
+                str(self.directory / graph), options, providers=["CPUExecutionProvider"]
+            )
+        return self.sessions[graph]
+
+    def _run(self, graph: str, token_ids: List[int], mask: List[int], past: Optional[Dict] = None,
+             position: int = 0) -> Tuple["np.ndarray", Dict]:
+        import numpy as np
+
+        session = self.session(graph)
+        inputs = {i.name: i for i in session.get_inputs()}
+        static_length = inputs["input_ids"].shape[1]
+        pad = static_length - len(token_ids) if isinstance(static_length, int) else 0
+
+        def typed(name, values):
+            return np.array([values], dtype=ORT_TYPES.get(inputs[name].type, "int64"))
+
+        feeds = {"input_ids": typed("input_ids", token_ids + [0] * pad)}
+        if "attention_mask" in inputs:
+            feeds["attention_mask"] = typed("attention_mask", mask + [0] * pad)
+        if "position_ids" in inputs:
+            positions = list(range(position, position + len(token_ids)))
+            feeds["position_ids"] = typed("position_ids", positions + [positions[-1]] * pad)
+        if "use_cache_branch" in inputs:
+            feeds["use_cache_branch"] = np.array([past is not None])
+        for name, node in inputs.items():
+            if name.startswith(("past_key_values", "past.")):
+                if past is not None:
+                    feeds[name] = past[name]
+                else:
+                    shape = [d if isinstance(d, int) else (1 if axis == 0 else 0) for axis, d in enumerate(node.shape)]
+                    feeds[name] = np.zeros(shape, dtype=ORT_TYPES.get(node.type, "float32"))
+
+        output_names = [o.name for o in session.get_outputs()]
+        outputs = dict(zip(output_names, session.run(None, feeds)))
+        logits = outputs["logits" if "logits" in outputs else output_names[0]]
+        present = {
+            name: outputs[name.replace("past_key_values", "present").replace("past.", "present.")]
+            for name in inputs if name.startswith(("past_key_values", "past."))
+        }
+        # Logits of the last real (unpadded) token
+        return logits[0, len(token_ids) - 1], present
+
+    def prefill(self, token_ids: List[int]) -> Tuple["np.ndarray", Dict, List[int]]:
+        """Returns (last-token logits, KV cache, attention mask covering the cache)"""
+        graph = self.graph_for(len(token_ids))
+        logits, present = self._run(graph, token_ids, [1] * len(token_ids))
+        if graph == self.layout["fallback"]:
+            return logits, present, [1] * len(token_ids)
+        padded = next(b["max_length"] for b in self.layout["buckets"] if b["graph"] == graph)
+        return logits, present, [1] * len(token_ids) + [0] * (padded - len(token_ids))
+
+    def greedy_generate(self, prompt_ids: List[int], max_new_tokens: int,
+                        eos_token_id: Optional[int] = None) -> List[int]:
+        import numpy as np
+
+        logits, past, mask = self.prefill(list(prompt_ids))
+        sequence = list(prompt_ids)
+        generated = []
+        while True:
+            token = int(np.argmax(logits))
+            generated.append(token)
+            sequence.append(token)
+            if token == eos_token_id or len(generated) == max_new_tokens:
+                return generated
+            if self.layout["kv_cache"]:
+                mask = mask + [1]
+                graph = self.layout["decode"] or self.layout["fallback"]
+                logits, past = self._run(graph, [token], mask, past, position=len(sequence) - 1)
+            else:
+                logits, _ = self._run(self.graph_for(len(sequence)), sequence, [1] * len(sequence))
+
+
+def _median_ms(function, repeat: int) -> float:
+    function()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def benchmark(layout_path: str, lengths: List[int], new_tokens: int = 8, repeat: int = 10,
+              intra_op_threads: Optional[int] = None) -> List[Dict[str, float]]:
+    """
+    Prefill and decode latency of the bucketed graphs against the dynamic graph.
+
+    Also checks that both produce the same greedy tokens.
+    """
+    import numpy as np
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent))
+    from onnx_generation import OrtCausalLM, random_prompt
+
+    bucketed = BucketedCausalLM(layout_path, intra_op_threads)
+    dynamic = OrtCausalLM(str(bucketed.directory / bucketed.layout["fallback"]), intra_op_threads=intra_op_threads)
+    rng = np.random.default_rng(0)
+
+    results = []
+    for length in lengths:
+        prompt = random_prompt(rng, dynamic, length)
+        prompt_array = np.array([prompt], dtype=np.int64)
+        dynamic_prefill = _median_ms(lambda: dynamic.forward(prompt_array), repeat)
+        static_prefill = _median_ms(lambda: bucketed.prefill(prompt), repeat)
+
+        result = {
+            "length": length,
+            "graph": bucketed.graph_for(length),
+            "dynamic_prefill_ms": round(dynamic_prefill, 3),
+            "static_prefill_ms": round(static_prefill, 3),
+        }
+
+        if bucketed.layout["decode"]:
+            _, past, mask = bucketed.prefill(prompt)
+            _, dynamic_past = dynamic.forward(prompt_array)
+            step = np.array([[prompt[-1]]], dtype=np.int64)
+            result["dynamic_decode_ms"] = round(_median_ms(
+                lambda: dynamic.forward(step, dynamic_past, past_length=length), repeat), 3)
+            result["static_decode_ms"] = round(_median_ms(
+                lambda: bucketed._run(bucketed.layout["decode"], [prompt[-1]], mask + [1], past, length), repeat), 3)
+
+        expected, _ = dynamic.greedy_generate(prompt, new_tokens)
+        result["greedy_match"] = bucketed.greedy_generate(prompt, new_tokens) == expected
+        results.append(result)
+    return results
+
+
+def _parse_ints(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequence-length bucketed static-shape decoder graphs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="Write static prefill/decode graphs sharing one weights file")
+    export.add_argument("model", help="Dynamic ONNX decoder")
+    export.add_argument("--output-dir", required=True)
+    export.add_argument("--buckets", type=_parse_ints, default=list(DEFAULT_BUCKETS), help="e.g. 64,128,256,512")
+    export.add_argument("--no-decode", action="store_true", help="Skip the 1-token decode graph")
+    export.add_argument("--alignment", type=int, choices=[4096, 16384, 65536], default=16384)
+    export.add_argument("--dim", action="append", default=[], help="Fix an unknown symbolic dim: NAME=VALUE")
+    export.add_argument("--manifest-id", help="Record the graphs in this model manifest entry")
+
+    bench = subparsers.add_parser("benchmark", help="Compare the bucketed graphs with the dynamic graph")
+    bench.add_argument("layout", help="<name>.buckets.json written by export")
+    bench.add_argument("--lengths", type=_parse_ints, default=[20, 64, 100, 200, 512])
+    bench.add_argument("--new-tokens", type=int, default=8)
+    bench.add_argument("--repeat", type=int, default=10)
+    bench.add_argument("--threads", type=int, help="Intra-op threads")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            overrides = {}
+            for item in args.dim:
+                name, _, value = item.rpartition("=")
+                overrides[name] = int(value)
+            layout = export_buckets(args.model, args.output_dir, args.buckets, not args.no_decode,
+                                    args.alignment, overrides)
+            layout_path = Path(args.output_dir) / f"{Path(args.model).stem}.buckets.json"
+            logger.info(f"🗂️  Layout: {layout_path}")
+            if args.manifest_id:
+                record_in_manifest(layout, layout_path, args.manifest_id)
+                logger.info(f"📝 Recorded in manifest entry '{args.manifest_id}'")
+        else:
+            results = benchmark(args.layout, args.lengths, args.new_tokens, args.repeat, args.threads)
+            logger.info(f"{'length':>6} {'graph':<32} {'dyn prefill':>12} {'static':>10} "
+                        f"{'dyn decode':>11} {'static':>10} greedy")
+            for r in results:
+                decode = (f"{r['dynamic_decode_ms']:>9.2f}ms {r['static_decode_ms']:>8.2f}ms"
+                          if "static_decode_ms" in r else f"{'-':>11} {'-':>10}")
+                logger.info(f"{r['length']:>6} {r['graph']:<32} {r['dynamic_prefill_ms']:>10.2f}ms "
+                            f"{r['static_prefill_ms']:>8.2f}ms {decode} {'✅' if r['greedy_match'] else '❌'}")
+            if not all(r["greedy_match"] for r in results):
+                logger.error("❌ Bucketed graphs diverge from the dynamic graph")
+                sys.exit(1)
+    except Exception as e:
+        logger.error(f"❌ {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
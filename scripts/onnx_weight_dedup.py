@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Deduplicate identical and transposed ONNX initializers
+
+Gemma ties `embed_tokens` and `lm_head`, but torch.onnx.export (and some
+Optimum versions) serialize the 256000x2048 matrix twice: once for the
+embedding Gather and once, transposed, for the LM-head MatMul. This pass
+finds such duplicates by content and makes the graph share one tensor:
+
+- identical initializers (same dtype, shape and bytes): consumers are
+  pointed at the first copy
+- transposed 2D pairs: the copy read by MatMul/Gemm is kept. Embedding
+  Gathers on the other copy become Gather(axis=1) + Transpose of the
+  activations (tokens x hidden, cheap), Gemm consumers flip transA/transB,
+  and anything else reads a Transpose node (which ORT folds at load time,
+  so that case only saves disk, not RAM)
+
+External data is read through np.memmap, so multi-GB weights are compared
+without loading them. The output is written with the aligned external data
+layout from onnx_external_data.py, which drops the duplicate bytes.
+
+Usage:
+    python onnx_weight_dedup.py model.onnx --output model_dedup.onnx --check
+    python onnx_weight_dedup.py models/gemma2b_onnx/model.onnx          # in place
+"""
+
+import argparse
+import hashlib
+import logging
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_ROWS = 4096
+
+
+def tensor_array(tensor, base_dir: Path):
+    """Read-only array for an initializer; external data is memory mapped"""
+    import numpy as np
+    from onnx import TensorProto, helper, numpy_helper
+
+    if tensor.data_location != TensorProto.EXTERNAL:
+        return numpy_helper.to_array(tensor)
+    info = {entry.key: entry.value for entry in tensor.external_data}
+    dtype = helper.tensor_dtype_to_np_dtype(tensor.data_type)
+    return np.memmap(base_dir / info["location"], dtype=dtype, mode="r",
+                     offset=int(info.get("offset", 0)), shape=tuple(tensor.dims))
+
+
+def content_digest(array) -> str:
+    """BLAKE2b of the tensor bytes, streamed in row blocks"""
+    digest = hashlib.blake2b(digest_size=32)
+    rows = array.reshape(array.shape[0], -1) if array.ndim > 1 else array.reshape(1, -1)
+    for start in range(0, rows.shape[0], HASH_BLOCK_ROWS):
+        digest.update(memoryview(rows[start:start + HASH_BLOCK_ROWS].tobytes()))
+    return digest.hexdigest()
+
+
+def is_transpose_of(a, b) -> bool:
+    """True if 2D b == a.T, compared block by block (stops at the first mismatch)"""
+    import numpy as np
+
+    if a.shape != b.shape[::-1] or a.dtype != b.dtype:
+        return False
+    for start in range(0, a.shape[0], HASH_BLOCK_ROWS):
+        if not np.array_equal(a[start:start + HASH_BLOCK_ROWS], b[:, start:start + HASH_BLOCK_ROWS].T):
+            return False
+    return True
+
+
+def _graphs(graph):
+    yield graph
+    for node in graph.node:
+        for attribute in node.attribute:
+            if attribute.g.ByteSize():
+                yield from _graphs(attribute.g)
+            for subgraph in attribute.graphs:
+                yield from _graphs(subgraph)
+
+
+def find_duplicates(model, base_dir: Path, min_bytes: int = 1024):
+    """
+    Returns:
+        Tuple of ({duplicate: original} for identical tensors,
+                  [(a, b)] pairs where b == a.T)
+    """
+    from onnx import TensorProto
+
+    candidates = {}
+    for tensor in model.graph.initializer:
+        if tensor.data_type in (TensorProto.STRING,) or tensor.data_type not in _numpy_types():
+            continue
+        array = tensor_array(tensor, base_dir)
+        if array.nbytes >= min_bytes and array.ndim >= 1:
+            candidates[tensor.name] = array
+
+    identical = {}
+    by_digest = defaultdict(list)
+    by_shape = defaultdict(list)
+    for name, array in candidates.items():
+        by_shape[(array.dtype.str, array.shape)].append(name)
+    for (_, shape), names in by_shape.items():
+        if len(names) < 2:
+            continue
+        for name in names:
+            by_digest[(shape, content_digest(candidates[name]))].append(name)
+    for names in by_digest.values():
+        for duplicate in names[1:]:
+            identical[duplicate] = names[0]
+
+    matrices = [n for n, a in candidates.items() if a.ndim == 2 and n not in identical]
+    transposed = []
+    paired = set()
+    for i, a in enumerate(matrices):
+        for b in matrices[i + 1:]:
+            if a in paired or b in paired:
+                continue
+            if is_transpose_of(candidates[a], candidates[b]):
+                transposed.append((a, b))
+                paired.update((a, b))
+    return identical, transposed
+
+
+def _numpy_types():
+    from onnx import TensorProto
+
+    return {TensorProto.FLOAT, TensorProto.FLOAT16, TensorProto.DOUBLE, TensorProto.BFLOAT16,
+            TensorProto.INT8, TensorProto.UINT8, TensorProto.INT16, TensorProto.UINT16,
+            TensorProto.INT32, TensorProto.UINT32, TensorProto.INT64, TensorProto.UINT64, TensorProto.BOOL}
+
+
+def _consumers(model, name):
+    """(graph, node, input index) for every read of `name`, including subgraphs"""
+    for graph in _graphs(model.graph):
+        for node in graph.node:
+            for index, value in enumerate(node.input):
+                if value == name:
+                    yield graph, node, index
+
+
+def _value_ranks(model) -> Dict[str, int]:
+    import onnx
+
+    try:
+        inferred = onnx.shape_inference.infer_shapes(model)
+    except Exception:
+        inferred = model
+    ranks = {}
+    for graph in _graphs(inferred.graph):
+        for value in list(graph.input) + list(graph.value_info) + list(graph.output):
+            if value.type.tensor_type.HasField("shape"):
+                ranks[value.name] = len(value.type.tensor_type.shape.dim)
+    return ranks
+
+
+def share_transposed(model, keep: str, drop: str, ranks: Dict[str, int]) -> Dict[str, int]:
+    """Rewrite every consumer of `drop` (== keep.T) to read `keep`; returns rewrite counts"""
+    from onnx import helper
+
+    counts = {"gather": 0, "gemm": 0, "transpose": 0}
+    needs_transpose = False
+    for graph, node, index in list(_consumers(model, drop)):
+        attributes = {a.name: a for a in node.attribute}
+        axis = attributes["axis"].i if "axis" in attributes else 0
+        if node.op_type == "Gather" and index == 0 and axis == 0 and node.input[1] in ranks:
+            # rows of drop == columns of keep: gather columns, then move the hidden axis last
+            rank = ranks[node.input[1]]
+            gathered = f"{node.output[0]}_dedup_cols"
+            position = list(graph.node).index(node)
+            replacement = [
+                helper.make_node("Gather", [keep, node.input[1]], [gathered], axis=1,
+                                 name=f"{node.output[0]}_dedup_gather"),
+                helper.make_node("Transpose", [gathered], [node.output[0]], perm=list(range(1, rank + 1)) + [0],
+                                 name=f"{node.output[0]}_dedup_transpose"),
+            ]
+            graph.node.remove(node)
+            for offset, new_node in enumerate(replacement):
+                graph.node.insert(position + offset, new_node)
+            counts["gather"] += 1
+        elif node.op_type == "Gemm" and index in (0, 1):
+            flag = "transA" if index == 0 else "transB"
+            current = attributes[flag].i if flag in attributes else 0
+            for attribute in list(node.attribute):
+                if attribute.name == flag:
+                    node.attribute.remove(attribute)
+            node.attribute.append(helper.make_attribute(flag, 1 - current))
+            node.input[index] = keep
+            counts["gemm"] += 1
+        else:
+            needs_transpose = True
+            counts["transpose"] += 1
+
+    if needs_transpose:
+        # Keep the name `drop` alive as a runtime transpose of `keep`
+        model.graph.node.insert(0, helper.make_node("Transpose", [keep], [drop], perm=[1, 0],
+                                                    name=f"{drop}_dedup_transpose"))
+    return counts
+
+
+def _drop_initializer(model, name):
+    for tensor in list(model.graph.initializer):
+        if tensor.name == name:
+            model.graph.initializer.remove(tensor)
+    # IR < 4 models also list initializers as graph inputs
+    for value in list(model.graph.input):
+        if value.name == name:
+            model.graph.input.remove(value)
+
+
+def _matmul_reads(model, name) -> int:
+    return sum(node.op_type in ("MatMul", "Gemm") for _, node, _ in _consumers(model, name))
+
+
+def _files_bytes(model_path: Path) -> int:
+    import onnx
+
+    model = onnx.load(str(model_path), load_external_data=False)
+    locations = {e.value for t in model.graph.initializer for e in t.external_data if e.key == "location"}
+    return model_path.stat().st_size + sum((model_path.parent / l).stat().st_size for l in locations)
+
+
+def dedupe_weights(model_path: str, output_path: Optional[str] = None, min_bytes: int = 1024,
+                   alignment: int = 16384, remove_stale_data: bool = False) -> Dict[str, int]:
+    """
+    Share identical and transposed initializers and rewrite the weights file.
+
+    Args:
+        model_path: Source model (inline or external weights)
+        output_path: Output model; defaults to rewriting model_path in place
+        min_bytes: Ignore smaller initializers
+        alignment: Page alignment of the rewritten external data
+        remove_stale_data: When rewriting in place, delete the old data files
+            (only safe if no other graph in the directory references them)
+
+    Returns:
+        Statistics: identical, transposed, bytes_saved, bytes_before, bytes_after
+        and per-kind rewrite counts
+    """
+    import onnx
+    from onnx_external_data import align_external_data
+
+    model_path = Path(model_path)
+    output_path = Path(output_path) if output_path else model_path
+    base_dir = model_path.parent
+    bytes_before = _files_bytes(model_path)
+
+    model = onnx.load(str(model_path), load_external_data=False)
+    old_locations = {e.value for t in model.graph.initializer for e in t.external_data if e.key == "location"}
+    sizes = {t.name: tensor_array(t, base_dir).nbytes for t in model.graph.initializer
+             if t.data_type in _numpy_types()}
+    identical, transposed = find_duplicates(model, base_dir, min_bytes)
+    ranks = _value_ranks(model)
+
+    stats = {"identical": len(identical), "transposed": len(transposed), "bytes_saved": 0,
+             "gather": 0, "gemm": 0, "transpose": 0}
+
+    for duplicate, original in identical.items():
+        for _, node, index in list(_consumers(model, duplicate)):
+            node.input[index] = original
+        for graph in _graphs(model.graph):
+            for value in graph.output:
+                if value.name == duplicate:
+                    graph.node.append(onnx.helper.make_node("Identity", [original], [duplicate]))
+        _drop_initializer(model, duplicate)
+        stats["bytes_saved"] += sizes[duplicate]
+        logger.info(f"🔗 {duplicate} is identical to {original} ({sizes[duplicate] / (1024 * 1024):.1f} MB)")
+
+    for a, b in transposed:
+        keep, drop = (a, b) if _matmul_reads(model, a) >= _matmul_reads(model, b) else (b, a)
+        counts = share_transposed(model, keep, drop, ranks)
+        for kind, count in counts.items():
+            stats[kind] += count
+        _drop_initializer(model, drop)
+        stats["bytes_saved"] += sizes[drop]
+        logger.info(f"🔁 {drop} is the transpose of {keep} ({sizes[drop] / (1024 * 1024):.1f} MB)")
+
+    # Save next to the source so relative external data locations still resolve,
+    # then stream the surviving tensors into a compact, aligned data file
+    staged = base_dir / f".{output_path.stem}.dedup.onnx"
+    onnx.save(model, str(staged))
+    try:
+        align_external_data(str(staged), str(output_path), alignment)
+    finally:
+        staged.unlink()
+
+    if remove_stale_data and output_path == model_path:
+        for location in old_locations - {f"{output_path.name}.data"}:
+            (base_dir / location).unlink(missing_ok=True)
+            logger.info(f"🗑️  Removed stale data file {location}")
+
+    stats["bytes_before"] = bytes_before
+    stats["bytes_after"] = _files_bytes(output_path)
+    return stats
+
+
+def check_parity(original: str, deduped: str, atol: float = 1e-5) -> bool:
+    """Run both models on the same dummy inputs and compare every output"""
+    import numpy as np
+    import onnxruntime as ort
+    from ort_format import dummy_feeds
+
+    reference = ort.InferenceSession(original, providers=["CPUExecutionProvider"])
+    candidate = ort.InferenceSession(deduped, providers=["CPUExecutionProvider"])
+    feeds = dummy_feeds(reference)
+    for name in feeds:
+        if feeds[name].dtype == np.int64 and "input_ids" in name:
+            feeds[name] = np.arange(feeds[name].size, dtype=np.int64).reshape(feeds[name].shape) + 1
+    expected = reference.run(None, feeds)
+    actual = dict(zip([o.name for o in candidate.get_outputs()], candidate.run(None, feeds)))
+    return all(np.allclose(e, actual[o.name], atol=atol) for o, e in zip(reference.get_outputs(), expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate identical and transposed ONNX initializers")
+    parser.add_argument("model", help="ONNX model (e.g. model.onnx from an Optimum export)")
+    parser.add_argument("--output", help="Output model path (default: in place)")
+    parser.add_argument("--min-bytes", type=int, default=1024, help="Ignore smaller initializers")
+    parser.add_argument("--alignment", type=int, choices=[4096, 16384, 65536], default=16384)
+    parser.add_argument("--remove-stale-data", action="store_true",
+                        help="In-place runs: delete the data files the model no longer references")
+    parser.add_argument("--check", action="store_true", help="Compare outputs with the original model")
+
+    args = parser.parse_args()
+
+    try:
+        if args.check and not args.output:
+            raise ValueError("--check needs --output so the original model is kept for comparison")
+        stats = dedupe_weights(args.model, args.output, args.min_bytes, args.alignment,
+                               args.remove_stale_data)
+        logger.info(f"✅ {stats['identical']} identical and {stats['transposed']} transposed duplicate(s) removed")
+        logger.info(f"💾 Saved {stats['bytes_saved'] / (1024 * 1024):.1f} MB: "
+                    f"{stats['bytes_before'] / (1024 * 1024):.1f} MB → {stats['bytes_after'] / (1024 * 1024):.1f} MB")
+        if stats["transpose"]:
+            logger.warning(f"⚠️  {stats['transpose']} consumer(s) read a runtime Transpose; "
+                           f"ORT folds it at load, so that copy still costs RAM")
+        if args.check:
+            if not check_parity(args.model, args.output):
+                logger.error("❌ Outputs differ from the original model")
+                sys.exit(1)
+            logger.info("✅ Outputs match the original model")
+    except Exception as e:
+        logger.error(f"❌ Deduplication failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
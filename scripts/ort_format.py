@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - ORT format conversion and cold-start benchmark
+
+Converts an ONNX model to both ORT optimization styles:
+
+- Fixed:   all optimizations baked in for the target platform. Best for
+           the CPU execution provider.
+- Runtime: basic optimizations baked in, the rest saved and replayed at
+           session creation. Best when NNAPI may take over part of the graph.
+
+and keeps the required-operators configs the converter writes. Passing that
+config to ONNX Runtime's minimal build (`--include_ops_by_config`) produces
+a runtime with only the kernels our models use.
+
+The benchmark measures each output in a fresh process, so that session
+creation and the first inference are real cold starts.
+
+Usage:
+    python ort_format.py convert model.onnx --output-dir ort_models
+    python ort_format.py benchmark model.onnx ort_models/model.ort ort_models/model.with_runtime_opt.ort
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+OPTIMIZATION_STYLES = ("Fixed", "Runtime")
+
+ORT_TYPES = {
+    "tensor(int64)": "int64",
+    "tensor(int32)": "int32",
+    "tensor(float)": "float32",
+    "tensor(float16)": "float16",
+    "tensor(bool)": "bool",
+    "tensor(uint8)": "uint8",
+    "tensor(int8)": "int8",
+}
+
+
+def convert_to_ort(onnx_path: str, output_dir: str, styles=OPTIMIZATION_STYLES,
+                   target_platform: str = "arm", enable_type_reduction: bool = True) -> Dict[str, str]:
+    """
+    Convert an ONNX model to ORT format in each optimization style.
+
+    Args:
+        onnx_path: Source ONNX model
+        output_dir: Directory for the .ort files and operator configs
+        styles: Optimization styles to produce
+        target_platform: 'arm' for devices, 'amd64' for desktop testing
+        enable_type_reduction: Also record per-operator types in the config,
+            which lets the minimal build drop unused type kernels
+
+    Returns:
+        Dictionary with 'fixed'/'runtime' model paths and matching
+        'fixed_config'/'runtime_config' operator config paths
+    """
+    onnx_path = Path(onnx_path)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    command = [
+        sys.executable, "-m", "onnxruntime.tools.convert_onnx_models_to_ort", str(onnx_path),
+        "--output_dir", str(output_dir),
+        "--optimization_style", *styles,
+        "--target_platform", target_platform,
+    ]
+    if enable_type_reduction:
+        command.append("--enable_type_reduction")
+
+    logger.info(f"Converting {onnx_path.name} to ORT format ({', '.join(styles)})")
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"ORT conversion failed: {completed.stderr.strip().splitlines()[-1:]}")
+
+    stem = onnx_path.stem
+    outputs = {}
+    for style in styles:
+        suffix = "" if style == "Fixed" else ".with_runtime_opt"
+        key = style.lower()
+        model = output_dir / f"{stem}{suffix}.ort"
+        if not model.exists():
+            raise FileNotFoundError(f"ORT conversion did not produce {model}")
+        outputs[key] = str(model)
+        # The config is written next to the output models (older releases: next to the source)
+        for directory in (output_dir, onnx_path.parent):
+            configs = sorted(directory.glob(f"*.required_operators*{suffix}.config"))
+            configs = [c for c in configs if suffix or ".with_runtime_opt" not in c.name]
+            if configs:
+                outputs[f"{key}_config"] = str(configs[0])
+                break
+    return outputs
+
+
+def read_operator_config(config_path: str) -> Dict[str, List[str]]:
+    """Parse a required-operators config into {domain;opset: [operators]}"""
+    operators = {}
+    with open(config_path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            domain, opset, ops = line.split(";", 2)
+            names = []
+            depth = 0
+            current = ""
+            # Operators are comma separated, but type info braces contain commas too
+            for char in ops:
+                depth += char == "{"
+                depth -= char == "}"
+                if char == "," and depth == 0:
+                    names.append(current.split("{")[0])
+                    current = ""
+                else:
+                    current += char
+            if current:
+                names.append(current.split("{")[0])
+            operators[f"{domain};{opset}"] = names
+    return operators
+
+
+def dummy_feeds(session) -> Dict[str, "np.ndarray"]:
+    """Minimal valid inputs: symbolic dims become 1, KV-cache past lengths 0"""
+    import numpy as np
+
+    feeds = {}
+    for node in session.get_inputs():
+        is_past = node.name.startswith(("past_key_values", "past."))
+        shape = []
+        for axis, dim in enumerate(node.shape):
+            if isinstance(dim, int):
+                shape.append(dim)
+            else:
+                shape.append(0 if is_past and axis == 2 else 1)
+        dtype = ORT_TYPES.get(node.type, "float32")
+        feeds[node.name] = np.ones(shape, dtype=dtype) if not is_past else np.zeros(shape, dtype=dtype)
+    return feeds
+
+
+def measure_cold_start(model_path: str, steady_runs: int = 5) -> Dict[str, float]:
+    """
+    Session creation and first-inference latency for one model, in-process.
+
+    Intended to run in a fresh interpreter (see benchmark()).
+    """
+    start = time.perf_counter()
+    import onnxruntime as ort
+    import_ms = (time.perf_counter() - start) * 1000
+
+    options = ort.SessionOptions()
+    if model_path.endswith(".with_runtime_opt.ort"):
+        # Replay the optimizations saved by the Runtime style
+        options.add_session_config_entry("session.enable_saved_runtime_optimizations", "1")
+
+    start = time.perf_counter()
+    session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+    session_ms = (time.perf_counter() - start) * 1000
+
+    feeds = dummy_feeds(session)
+    start = time.perf_counter()
+    session.run(None, feeds)
+    first_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(steady_runs):
+        session.run(None, feeds)
+    steady_ms = (time.perf_counter() - start) * 1000 / steady_runs
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "model": model_path,
+        "file_bytes": os.path.getsize(model_path),
+        "import_ms": round(import_ms, 2),
+        "session_create_ms": round(session_ms, 2),
+        "first_inference_ms": round(first_ms, 2),
+        "steady_inference_ms": round(steady_ms, 2),
+        "peak_rss_mb": round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1),
+    }
+
+
+def benchmark(model_paths: List[str], repeat: int = 3, timeout: int = 600) -> List[Dict[str, float]]:
+    """
+    Cold-start each model `repeat` times in fresh processes and keep the median run.
+
+    Args:
+        model_paths: ONNX and/or ORT models to compare
+        repeat: Fresh processes per model
+        timeout: Seconds per process
+
+    Returns:
+        One result per model (with 'error' on failure)
+    """
+    results = []
+    for model_path in model_paths:
+        runs = []
+        for _ in range(repeat):
+            completed = subprocess.run(
+                [sys.executable, __file__, "measure", str(model_path)],
+                capture_output=True, text=True, timeout=timeout
+            )
+            lines = [l for l in completed.stdout.splitlines() if l.startswith("{")]
+            if completed.returncode != 0 or not lines:
+                stderr = completed.stderr.strip().splitlines()
+                runs = [{"model": str(model_path), "error": stderr[-1] if stderr else "no output"}]
+                break
+            runs.append(json.loads(lines[-1]))
+        runs.sort(key=lambda r: r.get("session_create_ms", 0) + r.get("first_inference_ms", 0))
+        results.append(runs[len(runs) // 2])
+    return results
+
+
+def runtime_library_bytes() -> Optional[int]:
+    """Size of the installed (full) ONNX Runtime native library, for comparison"""
+    try:
+        import onnxruntime
+    except ImportError:
+        return None
+    capi = Path(onnxruntime.__file__).parent / "capi"
+    return sum(p.stat().st_size for p in capi.glob("*.so*")) or None
+
+
+def log_report(results: List[Dict[str, float]], configs: Optional[Dict[str, str]] = None) -> None:
+    logger.info(f"{'model':<48} {'size':>10} {'session':>10} {'first':>10} {'steady':>10} {'RSS':>8}")
+    for r in results:
+        name = Path(r["model"]).name
+        if "error" in r:
+            logger.info(f"{name:<48} ❌ {r['error']}")
+            continue
+        logger.info(f"{name:<48} {r['file_bytes'] / 1024:>8.0f}KB {r['session_create_ms']:>8.1f}ms "
+                    f"{r['first_inference_ms']:>8.1f}ms {r['steady_inference_ms']:>8.1f}ms "
+                    f"{r['peak_rss_mb']:>6.0f}MB")
+
+    for style, config in (configs or {}).items():
+        operators = read_operator_config(config)
+        total = sum(len(ops) for ops in operators.values())
+        logger.info(f"🧩 {style}: {total} operator kernels required ({config})")
+    full = runtime_library_bytes()
+    if full:
+        logger.info(f"📦 Full ONNX Runtime native library: {full / (1024 * 1024):.1f} MB "
+                    f"(a minimal build with --include_ops_by_config keeps only the kernels above)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ORT format conversion and cold-start benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="Produce Fixed and Runtime ORT models plus operator configs")
+    convert.add_argument("model", help="ONNX model")
+    convert.add_argument("--output-dir", default="ort_models")
+    convert.add_argument("--target-platform", choices=["arm", "amd64"], default="arm")
+    convert.add_argument("--no-type-reduction", action="store_true")
+    convert.add_argument("--benchmark", action="store_true", help="Benchmark the outputs against the ONNX model")
+
+    bench = subparsers.add_parser("benchmark", help="Cold-start benchmark of ONNX/ORT models")
+    bench.add_argument("models", nargs="+")
+    bench.add_argument("--repeat", type=int, default=3)
+    bench.add_argument("--json", help="Also write results to this file")
+
+    measure = subparsers.add_parser("measure", help=argparse.SUPPRESS)
+    measure.add_argument("model")
+
+    args = parser.parse_args()
+
+    if args.command == "measure":
+        print(json.dumps(measure_cold_start(args.model)))
+        return
+
+    try:
+        if args.command == "convert":
+            outputs = convert_to_ort(args.model, args.output_dir, target_platform=args.target_platform,
+                                     enable_type_reduction=not args.no_type_reduction)
+            for key, path in outputs.items():
+                logger.info(f"✅ {key}: {path}")
+            if args.benchmark:
+                results = benchmark([args.model, outputs["fixed"], outputs["runtime"]])
+                log_report(results, {k: v for k, v in outputs.items() if k.endswith("_config")})
+        else:
+            results = benchmark(args.models, args.repeat)
+            log_report(results)
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump(results, f, indent=2)
+    except Exception as e:
+        logger.error(f"❌ {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
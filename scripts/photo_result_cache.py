@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Perceptual-hash result cache for bulk photo analysis
+
+Site uploads are full of burst shots and near-duplicates, and running YOLO
+or Gemma again on each one is most of the back-office compute. This cache
+sits in front of any per-photo analysis:
+
+- Every photo is decoded at reduced size (JPEG DCT scaling via
+  Image.draft) to grayscale, and hashed with a 64-bit dHash and pHash. The
+  hashing is vectorized with numpy over the whole batch.
+- The key combines the photo with a model fingerprint: the SHA-256 of the
+  weights that are run plus the model's manifest record (version, config,
+  file checksums) when there is one. Retraining or updating the model
+  invalidates its results without touching other models.
+- Exact hits match the file's SHA-256. Near-duplicate hits are found with a
+  BK-tree over pHash within a Hamming radius and confirmed with dHash.
+- Results live in SQLite with LRU eviction (max entries); the BK-tree is
+  rebuilt from it on open.
+
+Hit rate and the compute time the hits saved (the recorded cost of the
+original computation) are reported per run. Photos that cannot be decoded
+are reported as failures instead of aborting the run.
+
+Usage:
+    python photo_result_cache.py run ./uploads --model models/yolo_hazard/best.pt --model-id hazard_detector
+    python photo_result_cache.py hash IMG_0001.jpg IMG_0002.jpg
+    python photo_result_cache.py stats
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE = Path(__file__).resolve().parents[1] / "models/cache/photo_results.sqlite"
+DEFAULT_RADIUS = 6
+DEFAULT_MAX_ENTRIES = 50000
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+HASH_SIZE = 8
+PHASH_SIZE = 32
+
+# Bump when hashing or the stored result layout changes so old entries are dropped
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS entries (
+    model_key TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    phash INTEGER NOT NULL,
+    dhash INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    compute_ms REAL NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (model_key, sha256)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used);
+"""
+
+
+def decode_gray(path: str, size: int = PHASH_SIZE):
+    """Grayscale float32 [size, size]; JPEGs are decoded at 1/2..1/8 scale when possible"""
+    import numpy as np
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.draft("L", (size * 4, size * 4))
+        gray = image.convert("L").resize((size, size), Image.BILINEAR)
+        return np.asarray(gray, dtype=np.float32)
+
+
+def _pack_bits(bits) -> List[int]:
+    """[N, 64] booleans -> N Python ints (bit 63 first)"""
+    import numpy as np
+
+    packed = np.packbits(bits.astype(np.uint8), axis=1)
+    return [int.from_bytes(row.tobytes(), "big") for row in packed]
+
+
+def _dct_matrix(n: int):
+    import numpy as np
+
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+def dhash_batch(grays) -> List[int]:
+    """
+    Difference hash of [N, S, S] grayscale images: 9x8 area-averaged
+    thumbnails, one bit per horizontal gradient sign.
+    """
+    import numpy as np
+
+    grays = np.asarray(grays, dtype=np.float32)
+    n, size, _ = grays.shape
+    rows = np.linspace(0, size, HASH_SIZE + 1).astype(int)
+    cols = np.linspace(0, size, HASH_SIZE + 2).astype(int)
+    # Area average via cumulative sums: works for any S >= 9
+    integral = np.pad(grays.cumsum(1).cumsum(2), ((0, 0), (1, 0), (1, 0)))
+    r0, r1 = rows[:-1], rows[1:]
+    c0, c1 = cols[:-1], cols[1:]
+    sums = (integral[:, r1][:, :, c1] - integral[:, r0][:, :, c1]
+            - integral[:, r1][:, :, c0] + integral[:, r0][:, :, c0])
+    thumb = sums / ((r1 - r0)[:, None] * (c1 - c0)[None, :])
+    return _pack_bits((thumb[:, :, 1:] > thumb[:, :, :-1]).reshape(n, -1))
+
+
+def phash_batch(grays) -> List[int]:
+    """
+    Perceptual hash of [N, 32, 32] grayscale images: 2-D DCT, the 8x8
+    lowest frequencies, one bit per coefficient above the median (DC excluded).
+    """
+    import numpy as np
+
+    grays = np.asarray(grays, dtype=np.float32)
+    if grays.shape[1:] != (PHASH_SIZE, PHASH_SIZE):
+        raise ValueError(f"pHash expects {PHASH_SIZE}x{PHASH_SIZE} inputs, got {grays.shape[1:]}")
+    dct = _dct_matrix(PHASH_SIZE)
+    coefficients = (dct @ grays @ dct.T)[:, :HASH_SIZE, :HASH_SIZE].reshape(len(grays), -1)
+    median = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+    return _pack_bits(coefficients > median)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class BKTree:
+    """Burkhard-Keller tree over 64-bit hashes with Hamming distance."""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, key) -> None:
+        node = [value, [key], {}]
+        if self.root is None:
+            self.root = node
+            self.size = 1
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            if distance == 0:
+                current[1].append(key)
+                return
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                self.size += 1
+                return
+            current = child
+
+    def remove(self, value: int, key) -> None:
+        """Forget a key; the (possibly empty) node stays to keep the tree valid"""
+        for distance, keys in self._walk(value, 0):
+            if key in keys:
+                keys.remove(key)
+
+    def search(self, value: int, radius: int) -> List[Tuple[int, object]]:
+        """(distance, key) pairs within radius, nearest first"""
+        return sorted((d, key) for d, keys in self._walk(value, radius) for key in keys)
+
+    def _walk(self, value: int, radius: int):
+        if self.root is None:
+            return
+        stack = [self.root]
+        while stack:
+            node_value, keys, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                yield distance, keys
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+
+
+def model_files_sha256(model_path: str) -> List[Tuple[str, str]]:
+    """(relative path, SHA-256) of a weights file, or of every file in an export directory"""
+    path = Path(model_path)
+    if path.is_dir():
+        return [(str(p.relative_to(path)), file_sha256(str(p))) for p in sorted(path.rglob("*")) if p.is_file()]
+    return [(path.name, file_sha256(str(path)))]
+
+
+def model_fingerprint(model_id: Optional[str] = None, model_path: Optional[str] = None, extra: str = "") -> str:
+    """
+    SHA-256 over the weights that are run and the model's manifest record
+    (version, config and file checksums) when one exists.
+
+    `extra` folds in anything else that changes results (thresholds, prompts).
+    """
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import model_manifest
+
+    entry = model_manifest.load_entry(model_id) if model_id else None
+    if entry is None and model_path is None:
+        raise ValueError(f"No manifest record for '{model_id}' and no model file to hash")
+    record = {
+        "weights": model_files_sha256(model_path) if model_path else None,
+        "manifest": {
+            "id": entry.id,
+            "version": entry.version,
+            "files": sorted((f.path, f.sha256 or "") for f in entry.files),
+            "config": entry.config,
+        } if entry else None,
+        "extra": extra,
+    }
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+    """Exact and near-duplicate result cache for one model fingerprint."""
+
+    def __init__(self, model_key: str, path: str = str(DEFAULT_CACHE), radius: int = DEFAULT_RADIUS,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.model_key = model_key
+        self.radius = radius
+        self.max_entries = max_entries
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+        version = self.db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if version is None or int(version[0]) != SCHEMA_VERSION:
+            self.db.execute("DELETE FROM entries")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+            self.db.commit()
+
+        self.tree = BKTree()
+        self.dhashes = {}
+        rows = self.db.execute("SELECT sha256, phash, dhash FROM entries WHERE model_key = ?", (model_key,))
+        for sha256, phash, dhash in rows:
+            self.tree.add(_to_unsigned(phash), sha256)
+            self.dhashes[sha256] = _to_unsigned(dhash)
+        self.stats = {"exact": 0, "near": 0, "miss": 0, "failed": 0, "saved_ms": 0.0, "computed_ms": 0.0,
+                      "evicted": 0}
+
+    def lookup(self, sha256: str, phash: int, dhash: int) -> Tuple[Optional[str], Optional[str]]:
+        """Return (hit kind, cached sha256) for an exact or near-duplicate match"""
+        if sha256 in self.dhashes:
+            return "exact", sha256
+        for distance, candidate in self.tree.search(phash, self.radius):
+            if hamming(dhash, self.dhashes[candidate]) <= self.radius:
+                return "near", candidate
+        return None, None
+
+    def _touch(self, sha256: str):
+        row = self.db.execute(
+            "SELECT result, compute_ms FROM entries WHERE model_key = ? AND sha256 = ?",
+            (self.model_key, sha256),
+        ).fetchone()
+        self.db.execute(
+            "UPDATE entries SET last_used = ?, hits = hits + 1 WHERE model_key = ? AND sha256 = ?",
+            (time.time(), self.model_key, sha256),
+        )
+        return json.loads(row[0]), row[1]
+
+    def put(self, sha256: str, phash: int, dhash: int, result, compute_ms: float) -> None:
+        now = time.time()
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+            (self.model_key, sha256, _to_signed(phash), _to_signed(dhash), json.dumps(result), compute_ms, now, now),
+        )
+        if sha256 not in self.dhashes:
+            self.tree.add(phash, sha256)
+        self.dhashes[sha256] = dhash
+
+    def evict(self) -> int:
+        """Drop least recently used entries (all models) beyond max_entries"""
+        count = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        victims = self.db.execute(
+            "SELECT model_key, sha256, phash FROM entries ORDER BY last_used LIMIT ?", (excess,)
+        ).fetchall()
+        self.db.executemany("DELETE FROM entries WHERE model_key = ? AND sha256 = ?",
+                            [(model_key, sha256) for model_key, sha256, _ in victims])
+        for model_key, sha256, phash in victims:
+            if model_key == self.model_key:
+                self.tree.remove(_to_unsigned(phash), sha256)
+                self.dhashes.pop(sha256, None)
+        self.stats["evicted"] += len(victims)
+        return len(victims)
+
+    def process(self, paths: Sequence[str], compute: Callable[[str], object], batch_size: int = 64) -> Iterable:
+        """
+        Yield (path, result, kind) for each photo, computing only misses.
+
+        Hashes are computed a batch at a time; photos within the batch that
+        duplicate an earlier one hit the entry it just created. Photos that
+        cannot be decoded yield (path, error message, "failed").
+        """
+        import numpy as np
+
+        for start in range(0, len(paths), batch_size):
+            batch = list(paths[start:start + batch_size])
+            grays, errors = [], {}
+            for index, path in enumerate(batch):
+                try:
+                    grays.append(decode_gray(path))
+                except Exception as e:
+                    errors[index] = str(e)
+            stacked = np.stack(grays) if grays else None
+            hashes = iter(zip(phash_batch(stacked), dhash_batch(stacked)) if grays else ())
+            for index, path in enumerate(batch):
+                if index in errors:
+                    logger.warning(f"⚠️  Skipping {path}: {errors[index]}")
+                    self.stats["failed"] += 1
+                    yield path, errors[index], "failed"
+                    continue
+                phash, dhash = next(hashes)
+                sha256 = file_sha256(path)
+                kind, match = self.lookup(sha256, phash, dhash)
+                if kind:
+                    result, cost = self._touch(match)
+                    self.stats[kind] += 1
+                    self.stats["saved_ms"] += cost
+                else:
+                    started = time.perf_counter()
+                    result = compute(path)
+                    cost = (time.perf_counter() - started) * 1000
+                    self.put(sha256, phash, dhash, result, cost)
+                    self.stats["miss"] += 1
+                    self.stats["computed_ms"] += cost
+                    kind = "miss"
+                yield path, result, kind
+            self.evict()
+            self.db.commit()
+
+    def report(self) -> Dict:
+        stats = dict(self.stats)
+        total = stats["exact"] + stats["near"] + stats["miss"]
+        stats["photos"] = total
+        stats["hit_rate"] = (stats["exact"] + stats["near"]) / total if total else 0.0
+        spent = stats["computed_ms"] + stats["saved_ms"]
+        stats["compute_saved"] = stats["saved_ms"] / spent if spent else 0.0
+        return stats
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+
+def yolo_analyzer(model_path: str, confidence: float = 0.25) -> Callable[[str], Dict]:
+    """
+    Detection function returning JSON-serializable boxes.
+
+    Boxes are normalized to 0..1 (xyxyn): a near-duplicate hit can be a
+    resized copy of the photo, so pixel boxes would come back at the wrong scale.
+    """
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+
+    def detect(path: str) -> Dict:
+        result = model(path, conf=confidence, verbose=False)[0]
+        boxes = result.boxes
+        return {
+            "boxes_normalized": boxes.xyxyn.tolist(),
+            "scores": boxes.conf.tolist(),
+            "classes": [result.names[int(c)] for c in boxes.cls.tolist()],
+        }
+
+    return detect
+
+
+def photo_paths(inputs: Sequence[str]) -> List[str]:
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths += sorted(str(p) for p in item.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        else:
+            paths.append(str(item))
+    return paths
+
+
+def log_report(stats: Dict) -> None:
+    logger.info(f"📸 {stats['photos']} photos: {stats['exact']} exact, {stats['near']} near-duplicate, "
+                f"{stats['miss']} computed" + (f", {stats['failed']} unreadable" if stats["failed"] else ""))
+    logger.info(f"🎯 Hit rate: {stats['hit_rate'] * 100:.1f}%")
+    logger.info(f"⏱️  Compute saved: {stats['saved_ms'] / 1000:.1f} s of {(stats['saved_ms'] + stats['computed_ms']) / 1000:.1f} s "
+                f"({stats['compute_saved'] * 100:.1f}%)")
+    if stats["evicted"]:
+        logger.info(f"🧹 Evicted {stats['evicted']} least recently used entries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perceptual-hash result cache for bulk photo analysis")
+    parser.add_argument("--cache", default=str(DEFAULT_CACHE), help="SQLite cache path")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Detect on photos, reusing cached results for duplicates")
+    run.add_argument("inputs", nargs="+", help="Photos or directories")
+    run.add_argument("--model", required=True, help="YOLO weights or exported model for ultralytics")
+    run.add_argument("--model-id", default="hazard_detector",
+                     help="Manifest record the results also depend on (used when it exists)")
+    run.add_argument("--confidence", type=float, default=0.25)
+    run.add_argument("--radius", type=int, default=DEFAULT_RADIUS, help="Max Hamming distance for near-duplicates")
+    run.add_argument("--max-entries", type=int, default=DEFAULT_MAX_ENTRIES, help="LRU capacity")
+    run.add_argument("--output", help="Write per-photo results as JSON lines")
+
+    hashes = subparsers.add_parser("hash", help="Print dHash/pHash of photos and their pairwise distances")
+    hashes.add_argument("inputs", nargs="+", help="Photos or directories")
+
+    subparsers.add_parser("stats", help="Show cache contents per model fingerprint")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "run":
+            model_key = model_fingerprint(args.model_id, args.model, extra=f"conf={args.confidence}")
+            cache = ResultCache(model_key, args.cache, args.radius, args.max_entries)
+            analyze = yolo_analyzer(args.model, args.confidence)
+            out = open(args.output, "w") if args.output else None
+            try:
+                for path, result, kind in cache.process(photo_paths(args.inputs), analyze):
+                    if out:
+                        out.write(json.dumps({"photo": path, "cache": kind, "result": result}) + "\n")
+            finally:
+                if out:
+                    out.close()
+                stats = cache.report()
+                cache.close()
+            log_report(stats)
+        elif args.command == "hash":
+            import numpy as np
+
+            paths = photo_paths(args.inputs)
+            grays = np.stack([decode_gray(p) for p in paths])
+            phashes, dhashes = phash_batch(grays), dhash_batch(grays)
+            for path, phash, dhash in zip(paths, phashes, dhashes):
+                print(f"{phash:016x} {dhash:016x} {path}")
+            for i in range(len(paths)):
+                for j in range(i + 1, len(paths)):
+                    print(f"  {Path(paths[i]).name} ~ {Path(paths[j]).name}: "
+                          f"pHash {hamming(phashes[i], phashes[j])}, dHash {hamming(dhashes[i], dhashes[j])}")
+        else:
+            if not Path(args.cache).exists():
+                raise FileNotFoundError(f"No cache at {args.cache}")
+            db = sqlite3.connect(args.cache)
+            rows = db.execute(
+                "SELECT model_key, COUNT(*), SUM(hits), SUM(compute_ms) FROM entries GROUP BY model_key"
+            ).fetchall()
+            for model_key, count, hits, compute_ms in rows:
+                logger.info(f"🔑 {model_key[:12]}: {count} entries, {hits} hits, {compute_ms / 1000:.1f} s cached compute")
+            db.close()
+    except Exception as e:
+        logger.error(f"❌ Photo cache {args.command} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,19 +7,15 @@ Optimized for mobile deployment with TensorFlow Lite export.
 """
 
 import argparse
+import json
 import logging
 import os
 import sys
 from pathlib import Path
 from typing import List, Optional, Tuple
-import requests
-import zipfile
 
-from ultralytics import YOLO
-import torch
-import cv2
-import numpy as np
-from PIL import Image
+# ultralytics/numpy are imported inside the methods that use them so that
+# `--help` and the model_tools CLI start without loading torch.
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +24,56 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Construction safety classes we want to detect (name -> class id).
+# compile_hazard_mapping.py links these to OSHA citations.
+SAFETY_CLASSES = {
+    'person': 0,
+    'hard_hat': 1,
+    'safety_vest': 2,
+    'no_hard_hat': 3,
+    'no_safety_vest': 4,
+    'machinery': 5,
+    'excavator': 6,
+    'crane': 7,
+    'truck': 8,
+    'fall_hazard': 9,
+    'electrical_hazard': 10,
+    'safety_cone': 11,
+    'barrier': 12
+}
+
+# YOLOv8's largest feature stride; input sides must be multiples of it
+STRIDE = 32
+HEAD_STRIDES = (8, 16, 32)
+
+# Camera aspect ratios (width:height) the app captures in
+ASPECT_RATIOS = {"1:1": (1, 1), "4:3": (4, 3), "16:9": (16, 9)}
+
+def stride_align(value: float, stride: int = STRIDE) -> int:
+    """Nearest multiple of stride (at least one stride)"""
+    return max(stride, int(round(value / stride)) * stride)
+
+def parse_imgsz(value: str, aspect: Optional[str] = None) -> Tuple[int, int]:
+    """
+    Export input size as (height, width).
+
+    "640" is square unless an aspect ratio is given, in which case 640 is
+    the long (width) side: 4:3 -> 480x640, 16:9 -> 352x640. "640x480"
+    means width x height. Both sides are rounded to the stride.
+    """
+    if "x" in value:
+        width, height = (int(v) for v in value.lower().split("x"))
+    else:
+        width = int(value)
+        ratio_w, ratio_h = ASPECT_RATIOS[aspect or "1:1"]
+        height = width * ratio_h / ratio_w
+    return stride_align(height), stride_align(width)
+
+def num_anchors(imgsz: Tuple[int, int]) -> int:
+    """Prediction columns of the YOLOv8 head for an input size"""
+    height, width = imgsz
+    return sum((height // s) * (width // s) for s in HEAD_STRIDES)
+
 class HazardDetectionSetup:
     """Setup YOLOv8 models for construction hazard detection."""
     
@@ -36,21 +82,7 @@ class HazardDetectionSetup:
         self.models_dir.mkdir(exist_ok=True, parents=True)
         
         # Construction safety classes we want to detect
-        self.safety_classes = {
-            'person': 0,
-            'hard_hat': 1,
-            'safety_vest': 2,
-            'no_hard_hat': 3,
-            'no_safety_vest': 4,
-            'machinery': 5,
-            'excavator': 6,
-            'crane': 7,
-            'truck': 8,
-            'fall_hazard': 9,
-            'electrical_hazard': 10,
-            'safety_cone': 11,
-            'barrier': 12
-        }
+        self.safety_classes = dict(SAFETY_CLASSES)
         
     def download_pretrained_model(self, model_size: str = "n") -> str:
         """
@@ -72,6 +104,8 @@ class HazardDetectionSetup:
         logger.info(f"Downloading YOLOv8{model_size} model...")
         
         try:
+            from ultralytics import YOLO
+
             # YOLO will automatically download the model
             model = YOLO(model_name)
             
@@ -201,6 +235,8 @@ Where coordinates are normalized (0-1).
         logger.info(f"Fine-tuning YOLOv8 for construction hazard detection...")
         
         try:
+            from ultralytics import YOLO
+
             # Load base model
             model = YOLO(base_model)
             
@@ -237,19 +273,32 @@ Where coordinates are normalized (0-1).
             logger.error(f"❌ Training failed: {str(e)}")
             raise
     
-    def export_to_mobile_formats(self, model_path: str) -> dict:
+    def export_to_mobile_formats(self, model_path: str, imgsz: Tuple[int, int] = (640, 640),
+                                 embed_nms: bool = False, nms_config: Optional[str] = None) -> dict:
         """
         Export trained model to mobile-friendly formats.
         
         Args:
             model_path: Path to trained model
+            imgsz: Input (height, width), multiples of 32. Non-square shapes
+                matching the camera aspect ratio avoid letterbox padding.
+            embed_nms: Also export end-to-end models ('onnx_nms', 'tflite_nms')
+                with box decoding, top-k and class-aware NMS in the graph
+            nms_config: model_config.json providing the baked-in thresholds
             
         Returns:
             Dictionary of exported model paths
         """
-        logger.info("Exporting model to mobile formats...")
+        imgsz = tuple(imgsz)
+        if any(side % STRIDE for side in imgsz):
+            raise ValueError(f"Input size {imgsz[1]}x{imgsz[0]} is not a multiple of {STRIDE}")
+        logger.info(f"Exporting model to mobile formats at {imgsz[1]}x{imgsz[0]} (WxH)...")
+        # ultralytics takes a bare int for square inputs and [height, width] otherwise
+        export_size = imgsz[0] if imgsz[0] == imgsz[1] else list(imgsz)
         
         try:
+            from ultralytics import YOLO
+
             model = YOLO(model_path)
             exported_models = {}
             
@@ -260,17 +309,24 @@ Where coordinates are normalized (0-1).
                 optimize=True,
                 simplify=True,
                 dynamic=False,
-                imgsz=640
+                imgsz=export_size
             )
             exported_models['onnx'] = onnx_path
             logger.info(f"✅ ONNX export: {onnx_path}")
             
+            nms = None
+            if embed_nms:
+                from onnx_embedded_nms import embed_nms as append_nms, nms_settings
+
+                nms = nms_settings(nms_config) if nms_config else nms_settings()
+                exported_models['onnx_nms'] = append_nms(onnx_path, **nms)
+            
             # Export to TensorFlow Lite
             logger.info("Exporting to TensorFlow Lite...")
             try:
                 tflite_path = model.export(
                     format="tflite",
-                    imgsz=640,
+                    imgsz=export_size,
                     int8=True  # Quantization for smaller size
                 )
                 exported_models['tflite'] = tflite_path
@@ -278,12 +334,15 @@ Where coordinates are normalized (0-1).
             except Exception as e:
                 logger.warning(f"⚠️  TFLite export failed: {str(e)}")
             
+            if nms and 'tflite' in exported_models:
+                exported_models.update(self._export_tflite_nms(model, export_size, exported_models['tflite'], nms))
+            
             # Export to CoreML (for iOS)
             logger.info("Exporting to CoreML...")
             try:
                 coreml_path = model.export(
                     format="coreml",
-                    imgsz=640
+                    imgsz=export_size
                 )
                 exported_models['coreml'] = coreml_path
                 logger.info(f"✅ CoreML export: {coreml_path}")
@@ -296,13 +355,47 @@ Where coordinates are normalized (0-1).
             logger.error(f"❌ Export failed: {str(e)}")
             raise
     
-    def validate_model(self, model_path: str, test_image: Optional[str] = None) -> bool:
+    def _export_tflite_nms(self, model, export_size, tflite_path: str, nms: dict) -> dict:
+        """
+        TFLite export with NMS in the graph ([1, max_det, 6] output).
+        
+        Needs an ultralytics release whose exporter supports nms=True; the
+        export reuses the raw model's file name, so that file is set aside.
+        """
+        import shutil
+
+        raw_path = Path(tflite_path)
+        kept = raw_path.with_name(f"{raw_path.stem}_raw{raw_path.suffix}")
+        shutil.move(str(raw_path), str(kept))
+        try:
+            exported = model.export(
+                format="tflite",
+                imgsz=export_size,
+                int8=True,
+                nms=True,
+                iou=nms["iou_threshold"],
+                conf=nms["score_threshold"],
+                max_det=nms["max_detections"]
+            )
+            nms_path = raw_path.with_name(f"{raw_path.stem}_nms{raw_path.suffix}")
+            shutil.move(str(exported), str(nms_path))
+            logger.info(f"✅ TFLite export with embedded NMS: {nms_path}")
+            return {'tflite_nms': str(nms_path)}
+        except Exception as e:
+            logger.warning(f"⚠️  TFLite export with embedded NMS failed: {str(e)}")
+            return {}
+        finally:
+            shutil.move(str(kept), str(raw_path))
+    
+    def validate_model(self, model_path: str, test_image: Optional[str] = None,
+                       imgsz: Tuple[int, int] = (640, 640)) -> bool:
         """
         Validate exported model with test inference.
         
         Args:
             model_path: Path to model
             test_image: Optional test image path
+            imgsz: Input (height, width) the model was exported with
             
         Returns:
             True if validation passes
@@ -310,11 +403,13 @@ Where coordinates are normalized (0-1).
         logger.info(f"Validating model: {model_path}")
         
         try:
+            from ultralytics import YOLO
+
             model = YOLO(model_path)
             
             if test_image and Path(test_image).exists():
                 # Test with provided image
-                results = model(test_image)
+                results = model(test_image, imgsz=list(imgsz))
                 logger.info(f"✅ Validation passed with test image")
                 
                 # Print detections
@@ -325,8 +420,9 @@ Where coordinates are normalized (0-1).
                         logger.info("No objects detected")
             else:
                 # Test with dummy image
-                dummy_image = np.random.randint(0, 255, (640, 640, 3), dtype=np.uint8)
-                results = model(dummy_image)
+                import numpy as np
+                dummy_image = np.random.randint(0, 255, (imgsz[0], imgsz[1], 3), dtype=np.uint8)
+                results = model(dummy_image, imgsz=list(imgsz))
                 logger.info(f"✅ Validation passed with dummy image")
             
             return True
@@ -335,13 +431,15 @@ Where coordinates are normalized (0-1).
             logger.error(f"❌ Validation failed: {str(e)}")
             return False
     
-    def create_deployment_assets(self, exported_models: dict, output_dir: str):
+    def create_deployment_assets(self, exported_models: dict, output_dir: str,
+                                 imgsz: Tuple[int, int] = (640, 640)):
         """
         Create deployment assets for HazardHawk app.
         
         Args:
             exported_models: Dictionary of exported model paths
             output_dir: Output directory for assets
+            imgsz: Input (height, width) the models were exported with
         """
         logger.info("Creating deployment assets...")
         
@@ -356,6 +454,9 @@ Where coordinates are normalized (0-1).
                     dest_name = "hazard_detection_model.tflite"
                 elif format_name == 'coreml':
                     dest_name = "hazard_detection_model.mlmodel"
+                elif format_name.endswith('_nms'):
+                    # End-to-end variants: detections [K, 6] = x1, y1, x2, y2, score, class
+                    dest_name = f"hazard_detection_model_nms{Path(model_path).suffix}"
                 
                 dest_path = output_path / dest_name
                 
@@ -363,30 +464,54 @@ Where coordinates are normalized (0-1).
                 shutil.copy2(model_path, dest_path)
                 logger.info(f"✅ Deployed {format_name}: {dest_path}")
         
-        # Create class mapping file
+        # model_manifest.py lives at the repository root
+        sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+        from model_manifest import atomic_write_json, compile_manifest, update_model
+        
+        # Create class mapping file (same {"classes": [...]} shape as convert_to_tflite.py)
+        class_names = [name for name, _ in sorted(self.safety_classes.items(), key=lambda item: item[1])]
         classes_file = output_path / "hazard_classes.json"
-        import json
-        with open(classes_file, 'w') as f:
-            json.dump(self.safety_classes, f, indent=2)
+        atomic_write_json(classes_file, {"classes": class_names})
         logger.info(f"✅ Created classes file: {classes_file}")
         
         # Create model info file
         model_info = {
             "model_name": "YOLOv8 Construction Hazard Detection",
             "version": "1.0.0",
-            "input_size": [640, 640],
-            "classes": self.safety_classes,
+            "input_size": list(imgsz),
+            "input_layout": "height_width",
+            # Output is [1, 4 + num_classes, num_anchors] for every shape
+            "output_shape": [1, 4 + len(class_names), num_anchors(imgsz)],
+            "classes": class_names,
             "description": "YOLOv8 model fine-tuned for construction safety hazard detection",
             "formats": list(exported_models.keys())
         }
+        if 'onnx_nms' in exported_models:
+            import onnx
+
+            metadata = {p.key: p.value for p in onnx.load(exported_models['onnx_nms']).metadata_props}
+            model_info["embedded_nms"] = json.loads(metadata["embedded_nms"])
         
         info_file = output_path / "model_info.json"
-        with open(info_file, 'w') as f:
-            json.dump(model_info, f, indent=2)
+        atomic_write_json(info_file, model_info)
         logger.info(f"✅ Created model info: {info_file}")
+        
+        if (output_path / "hazard_detection_model.tflite").exists():
+            update_model("hazard_detector", {
+                "role": "hazard_detector",
+                "format": "tflite",
+                "version": model_info["version"],
+                "files": ["hazard_detection_model.tflite"],
+                "description": model_info["description"],
+                "input_size": model_info["input_size"],
+                "classes": class_names,
+                "config": {"input_layout": "height_width", "output_shape": model_info["output_shape"]}
+            }, assets_dir=output_path)
+            compile_manifest(output=output_path / "model_manifest.json")
+            logger.info(f"✅ Updated model manifest: {output_path / 'model_manifest.json'}")
 
-def main():
-    parser = argparse.ArgumentParser(description="Setup YOLOv8 for construction hazard detection")
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Register the setup options on a parser (shared with model_tools.py)."""
     parser.add_argument("--model-size", choices=['n', 's', 'm', 'l', 'x'], default='n', 
                        help="YOLOv8 model size")
     parser.add_argument("--models-dir", default="./models/yolo_hazard", 
@@ -401,11 +526,20 @@ def main():
                        help="Only export existing model to mobile formats")
     parser.add_argument("--deploy-to", type=str, 
                        help="Deploy to specific directory")
-    
-    args = parser.parse_args()
-    
+    parser.add_argument("--imgsz", default="640",
+                       help="Export size: 640 (square, or long side with --aspect) or WxH such as 640x480")
+    parser.add_argument("--aspect", choices=sorted(ASPECT_RATIOS),
+                       help="Camera aspect ratio (width:height) to match, e.g. 4:3 -> 640x480")
+    parser.add_argument("--embed-nms", action="store_true",
+                       help="Also export end-to-end models with decode, top-k and NMS in the graph")
+    parser.add_argument("--nms-config", type=str,
+                       help="model_config.json with the NMS thresholds to bake in")
+
+def run(args: argparse.Namespace) -> None:
+    """Run the setup for parsed arguments."""
     try:
         setup = HazardDetectionSetup(args.models_dir)
+        imgsz = parse_imgsz(args.imgsz, args.aspect)
         
         if args.export_only:
             # Export existing model only
@@ -413,10 +547,10 @@ def main():
                 logger.error(f"Model not found: {args.export_only}")
                 sys.exit(1)
             
-            exported = setup.export_to_mobile_formats(args.export_only)
+            exported = setup.export_to_mobile_formats(args.export_only, imgsz, args.embed_nms, args.nms_config)
             
             if args.deploy_to:
-                setup.create_deployment_assets(exported, args.deploy_to)
+                setup.create_deployment_assets(exported, args.deploy_to, imgsz)
             
         else:
             # Full setup process
@@ -448,20 +582,28 @@ def main():
                 )
                 
                 # Export trained model
-                exported = setup.export_to_mobile_formats(trained_model)
+                exported = setup.export_to_mobile_formats(trained_model, imgsz, args.embed_nms, args.nms_config)
             else:
                 # Export base model for testing
                 logger.info("Exporting base model for testing...")
-                exported = setup.export_to_mobile_formats(base_model)
+                exported = setup.export_to_mobile_formats(base_model, imgsz, args.embed_nms, args.nms_config)
             
-            # Validate exports
+            # Validate exports (end-to-end models are checked against host NMS instead)
             for format_name, model_path in exported.items():
-                if Path(model_path).exists():
-                    setup.validate_model(model_path)
+                if Path(model_path).exists() and not format_name.endswith('_nms'):
+                    setup.validate_model(model_path, imgsz=imgsz)
+            if 'onnx_nms' in exported:
+                from onnx_embedded_nms import check_parity
+
+                parity = check_parity(exported['onnx'], exported['onnx_nms'])
+                if parity["mismatched"]:
+                    logger.warning(f"⚠️  Embedded NMS differs from host NMS: {parity['mismatched']}")
+                else:
+                    logger.info(f"✅ Embedded NMS matches host NMS on {parity['inputs']} inputs")
             
             # Deploy if requested
             if args.deploy_to:
-                setup.create_deployment_assets(exported, args.deploy_to)
+                setup.create_deployment_assets(exported, args.deploy_to, imgsz)
             
             logger.info("🎉 YOLOv8 Construction Hazard Detection Setup Complete!")
             
@@ -475,5 +617,10 @@ def main():
         logger.error(f"❌ Setup failed: {str(e)}")
         sys.exit(1)
 
+def main():
+    parser = argparse.ArgumentParser(description="Setup YOLOv8 for construction hazard detection")
+    add_arguments(parser)
+    run(parser.parse_args())
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
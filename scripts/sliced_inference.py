@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Tiled (sliced) high-resolution inference for small PPE objects
+
+Downscaling a 12 MP site photo to 640 shrinks a hard hat 40 m away to a few
+pixels, and a 1280 model costs about 4x the compute on every photo. Sliced
+inference runs the 640 detector on overlapping native-resolution tiles
+instead:
+
+1. The photo is covered with tile x tile windows (default: the model input
+   size) overlapping by `overlap`; edge tiles are shifted inwards so every
+   tile is full size and needs no resize.
+2. Tiles with too little edge energy (sky, bare walls), or, given the
+   previous frame, too little change, are skipped. Detections of the
+   previous frame centred in an unchanged tile are carried over, so static
+   objects do not drop out of the sequence.
+3. Kept tiles go through the detector in batches, boxes are offset back to
+   image coordinates, and an optional downscaled full-frame pass adds the
+   large objects a tile cannot contain. Only dynamic-batch (dynamic=True)
+   or fixed-batch (batch=N) exports really batch; the static batch-1
+   exports setup_yolo_hazard_detection.py produces run tile by tile.
+4. Results are merged with class-aware NMS. Objects cut by a tile border
+   produce partial boxes, so the merge uses intersection-over-smaller by
+   default.
+
+The benchmark compares small-object recall and total latency of sliced 640
+against full-frame 640 and 1280 on a YOLO-format labelled set.
+
+Usage:
+    python sliced_inference.py detect construction_safety_full.onnx photo.jpg --overlap 0.2
+    python sliced_inference.py benchmark --model-640 full_640.onnx --model-1280 full_1280.onnx \\
+        --images data/val/images --labels data/val/labels
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from yolo_runtime import Detections, YoloDetector, batched_nms, box_iou, load_image
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_OVERLAP = 0.2
+DEFAULT_MERGE_IOU = 0.5
+DEFAULT_EDGE_THRESHOLD = 4.0
+DEFAULT_MOTION_THRESHOLD = 3.0
+ACTIVITY_SCALE = 8
+# COCO-style "small", measured in original-image pixels of a 12 MP photo
+DEFAULT_SMALL_AREA = 64 * 64
+
+
+def tile_grid(width: int, height: int, tile: Tuple[int, int], overlap: float = DEFAULT_OVERLAP) -> List[Tuple[int, int, int, int]]:
+    """
+    (x0, y0, x1, y1) windows of size tile (height, width) covering the image.
+
+    The last row/column is aligned to the image edge instead of padded.
+    """
+    tile_h, tile_w = tile
+
+    def starts(length, size):
+        if length <= size:
+            return [0]
+        stride = max(1, int(size * (1 - overlap)))
+        positions = list(range(0, length - size, stride))
+        positions.append(length - size)
+        return positions
+
+    return [(x, y, min(x + tile_w, width), min(y + tile_h, height))
+            for y in starts(height, tile_h) for x in starts(width, tile_w)]
+
+
+def _gray_small(image):
+    import numpy as np
+
+    small = image[::ACTIVITY_SCALE, ::ACTIVITY_SCALE].astype(np.float32)
+    return small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def tile_activity(image, tiles, previous=None) -> Tuple[List[float], Optional[List[float]]]:
+    """
+    Mean gradient magnitude per tile and, with a previous frame of the same
+    size, mean absolute difference per tile; both on a 1/8 scale grayscale.
+    """
+    import numpy as np
+
+    gray = _gray_small(image)
+    gradient = np.zeros_like(gray)
+    gradient[:, 1:] += np.abs(np.diff(gray, axis=1))
+    gradient[1:, :] += np.abs(np.diff(gray, axis=0))
+    difference = np.abs(gray - _gray_small(previous)) if previous is not None else None
+
+    def tile_mean(values, box):
+        x0, y0, x1, y1 = (v // ACTIVITY_SCALE for v in box)
+        return float(values[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)].mean())
+
+    edges = [tile_mean(gradient, box) for box in tiles]
+    motion = [tile_mean(difference, box) for box in tiles] if difference is not None else None
+    return edges, motion
+
+
+def merge(detections: Detections, iou: float = DEFAULT_MERGE_IOU, metric: str = "ios",
+          max_detections: int = 300) -> Detections:
+    """Class-aware NMS across tiles (and the full-frame pass)"""
+    keep = batched_nms(detections.boxes, detections.scores, detections.classes, iou, max_detections, metric)
+    return detections.select(keep)
+
+
+def sliced_detect(detector: YoloDetector, image, overlap: float = DEFAULT_OVERLAP, batch_size: int = 8,
+                  full_frame: bool = True, edge_threshold: float = 0.0, previous=None,
+                  motion_threshold: float = DEFAULT_MOTION_THRESHOLD, merge_iou: float = DEFAULT_MERGE_IOU,
+                  merge_metric: str = "ios", previous_detections: Optional[Detections] = None
+                  ) -> Tuple[Detections, Dict]:
+    """
+    Detect on overlapping native-resolution tiles.
+
+    With a previous frame, tiles without motion are not run again; the
+    previous frame's detections (previous_detections) centred in them are
+    reused instead.
+
+    Returns:
+        (merged detections in image pixels, stats with tile counts)
+    """
+    import numpy as np
+
+    height, width = image.shape[:2]
+    tile_h, tile_w = detector.input_shape
+    tiles = tile_grid(width, height, (tile_h, tile_w), overlap)
+
+    keep = [True] * len(tiles)
+    static = []
+    if edge_threshold > 0 or previous is not None:
+        edges, motion = tile_activity(image, tiles, previous)
+        keep = [e >= edge_threshold for e in edges]
+        if motion is not None:
+            static = [box for box, k, m in zip(tiles, keep, motion) if k and m < motion_threshold]
+            keep = [k and m >= motion_threshold for k, m in zip(keep, motion)]
+    active = [box for box, k in zip(tiles, keep) if k]
+
+    crops = []
+    for x0, y0, x1, y1 in active:
+        crop = image[y0:y1, x0:x1]
+        if crop.shape[:2] != (tile_h, tile_w):
+            # Image smaller than a tile along this axis
+            padded = np.full((tile_h, tile_w, 3), 114, dtype=np.uint8)
+            padded[:crop.shape[0], :crop.shape[1]] = crop
+            crop = padded
+        crops.append(crop)
+
+    parts = []
+    for (x0, y0, _, _), found in zip(active, detector.detect_batch(crops, batch_size=batch_size)):
+        found.boxes = found.boxes + np.array([x0, y0, x0, y0], dtype=np.float32)
+        parts.append(found)
+    carried = 0
+    if static and previous_detections is not None and len(previous_detections):
+        centers = (previous_detections.boxes[:, :2] + previous_detections.boxes[:, 2:]) / 2
+
+        def inside(box):
+            return ((centers[:, 0] >= box[0]) & (centers[:, 0] < box[2])
+                    & (centers[:, 1] >= box[1]) & (centers[:, 1] < box[3]))
+
+        reused = np.zeros(len(centers), dtype=bool)
+        for box in static:
+            reused |= inside(box)
+        # Objects also inside a re-run tile are detected afresh there
+        for box in active:
+            reused &= ~inside(box)
+        carried = int(reused.sum())
+        parts.append(previous_detections.select(np.flatnonzero(reused)))
+    if full_frame:
+        parts.append(detector.detect(image))
+
+    merged = merge(Detections.concatenate(parts), merge_iou, merge_metric, detector.max_detections)
+    stats = {"tiles": len(tiles), "tiles_run": len(active), "tiles_skipped": len(tiles) - len(active),
+             "detections_carried": carried, "full_frame": full_frame}
+    return merged, stats
+
+
+def load_labels(label_path: Path, width: int, height: int):
+    """YOLO-format `class cx cy w h` (normalized) to xyxy pixels and class ids"""
+    import numpy as np
+
+    if not label_path.exists():
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.int64)
+    rows = np.loadtxt(label_path, ndmin=2, dtype=np.float32)
+    if rows.size == 0:
+        return np.zeros((0, 4), np.float32), np.zeros(0, np.int64)
+    cls, cx, cy, w, h = rows[:, 0], rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return boxes, cls.astype(np.int64)
+
+
+def match_recall(detections: Detections, gt_boxes, gt_classes, iou: float = 0.5,
+                 small_area: float = DEFAULT_SMALL_AREA) -> Dict[str, int]:
+    """Ground-truth objects found (same class, IoU >= iou), overall and for small objects"""
+    import numpy as np
+
+    areas = (gt_boxes[:, 2] - gt_boxes[:, 0]) * (gt_boxes[:, 3] - gt_boxes[:, 1])
+    found = np.zeros(len(gt_boxes), dtype=bool)
+    for i, (box, cls) in enumerate(zip(gt_boxes, gt_classes)):
+        candidates = detections.classes == cls
+        if candidates.any():
+            found[i] = box_iou(box, detections.boxes[candidates]).max() >= iou
+    small = areas < small_area
+    return {"objects": len(gt_boxes), "found": int(found.sum()),
+            "small_objects": int(small.sum()), "small_found": int((found & small).sum())}
+
+
+def benchmark(model_640: str, images_dir: str, labels_dir: str, model_1280: Optional[str] = None,
+              overlap: float = DEFAULT_OVERLAP, edge_threshold: float = DEFAULT_EDGE_THRESHOLD,
+              conf: float = 0.25, small_area: float = DEFAULT_SMALL_AREA, limit: Optional[int] = None) -> Dict:
+    """
+    Recall (all / small objects) and latency per strategy over a labelled set.
+    """
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if limit:
+        paths = paths[:limit]
+    if not paths:
+        raise ValueError(f"No images in {images_dir}")
+
+    detector_640 = YoloDetector(model_640, conf)
+    strategies = {
+        "full_640": lambda image: (detector_640.detect(image), {}),
+        "sliced_640": lambda image: sliced_detect(detector_640, image, overlap),
+        "sliced_640_skip": lambda image: sliced_detect(detector_640, image, overlap, edge_threshold=edge_threshold),
+    }
+    if model_1280:
+        detector_1280 = YoloDetector(model_1280, conf)
+        strategies["full_1280"] = lambda image: (detector_1280.detect(image), {})
+
+    totals = {name: {"objects": 0, "found": 0, "small_objects": 0, "small_found": 0, "latency_ms": [],
+                     "tiles_run": 0, "tiles": 0} for name in strategies}
+    for path in paths:
+        image = load_image(str(path))
+        gt_boxes, gt_classes = load_labels(Path(labels_dir) / f"{path.stem}.txt", image.shape[1], image.shape[0])
+        for name, run in strategies.items():
+            start = time.perf_counter()
+            detections, stats = run(image)
+            totals[name]["latency_ms"].append((time.perf_counter() - start) * 1000)
+            for key, value in match_recall(detections, gt_boxes, gt_classes, small_area=small_area).items():
+                totals[name][key] += value
+            totals[name]["tiles"] += stats.get("tiles", 0)
+            totals[name]["tiles_run"] += stats.get("tiles_run", 0)
+
+    report = {}
+    for name, total in totals.items():
+        report[name] = {
+            "recall": round(total["found"] / total["objects"], 4) if total["objects"] else None,
+            "small_recall": round(total["small_found"] / total["small_objects"], 4) if total["small_objects"] else None,
+            "mean_latency_ms": round(statistics.mean(total["latency_ms"]), 1),
+            "total_latency_s": round(sum(total["latency_ms"]) / 1000, 2),
+        }
+        if total["tiles"]:
+            report[name]["tiles_skipped_share"] = round(1 - total["tiles_run"] / total["tiles"], 3)
+    return {"images": len(paths), "strategies": report}
+
+
+def log_report(report: Dict) -> None:
+    logger.info(f"📊 {report['images']} images")
+    for name, result in report["strategies"].items():
+        skipped = f", {result['tiles_skipped_share'] * 100:.0f}% tiles skipped" if "tiles_skipped_share" in result else ""
+        logger.info(f"   {name:16s} recall {result['recall']}, small recall {result['small_recall']}, "
+                    f"{result['mean_latency_ms']} ms/image{skipped}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sliced high-resolution YOLO inference")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    det = subparsers.add_parser("detect", help="Run sliced inference on photos")
+    det.add_argument("model", help=".onnx or .tflite detector")
+    det.add_argument("images", nargs="+", help="Photos")
+    det.add_argument("--conf", type=float, default=0.25, help="Score threshold")
+    det.add_argument("--overlap", type=float, default=DEFAULT_OVERLAP, help="Tile overlap ratio")
+    det.add_argument("--batch", type=int, default=8, help="Tiles per inference batch (dynamic-batch models)")
+    det.add_argument("--edge-threshold", type=float, default=0.0,
+                     help="Skip tiles with lower mean gradient (0 disables)")
+    det.add_argument("--motion", action="store_true",
+                     help="Treat the photos as a sequence and skip tiles unchanged since the previous one")
+    det.add_argument("--no-full-frame", action="store_true", help="Skip the downscaled full-frame pass")
+
+    bench = subparsers.add_parser("benchmark", help="Compare sliced vs full-frame recall and latency")
+    bench.add_argument("--model-640", required=True, help="Detector with 640 input")
+    bench.add_argument("--model-1280", help="Same detector exported at 1280")
+    bench.add_argument("--images", required=True, help="Directory of labelled photos")
+    bench.add_argument("--labels", required=True, help="Directory of YOLO-format labels")
+    bench.add_argument("--overlap", type=float, default=DEFAULT_OVERLAP)
+    bench.add_argument("--edge-threshold", type=float, default=DEFAULT_EDGE_THRESHOLD)
+    bench.add_argument("--small-area", type=float, default=DEFAULT_SMALL_AREA,
+                       help="Objects below this pixel area count as small")
+    bench.add_argument("--limit", type=int, help="Only use the first N images")
+    bench.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "detect":
+            detector = YoloDetector(args.model, args.conf)
+            if args.batch > 1 and not detector.dynamic_batch and detector.fixed_batch == 1:
+                logger.warning("⚠️  Static batch-1 model: tiles run one at a time "
+                               "(export with dynamic=True or batch=N to batch them)")
+            previous = previous_detections = None
+            for path in args.images:
+                image = load_image(path)
+                if previous is not None and previous.shape != image.shape:
+                    previous = previous_detections = None
+                start = time.perf_counter()
+                detections, stats = sliced_detect(detector, image, args.overlap, args.batch,
+                                                  not args.no_full_frame, args.edge_threshold,
+                                                  previous if args.motion else None,
+                                                  previous_detections=previous_detections)
+                elapsed = (time.perf_counter() - start) * 1000
+                logger.info(f"🔍 {path}: {len(detections)} detections, {stats['tiles_run']}/{stats['tiles']} "
+                            f"tiles in {elapsed:.1f} ms")
+                print(json.dumps({"image": path, "detections": detections.to_json(detector.names)}))
+                previous, previous_detections = image, detections
+        else:
+            report = benchmark(args.model_640, args.images, args.labels, args.model_1280, args.overlap,
+                               args.edge_threshold, small_area=args.small_area, limit=args.limit)
+            if args.json:
+                print(json.dumps(report))
+            else:
+                log_report(report)
+    except Exception as e:
+        logger.error(f"❌ Sliced {args.command} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Vision encoder export for the manifest's vision_encoder entry
+
+model_metadata.json declares a 224x224 vision_encoder.onnx with ImageNet
+normalization, but nothing produced one. This stage exports a CLIP or
+MobileViT vision tower and ships it the way the app consumes camera frames:
+
+    pixels   float32 [N, H, W, 3], RGB in 0..255 (NHWC, straight from the bitmap)
+    -> embedding float32 [N, D]
+
+The resize stays on the device; the normalization from the metadata
+((x / 255 - mean) / std) is part of the graph. For ONNX it is folded into
+the first convolution's weights and bias when that convolution is unpadded
+(CLIP's patch embedding), so it costs nothing; otherwise it stays a single
+Mul + Add in front of the model.
+
+Outputs (only the deployable files go to --output-dir, the app assets):
+    vision_encoder.onnx         int8 weights (MatMul/Gemm by default)
+    vision_encoder.tflite       dynamic-range int8 (ai-edge-torch), optional
+    vision_encoder_fp32.onnx    reference export, kept in --build-dir
+
+The benchmark measures images/sec at batch 1 and batch N, checks cosine
+similarity of the quantized embeddings against fp32, and the numbers are
+written to the vision_encoder manifest record.
+
+Usage:
+    python vision_encoder_export.py export --model openai/clip-vit-base-patch32 --tflite --update-manifest
+    python vision_encoder_export.py benchmark vision_encoder.onnx \
+        --reference models/cache/vision_encoder/vision_encoder_fp32.onnx --batch 8
+"""
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+ASSETS_DIR = Path("HazardHawk/androidApp/src/main/assets")
+METADATA_PATH = ASSETS_DIR / "model_metadata.json"
+# Intermediate and reference exports; never packaged into the APK
+BUILD_DIR = Path(__file__).resolve().parents[1] / "models/cache/vision_encoder"
+
+INPUT_NAME = "pixels"
+OUTPUT_NAME = "embedding"
+DEFAULT_QUANTIZED_OPS = ("MatMul", "Gemm")
+
+MANIFEST_ID = "vision_encoder"
+TFLITE_MANIFEST_ID = "vision_encoder_tflite"
+
+
+def load_preprocessing(metadata_path: str = str(METADATA_PATH)) -> Dict:
+    """Input size and normalization from architecture.vision_encoder in model_metadata.json"""
+    with open(metadata_path, "r") as f:
+        encoder = json.load(f)["architecture"]["vision_encoder"]
+    normalization = encoder["preprocessing"]["normalization"]
+    height, width, channels = encoder["input_size"]
+    if channels != 3 or len(normalization["mean"]) != 3 or len(normalization["std"]) != 3:
+        raise ValueError("vision_encoder expects 3-channel input with per-channel mean/std")
+    return {
+        "height": height,
+        "width": width,
+        "mean": [float(m) for m in normalization["mean"]],
+        "std": [float(s) for s in normalization["std"]],
+        "resize_method": encoder["preprocessing"].get("resize_method", "bilinear"),
+    }
+
+
+def normalization_affine(mean: Sequence[float], std: Sequence[float]):
+    """Per-channel (scale, bias) with (x / 255 - mean) / std == x * scale + bias"""
+    import numpy as np
+
+    std = np.asarray(std, dtype=np.float32)
+    mean = np.asarray(mean, dtype=np.float32)
+    return 1.0 / (255.0 * std), -mean / std
+
+
+def load_vision_tower(model_name: str, cache_dir: str):
+    """
+    Load a vision tower that maps NCHW normalized pixels to one embedding per image.
+
+    CLIP returns the projected image embedding (the space the text tower
+    shares); MobileViT returns the pooled features.
+    """
+    import torch
+
+    class CLIPTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).image_embeds
+
+    class PooledTower(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).pooler_output
+
+    if "clip" in model_name.lower():
+        from transformers import CLIPVisionModelWithProjection
+
+        tower = CLIPTower(CLIPVisionModelWithProjection.from_pretrained(model_name, cache_dir=cache_dir))
+    elif "mobilevit" in model_name.lower():
+        from transformers import MobileViTModel
+
+        tower = PooledTower(MobileViTModel.from_pretrained(model_name, cache_dir=cache_dir))
+    else:
+        raise ValueError(f"Unsupported vision model {model_name}; expected a CLIP or MobileViT checkpoint")
+    return tower.eval()
+
+
+def export_onnx(tower, output_path: str, height: int, width: int, opset_version: int = 17) -> None:
+    """Export the tower with NCHW normalized input and a dynamic batch axis"""
+    import torch
+
+    sample = torch.zeros(1, 3, height, width)
+    with torch.no_grad():
+        torch.onnx.export(
+            tower, (sample,), output_path,
+            input_names=["pixel_values"],
+            output_names=[OUTPUT_NAME],
+            dynamic_axes={"pixel_values": {0: "batch"}, OUTPUT_NAME: {0: "batch"}},
+            opset_version=opset_version,
+            do_constant_folding=True,
+        )
+
+
+def _unpadded_conv(node) -> bool:
+    from onnx import helper
+
+    attrs = {a.name: helper.get_attribute_value(a) for a in node.attribute}
+    return not any(attrs.get("pads", [])) and attrs.get("auto_pad", b"NOTSET") in (b"NOTSET", b"VALID") \
+        and attrs.get("group", 1) == 1
+
+
+def embed_preprocessing(model_path: str, output_path: str, mean: Sequence[float], std: Sequence[float]) -> bool:
+    """
+    Put NHWC 0..255 input and the normalization in front of an NCHW graph.
+
+    Returns:
+        True if the normalization was folded into the first Conv, False if
+        it was kept as Mul + Add
+    """
+    import numpy as np
+    import onnx
+    from onnx import TensorProto, helper, numpy_helper
+
+    model = onnx.load(model_path)
+    graph = model.graph
+    original = graph.input[0]
+    old_name = original.name
+    dims = [d for d in original.type.tensor_type.shape.dim]
+    height, width = dims[2].dim_value, dims[3].dim_value
+
+    scale, bias = normalization_affine(mean, std)
+    initializers = {t.name: t for t in graph.initializer}
+    consumers = [n for n in graph.node if old_name in n.input]
+
+    folded = False
+    nchw_name = f"{INPUT_NAME}_nchw"
+    if len(consumers) == 1 and consumers[0].op_type == "Conv" and _unpadded_conv(consumers[0]) \
+            and consumers[0].input[1] in initializers:
+        conv = consumers[0]
+        weight = numpy_helper.to_array(initializers[conv.input[1]]).astype(np.float32)
+        # Conv(W, x * s + b) == Conv(W * s, x) + sum(W * b) without padding
+        bias_shift = (weight * bias[None, :, None, None]).sum(axis=(1, 2, 3))
+        new_weight = weight * scale[None, :, None, None]
+        if len(conv.input) > 2 and conv.input[2]:
+            conv_bias = numpy_helper.to_array(initializers[conv.input[2]]).astype(np.float32) + bias_shift
+        else:
+            conv_bias = bias_shift.astype(np.float32)
+        weight_name, bias_name = f"{conv.input[1]}_prenorm", f"{conv.name or 'conv'}_prenorm_bias"
+        graph.initializer.extend([numpy_helper.from_array(new_weight.astype(np.float32), weight_name),
+                                  numpy_helper.from_array(conv_bias.astype(np.float32), bias_name)])
+        del conv.input[:]
+        conv.input.extend([nchw_name, weight_name, bias_name])
+        prologue = [helper.make_node("Transpose", [INPUT_NAME], [nchw_name], perm=[0, 3, 1, 2],
+                                     name="pixels_to_nchw")]
+        folded = True
+    else:
+        graph.initializer.extend([
+            numpy_helper.from_array(scale.reshape(1, 3, 1, 1).astype(np.float32), "pixel_scale"),
+            numpy_helper.from_array(bias.reshape(1, 3, 1, 1).astype(np.float32), "pixel_bias"),
+        ])
+        prologue = [
+            helper.make_node("Transpose", [INPUT_NAME], [nchw_name], perm=[0, 3, 1, 2], name="pixels_to_nchw"),
+            helper.make_node("Mul", [nchw_name, "pixel_scale"], ["pixels_scaled"], name="pixels_scale"),
+            helper.make_node("Add", ["pixels_scaled", "pixel_bias"], [old_name], name="pixels_normalize"),
+        ]
+
+    nodes = prologue + list(graph.node)
+    del graph.node[:]
+    graph.node.extend(nodes)
+    batch = dims[0].dim_param or dims[0].dim_value
+    graph.input.remove(original)
+    graph.input.insert(0, helper.make_tensor_value_info(INPUT_NAME, TensorProto.FLOAT, [batch, height, width, 3]))
+
+    # Drop initializers that lost their last consumer
+    used = {name for node in graph.node for name in node.input}
+    stale = [t for t in graph.initializer if t.name not in used]
+    for tensor in stale:
+        graph.initializer.remove(tensor)
+
+    onnx.checker.check_model(model)
+    onnx.save(model, output_path)
+    return folded
+
+
+def quantize_onnx(fp32_path: str, output_path: str, op_types: Sequence[str] = DEFAULT_QUANTIZED_OPS) -> None:
+    """Int8 weights with dynamic activation quantization"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(fp32_path, output_path, op_types_to_quantize=list(op_types),
+                     weight_type=QuantType.QInt8, per_channel=True)
+
+
+def export_tflite(tower, output_path: str, height: int, width: int, mean: Sequence[float],
+                  std: Sequence[float], quantize: bool = True) -> None:
+    """Convert with ai-edge-torch; NHWC 0..255 input, normalization in the graph"""
+    import ai_edge_torch
+    import torch
+
+    scale, bias = normalization_affine(mean, std)
+
+    class NHWCTower(torch.nn.Module):
+        def __init__(self, tower):
+            super().__init__()
+            self.tower = tower
+            self.register_buffer("scale", torch.from_numpy(scale).reshape(1, 3, 1, 1))
+            self.register_buffer("bias", torch.from_numpy(bias).reshape(1, 3, 1, 1))
+
+        def forward(self, pixels):
+            return self.tower(pixels.permute(0, 3, 1, 2) * self.scale + self.bias)
+
+    flags = {}
+    if quantize:
+        import tensorflow as tf
+
+        flags["optimizations"] = [tf.lite.Optimize.DEFAULT]
+    edge_model = ai_edge_torch.convert(NHWCTower(tower).eval(), (torch.zeros(1, height, width, 3),),
+                                       _ai_edge_converter_flags=flags)
+    edge_model.export(output_path)
+
+
+def sample_images(height: int, width: int, count: int, image_dir: Optional[str] = None):
+    """NHWC float32 batch from real photos (resized like the app) or seeded noise"""
+    import numpy as np
+
+    if image_dir:
+        from PIL import Image
+
+        paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        if paths:
+            images = [np.asarray(Image.open(p).convert("RGB").resize((width, height), Image.BILINEAR),
+                                 dtype=np.float32) for p in paths[:count]]
+            while len(images) < count:
+                images.append(images[len(images) % len(paths)])
+            return np.stack(images)
+    rng = np.random.default_rng(0)
+    return rng.uniform(0, 255, size=(count, height, width, 3)).astype(np.float32)
+
+
+class _OrtEncoder:
+    def __init__(self, path: str, threads: Optional[int]):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input: batch})[0]
+
+
+class _TFLiteEncoder:
+    def __init__(self, path: str, threads: Optional[int]):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite.python.interpreter import Interpreter
+        self.interpreter = Interpreter(model_path=path, num_threads=threads or 4)
+        self.input = self.interpreter.get_input_details()[0]["index"]
+        self.output = self.interpreter.get_output_details()[0]["index"]
+        self.batch = None
+
+    def __call__(self, batch):
+        if batch.shape[0] != self.batch:
+            self.interpreter.resize_tensor_input(self.input, list(batch.shape))
+            self.interpreter.allocate_tensors()
+            self.batch = batch.shape[0]
+        self.interpreter.set_tensor(self.input, batch)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output)
+
+
+def open_encoder(path: str, threads: Optional[int] = None):
+    return _TFLiteEncoder(path, threads) if path.endswith(".tflite") else _OrtEncoder(path, threads)
+
+
+def cosine_similarity(a, b) -> List[float]:
+    import numpy as np
+
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1).tolist()
+
+
+def benchmark(model_path: str, batch_sizes: Sequence[int] = (1, 8), reference: Optional[str] = None,
+              image_dir: Optional[str] = None, repeat: int = 10, threads: Optional[int] = None) -> Dict:
+    """
+    Images/sec per batch size, and cosine similarity against a reference encoder.
+    """
+    encoder = open_encoder(model_path, threads)
+    height, width = _input_hw(model_path, encoder)
+    images = sample_images(height, width, max(batch_sizes), image_dir)
+
+    result = {"model": model_path, "size_mb": round(Path(model_path).stat().st_size / (1024 * 1024), 2),
+              "batches": {}}
+    for batch_size in batch_sizes:
+        batch = images[:batch_size]
+        encoder(batch)  # warm-up and (TFLite) tensor allocation
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            encoder(batch)
+            timings.append(time.perf_counter() - start)
+        median = statistics.median(timings)
+        result["batches"][batch_size] = {
+            "latency_ms": round(median * 1000, 2),
+            "images_per_second": round(batch_size / median, 1),
+        }
+
+    if reference:
+        similarity = cosine_similarity(encoder(images), open_encoder(reference, threads)(images))
+        result["min_cosine_similarity"] = round(min(similarity), 5)
+        result["mean_cosine_similarity"] = round(statistics.mean(similarity), 5)
+    return result
+
+
+def _input_hw(model_path: str, encoder):
+    if isinstance(encoder, _TFLiteEncoder):
+        shape = encoder.interpreter.get_input_details()[0]["shape"]
+    else:
+        shape = encoder.session.get_inputs()[0].shape
+    return int(shape[1]), int(shape[2])
+
+
+def export(model_name: str, output_dir: str = str(ASSETS_DIR), cache_dir: str = "./model_cache",
+           metadata_path: str = str(METADATA_PATH), tflite: bool = False,
+           quantized_ops: Sequence[str] = DEFAULT_QUANTIZED_OPS, opset_version: int = 17,
+           build_dir: str = str(BUILD_DIR)) -> Dict:
+    """
+    Export, embed preprocessing and quantize.
+
+    The deployable encoders are written to output_dir; the fp32 reference
+    they are checked against stays in build_dir.
+
+    Returns:
+        Paths of the produced files and whether the normalization was folded
+    """
+    preprocessing = load_preprocessing(metadata_path)
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    build = Path(build_dir)
+    build.mkdir(parents=True, exist_ok=True)
+    height, width = preprocessing["height"], preprocessing["width"]
+
+    logger.info(f"Loading vision tower from {model_name}...")
+    tower = load_vision_tower(model_name, cache_dir)
+
+    raw_path = build / "vision_encoder_nchw.onnx"
+    fp32_path = build / "vision_encoder_fp32.onnx"
+    int8_path = output / "vision_encoder.onnx"
+
+    logger.info(f"Exporting ONNX at {width}x{height}...")
+    export_onnx(tower, str(raw_path), height, width, opset_version)
+    folded = embed_preprocessing(str(raw_path), str(fp32_path), preprocessing["mean"], preprocessing["std"])
+    raw_path.unlink()
+    logger.info("✅ Normalization folded into the first Conv" if folded
+                else "✅ Normalization embedded as Mul + Add")
+
+    quantize_onnx(str(fp32_path), str(int8_path), quantized_ops)
+    logger.info(f"✅ Int8 ONNX encoder: {int8_path} ({int8_path.stat().st_size / (1024 * 1024):.1f} MB)")
+
+    paths = {"model": model_name, "fp32": str(fp32_path), "onnx": str(int8_path), "folded": folded,
+             "preprocessing": preprocessing, "quantized_ops": list(quantized_ops)}
+    if tflite:
+        tflite_path = output / "vision_encoder.tflite"
+        export_tflite(tower, str(tflite_path), height, width, preprocessing["mean"], preprocessing["std"])
+        paths["tflite"] = str(tflite_path)
+        logger.info(f"✅ TFLite encoder: {tflite_path} ({tflite_path.stat().st_size / (1024 * 1024):.1f} MB)")
+    return paths
+
+
+def record_in_manifest(paths: Dict, results: Dict[str, Dict], assets_dir: Optional[str] = None) -> None:
+    """Write files, input contract and measured throughput to the vision encoder records"""
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    import model_manifest
+
+    assets_dir = Path(assets_dir or model_manifest.ASSETS_DIR).resolve()
+
+    def asset(path):
+        try:
+            return str(Path(path).resolve().relative_to(assets_dir))
+        except ValueError:
+            raise ValueError(f"{path} is not inside the assets directory {assets_dir}")
+
+    def stats(result):
+        measured = {"model_size_mb": result["size_mb"]}
+        for batch_size, numbers in result["batches"].items():
+            measured[f"images_per_second_batch{batch_size}"] = numbers["images_per_second"]
+            measured[f"latency_ms_batch{batch_size}"] = numbers["latency_ms"]
+        if "min_cosine_similarity" in result:
+            measured["min_cosine_similarity_vs_fp32"] = result["min_cosine_similarity"]
+        return measured
+
+    preprocessing = paths["preprocessing"]
+    config = {
+        "preprocessing": {
+            "normalization": {"mean": preprocessing["mean"], "std": preprocessing["std"]},
+            "resize_method": preprocessing["resize_method"],
+            # The graph normalizes; the app must only resize and pass 0..255 RGB
+            "normalization_in_graph": True,
+        },
+        "input": {"name": INPUT_NAME, "layout": "NHWC", "dtype": "float32", "range": [0, 255]},
+        "output": OUTPUT_NAME,
+    }
+    entries = [(MANIFEST_ID, "onnx", paths["onnx"], "int8")]
+    if paths.get("tflite"):
+        entries.append((TFLITE_MANIFEST_ID, "tflite", paths["tflite"], "int8_dynamic_range"))
+
+    for model_id, model_format, path, quantization in entries:
+        patch = {
+            "role": "vision_encoder",
+            "format": model_format,
+            "version": "2.0.0",
+            "files": [asset(path)],
+            "description": f"{paths['model']} vision tower, normalization in graph",
+            "source": paths["model"],
+            "quantization": quantization,
+            "input_size": [preprocessing["height"], preprocessing["width"], 3],
+            "config": config,
+        }
+        if path in results:
+            patch["stats"] = stats(results[path])
+        model_manifest.update_model(model_id, patch, assets_dir=assets_dir)
+    model_manifest.compile_manifest()
+
+
+def log_result(result: Dict) -> None:
+    logger.info(f"📏 {result['model']}: {result['size_mb']} MB")
+    for batch_size, numbers in result["batches"].items():
+        logger.info(f"   batch {batch_size}: {numbers['latency_ms']} ms, {numbers['images_per_second']} images/s")
+    if "min_cosine_similarity" in result:
+        logger.info(f"   cosine vs reference: min {result['min_cosine_similarity']}, "
+                    f"mean {result['mean_cosine_similarity']}")
+
+
+def _batches(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and benchmark the vision encoder")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    exp = subparsers.add_parser("export", help="Export a CLIP/MobileViT vision tower to ONNX (and TFLite)")
+    exp.add_argument("--model", default="openai/clip-vit-base-patch32", help="Hugging Face vision model")
+    exp.add_argument("--output-dir", default=str(ASSETS_DIR), help="Directory for the deployable encoders")
+    exp.add_argument("--build-dir", default=str(BUILD_DIR), help="Directory for the fp32 reference export")
+    exp.add_argument("--cache-dir", default="./model_cache", help="Model cache directory")
+    exp.add_argument("--metadata", default=str(METADATA_PATH), help="model_metadata.json with the input contract")
+    exp.add_argument("--tflite", action="store_true", help="Also export a dynamic-range int8 TFLite model")
+    exp.add_argument("--quantize-ops", default=",".join(DEFAULT_QUANTIZED_OPS),
+                     help="Comma-separated ONNX op types to quantize (add Conv for conv-heavy towers)")
+    exp.add_argument("--batch", type=_batches, default=[1, 8], help="Batch sizes to benchmark")
+    exp.add_argument("--images", help="Directory of sample photos for the benchmark and parity check")
+    exp.add_argument("--update-manifest", action="store_true", help="Record files and measurements in the manifest")
+
+    bench = subparsers.add_parser("benchmark", help="Measure images/sec of an exported encoder")
+    bench.add_argument("model", help=".onnx or .tflite encoder")
+    bench.add_argument("--reference", help="Encoder to compare embeddings against (e.g. the fp32 ONNX)")
+    bench.add_argument("--batch", type=_batches, default=[1, 8], help="Comma-separated batch sizes")
+    bench.add_argument("--images", help="Directory of sample photos")
+    bench.add_argument("--threads", type=int, help="Intra-op threads")
+    bench.add_argument("--json", action="store_true", help="Print the result as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            paths = export(args.model, args.output_dir, args.cache_dir, args.metadata, args.tflite,
+                           [op for op in args.quantize_ops.split(",") if op], build_dir=args.build_dir)
+            results = {}
+            for path in [paths["fp32"], paths["onnx"], paths.get("tflite")]:
+                if path:
+                    reference = None if path == paths["fp32"] else paths["fp32"]
+                    results[path] = benchmark(path, args.batch, reference, args.images)
+                    log_result(results[path])
+            if args.update_manifest:
+                record_in_manifest(paths, results)
+                logger.info("📝 Vision encoder manifest records updated")
+        else:
+            result = benchmark(args.model, args.batch, args.reference, args.images, threads=args.threads)
+            if args.json:
+                print(json.dumps(result))
+            else:
+                log_result(result)
+    except Exception as e:
+        logger.error(f"❌ Vision encoder {args.command} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
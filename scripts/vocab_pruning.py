@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Domain vocabulary pruning for the Gemma decoder
+
+Gemma's 256000-token vocabulary makes the LM-head MatMul and the softmax
+the largest per-token cost of CPU decoding, yet our prompts and reports
+(construction-safety JSON) use a small fraction of it. This tool:
+
+1. tokenizes a corpus of our prompts and reports and collects the used ids
+2. keeps those, every special/added token, the <0x00>..<0xFF> byte-fallback
+   tokens (so any text still encodes) and the `--margin` most common tokens
+   (BPE merge rank), closed under merges so each kept token stays reachable
+3. writes a remapped tokenizer.json and vocab_map.json (new id -> old id)
+4. slices every vocabulary-sized axis of the ONNX weights (embedding,
+   LM head, biases) and the vocab-sized dims of graph inputs/outputs
+5. reports size, decode speed and greedy parity against the original
+
+Prune before quantizing: block-quantized weights (MatMulNBits,
+GatherBlockQuantized) cannot be sliced here.
+
+Usage:
+    python vocab_pruning.py prune --model model.onnx --tokenizer tokenizer.json \\
+        --corpus prompts/ reports/ --output-dir pruned --margin 8000
+"""
+
+import argparse
+import json
+import logging
+import re
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+CORPUS_SUFFIXES = (".txt", ".json", ".jsonl", ".md")
+BYTE_TOKEN = re.compile(r"^<0x[0-9A-Fa-f]{2}>$")
+QUANTIZED_OPS = ("MatMulNBits", "GatherBlockQuantized")
+
+
+def corpus_texts(paths: Iterable[str]) -> List[str]:
+    """Raw text of every corpus file (JSON is kept verbatim: that is what the model emits)"""
+    texts = []
+    for path in map(Path, paths):
+        files = sorted(p for p in path.rglob("*") if p.suffix in CORPUS_SUFFIXES) if path.is_dir() else [path]
+        for file in files:
+            if file.suffix == ".jsonl":
+                with open(file, "r", encoding="utf-8") as f:
+                    texts.extend(line.strip() for line in f if line.strip())
+            else:
+                texts.append(file.read_text(encoding="utf-8"))
+    return texts
+
+
+def used_token_ids(tokenizer_path: str, texts: List[str]) -> Dict[int, int]:
+    """Token id -> count over the corpus (special tokens included)"""
+    from tokenizers import Tokenizer
+
+    tokenizer = Tokenizer.from_file(str(tokenizer_path))
+    counts: Dict[int, int] = {}
+    for encoding in tokenizer.encode_batch(texts, add_special_tokens=True):
+        for token_id in encoding.ids:
+            counts[token_id] = counts.get(token_id, 0) + 1
+    return counts
+
+
+def _merge_pairs(model: Dict) -> List[List[str]]:
+    # tokenizers writes merges as "a b" strings (older) or [a, b] pairs (newer)
+    return [m.split(" ", 1) if isinstance(m, str) else list(m) for m in model.get("merges", [])]
+
+
+def select_vocabulary(tokenizer_json: Dict, used_ids: Iterable[int], margin: int = 0) -> List[int]:
+    """
+    Old token ids to keep, ascending.
+
+    Args:
+        tokenizer_json: Parsed tokenizer.json (BPE or Unigram model)
+        used_ids: Ids seen in the corpus
+        margin: Also keep this many of the most common tokens
+    """
+    model = tokenizer_json["model"]
+    if model["type"] == "BPE":
+        vocab = model["vocab"]
+        pieces = {token_id: piece for piece, token_id in vocab.items()}
+        merges = _merge_pairs(model)
+        # Tokens produced by early merges are the most frequent in the training data
+        rank = {vocab[a + b]: i + 1 for i, (a, b) in enumerate(merges) if a + b in vocab}
+        common = sorted(pieces, key=lambda token_id: (rank.get(token_id, 0), token_id))[:margin]
+    elif model["type"] == "Unigram":
+        pieces = {token_id: entry[0] for token_id, entry in enumerate(model["vocab"])}
+        vocab = {piece: token_id for token_id, piece in pieces.items()}
+        merges = []
+        by_score = sorted(pieces, key=lambda token_id: -model["vocab"][token_id][1])
+        common = by_score[:margin]
+    else:
+        raise ValueError(f"Unsupported tokenizer model type: {model['type']}")
+
+    keep = set(used_ids) | set(common)
+    keep |= {token["id"] for token in tokenizer_json.get("added_tokens", [])}
+    keep |= {token_id for token_id, piece in pieces.items() if BYTE_TOKEN.match(piece)}
+    if model.get("unk_token") in vocab:
+        keep.add(vocab[model["unk_token"]])
+
+    # Closure: a kept BPE token must be buildable from kept parts
+    parts = {vocab[a + b]: (vocab[a], vocab[b]) for a, b in merges if a in vocab and b in vocab and a + b in vocab}
+    pending = list(keep)
+    while pending:
+        for part in parts.get(pending.pop(), ()):
+            if part not in keep:
+                keep.add(part)
+                pending.append(part)
+    return sorted(i for i in keep if i in pieces or any(t["id"] == i for t in tokenizer_json.get("added_tokens", [])))
+
+
+def _remap_ids(value, old_to_new):
+    """Rewrite 'id'/'ids' fields (post-processor special tokens) recursively"""
+    if isinstance(value, dict):
+        result = {}
+        for key, item in value.items():
+            if key == "ids" and isinstance(item, list):
+                result[key] = [old_to_new[i] for i in item]
+            elif key == "id" and isinstance(item, int):
+                result[key] = old_to_new[item]
+            else:
+                result[key] = _remap_ids(item, old_to_new)
+        return result
+    if isinstance(value, list):
+        return [_remap_ids(item, old_to_new) for item in value]
+    return value
+
+
+def prune_tokenizer(tokenizer_json: Dict, kept_ids: List[int]) -> Dict:
+    """Tokenizer with dense new ids in the order of kept_ids"""
+    old_to_new = {old: new for new, old in enumerate(kept_ids)}
+    pruned = _remap_ids({k: v for k, v in tokenizer_json.items() if k != "model"}, old_to_new)
+    model = dict(tokenizer_json["model"])
+
+    if model["type"] == "BPE":
+        vocab = model["vocab"]
+        model["vocab"] = {piece: old_to_new[i] for piece, i in vocab.items() if i in old_to_new}
+        merges = [
+            (a, b) for a, b in _merge_pairs(tokenizer_json["model"])
+            if a in model["vocab"] and b in model["vocab"] and a + b in model["vocab"]
+        ]
+        string_merges = any(isinstance(m, str) for m in tokenizer_json["model"].get("merges", []))
+        model["merges"] = [f"{a} {b}" for a, b in merges] if string_merges else [list(m) for m in merges]
+    else:
+        model["vocab"] = [model["vocab"][i] for i in kept_ids]
+        if model.get("unk_id") is not None:
+            model["unk_id"] = old_to_new[model["unk_id"]]
+
+    pruned["model"] = model
+    return pruned
+
+
+def _graphs(graph):
+    yield graph
+    for node in graph.node:
+        for attribute in node.attribute:
+            if attribute.g.ByteSize():
+                yield from _graphs(attribute.g)
+            for subgraph in attribute.graphs:
+                yield from _graphs(subgraph)
+
+
+def prune_onnx(model_path: str, output_path: str, kept_ids: List[int], vocab_size: int,
+               alignment: int = 16384) -> Dict[str, int]:
+    """
+    Slice every vocabulary-sized weight axis down to kept_ids.
+
+    Returns:
+        Counts of sliced tensors, rewritten dims and patched shape constants
+    """
+    import numpy as np
+    import onnx
+    from onnx import numpy_helper
+    from onnx_external_data import align_external_data
+    from onnx_weight_dedup import tensor_array
+
+    model_path = Path(model_path)
+    output_path = Path(output_path)
+    model = onnx.load(str(model_path), load_external_data=False)
+
+    quantized = {n.op_type for g in _graphs(model.graph) for n in g.node if n.op_type in QUANTIZED_OPS}
+    if quantized:
+        raise ValueError(f"Block-quantized ops ({', '.join(sorted(quantized))}): prune before quantizing")
+
+    new_size = len(kept_ids)
+    index = np.asarray(kept_ids, dtype=np.int64)
+    stats = {"tensors": 0, "dims": 0, "shape_constants": 0}
+
+    for graph in _graphs(model.graph):
+        for position, tensor in enumerate(graph.initializer):
+            dims = list(tensor.dims)
+            if vocab_size in dims:
+                array = tensor_array(tensor, model_path.parent)
+                axis = dims.index(vocab_size)
+                sliced = np.take(array, index, axis=axis)
+                graph.initializer[position].CopyFrom(numpy_helper.from_array(np.ascontiguousarray(sliced), tensor.name))
+                stats["tensors"] += 1
+                logger.info(f"✂️  {tensor.name}: {dims} → {list(sliced.shape)}")
+            elif tensor.data_type in (onnx.TensorProto.INT64, onnx.TensorProto.INT32) and len(dims) <= 1:
+                values = numpy_helper.to_array(tensor) if not tensor.external_data else None
+                if values is not None and vocab_size in np.atleast_1d(values):
+                    values = np.where(values == vocab_size, new_size, values).astype(values.dtype)
+                    graph.initializer[position].CopyFrom(numpy_helper.from_array(values, tensor.name))
+                    stats["shape_constants"] += 1
+
+        for value in list(graph.input) + list(graph.output) + list(graph.value_info):
+            for dim in value.type.tensor_type.shape.dim:
+                if dim.HasField("dim_value") and dim.dim_value == vocab_size:
+                    dim.dim_value = new_size
+                    stats["dims"] += 1
+
+    if not stats["tensors"]:
+        raise ValueError(f"No initializer has a {vocab_size}-sized axis; is the vocab size right?")
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    staged = model_path.parent / f".{output_path.stem}.pruned.onnx"
+    onnx.save(model, str(staged), save_as_external_data=True, location=staged.name + ".data")
+    try:
+        align_external_data(str(staged), str(output_path), alignment)
+    finally:
+        staged.unlink()
+        staged.with_name(staged.name + ".data").unlink(missing_ok=True)
+    return stats
+
+
+def _files_bytes(model_path: Path) -> int:
+    import onnx
+
+    model = onnx.load(str(model_path), load_external_data=False)
+    names = {e.value for g in _graphs(model.graph) for t in g.initializer for e in t.external_data if e.key == "location"}
+    return model_path.stat().st_size + sum((model_path.parent / n).stat().st_size for n in names)
+
+
+def compare_models(original: str, pruned: str, kept_ids: List[int], prompts: List[List[int]],
+                   new_tokens: int = 16) -> Dict[str, float]:
+    """
+    Decode speed and greedy parity of the pruned model against the original.
+
+    Parity is checked on in-vocabulary outputs: along the pruned model's
+    greedy continuation, the original model's argmax restricted to the
+    kept tokens must pick the same token at every step. Steps where the
+    original's unrestricted argmax falls outside the kept vocabulary are
+    counted separately.
+    """
+    import numpy as np
+    from onnx_generation import OrtCausalLM
+
+    old_to_new = {old: new for new, old in enumerate(kept_ids)}
+    reference = OrtCausalLM(original)
+    candidate = OrtCausalLM(pruned)
+
+    timings = {"original": [0.0, 0], "pruned": [0.0, 0]}
+    compared = matched = out_of_vocab = 0
+    max_logit_diff = 0.0
+    for prompt in prompts:
+        expected, t = reference.greedy_generate(prompt, new_tokens)
+        timings["original"][0] += t["decode_ms"]
+        timings["original"][1] += max(len(expected) - 1, 1)
+
+        mapped = [old_to_new[i] for i in prompt]
+        actual, t = candidate.greedy_generate(mapped, new_tokens)
+        timings["pruned"][0] += t["decode_ms"]
+        timings["pruned"][1] += max(len(actual) - 1, 1)
+
+        # Teacher-forced over the pruned continuation: one pass per model
+        sequence = prompt + [kept_ids[i] for i in actual[:-1]]
+        full = reference.logits(sequence)[len(prompt) - 1:]
+        restricted = full[:, kept_ids]
+        pruned_logits = candidate.logits([old_to_new[i] for i in sequence])[len(prompt) - 1:]
+
+        compared += len(actual)
+        matched += int(np.sum(np.argmax(restricted, axis=-1) == np.asarray(actual)))
+        out_of_vocab += sum(int(token) not in old_to_new for token in np.argmax(full, axis=-1))
+        max_logit_diff = max(max_logit_diff, float(np.max(np.abs(restricted - pruned_logits))))
+
+    original_ms = timings["original"][0] / timings["original"][1]
+    pruned_ms = timings["pruned"][0] / timings["pruned"][1]
+    return {
+        "decode_ms_per_token_original": round(original_ms, 3),
+        "decode_ms_per_token_pruned": round(pruned_ms, 3),
+        "decode_speedup": round(original_ms / pruned_ms, 2) if pruned_ms else 0.0,
+        "greedy_tokens_compared": compared,
+        "greedy_tokens_matched": matched,
+        "out_of_vocab_steps": out_of_vocab,
+        "max_logit_diff": max_logit_diff,
+    }
+
+
+def prune(model_path: str, tokenizer_path: str, corpus: List[str], output_dir: str, margin: int = 8000,
+          new_tokens: int = 16, max_prompts: int = 8, compare: bool = True) -> Dict:
+    """Run the whole pruning pipeline; returns the report written to pruning_report.json"""
+    from tokenizers import Tokenizer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(tokenizer_path, "r", encoding="utf-8") as f:
+        tokenizer_json = json.load(f)
+    vocab_size = Tokenizer.from_file(str(tokenizer_path)).get_vocab_size(with_added_tokens=True)
+
+    texts = corpus_texts(corpus)
+    if not texts:
+        raise ValueError("Corpus is empty")
+    used = used_token_ids(tokenizer_path, texts)
+    kept_ids = select_vocabulary(tokenizer_json, used, margin)
+    logger.info(f"📚 {len(texts)} corpus texts use {len(used)} distinct tokens; "
+                f"keeping {len(kept_ids)} of {vocab_size} ({len(kept_ids) / vocab_size * 100:.1f}%)")
+
+    with open(output_dir / "tokenizer.json", "w", encoding="utf-8") as f:
+        json.dump(prune_tokenizer(tokenizer_json, kept_ids), f, ensure_ascii=False)
+    with open(output_dir / "vocab_map.json", "w") as f:
+        json.dump({"original_vocab_size": vocab_size, "vocab_size": len(kept_ids), "kept_ids": kept_ids}, f)
+
+    pruned_model = output_dir / Path(model_path).name
+    stats = prune_onnx(model_path, str(pruned_model), kept_ids, vocab_size)
+    report = {
+        "original_vocab_size": vocab_size,
+        "vocab_size": len(kept_ids),
+        "corpus_tokens_used": len(used),
+        "sliced_tensors": stats["tensors"],
+        "bytes_original": _files_bytes(Path(model_path)),
+        "bytes_pruned": _files_bytes(pruned_model),
+    }
+
+    if compare:
+        tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        prompts = [e.ids[-256:] for e in tokenizer.encode_batch(texts[:max_prompts])]
+        report.update(compare_models(model_path, str(pruned_model), kept_ids, prompts, new_tokens))
+
+        # The remapped tokenizer must produce the same pieces for corpus text
+        pruned_tokenizer = Tokenizer.from_file(str(output_dir / "tokenizer.json"))
+        same = sum(
+            [kept_ids[i] for i in pruned_tokenizer.encode(text).ids] == tokenizer.encode(text).ids
+            for text in texts
+        )
+        report["tokenizer_roundtrip"] = f"{same}/{len(texts)}"
+
+    with open(output_dir / "pruning_report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Domain vocabulary pruning for the Gemma decoder")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    prune_parser = subparsers.add_parser("prune", help="Prune tokenizer and ONNX decoder to the corpus vocabulary")
+    prune_parser.add_argument("--model", required=True, help="ONNX decoder (before quantization)")
+    prune_parser.add_argument("--tokenizer", required=True, help="tokenizer.json")
+    prune_parser.add_argument("--corpus", nargs="+", required=True, help="Prompt/report files or directories")
+    prune_parser.add_argument("--output-dir", required=True)
+    prune_parser.add_argument("--margin", type=int, default=8000, help="Extra most-common tokens to keep")
+    prune_parser.add_argument("--new-tokens", type=int, default=16, help="Greedy tokens per parity prompt")
+    prune_parser.add_argument("--max-prompts", type=int, default=8, help="Corpus texts used for parity/speed")
+    prune_parser.add_argument("--no-compare", action="store_true", help="Skip the speed and parity check")
+
+    args = parser.parse_args()
+
+    try:
+        report = prune(args.model, args.tokenizer, args.corpus, args.output_dir, args.margin,
+                       args.new_tokens, args.max_prompts, not args.no_compare)
+    except Exception as e:
+        logger.error(f"❌ Vocabulary pruning failed: {str(e)}")
+        sys.exit(1)
+
+    logger.info(f"📦 Size: {report['bytes_original'] / (1024 * 1024):.1f} MB → "
+                f"{report['bytes_pruned'] / (1024 * 1024):.1f} MB")
+    if "decode_speedup" in report:
+        logger.info(f"⚡ Decode: {report['decode_ms_per_token_original']:.2f} → "
+                    f"{report['decode_ms_per_token_pruned']:.2f} ms/token ({report['decode_speedup']:.2f}x)")
+        logger.info(f"🎯 Greedy parity: {report['greedy_tokens_matched']}/{report['greedy_tokens_compared']} "
+                    f"in-vocabulary tokens, max logit diff {report['max_logit_diff']:.2e}, "
+                    f"tokenizer round trip {report['tokenizer_roundtrip']}")
+        if report["out_of_vocab_steps"]:
+            logger.warning(f"⚠️  The original model preferred a pruned token at {report['out_of_vocab_steps']} "
+                           f"step(s); consider a larger corpus or --margin")
+        if report["greedy_tokens_matched"] != report["greedy_tokens_compared"]:
+            logger.error("❌ Pruned model diverges from the original on in-vocabulary tokens")
+            sys.exit(1)
+    logger.info(f"✅ Wrote {args.output_dir}/tokenizer.json, vocab_map.json and pruning_report.json")
+
+
+if __name__ == "__main__":
+    main()
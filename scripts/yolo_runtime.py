@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+HazardHawk - Host-side YOLOv8 runtime for exported detectors
+
+Minimal inference path for the ONNX/TFLite files produced by
+setup_yolo_hazard_detection.py and download_real_ppe_models.py, without
+ultralytics or torch:
+
+- letterbox(): aspect-preserving resize plus padding to the model input
+  (square or rectangular), returning the transform to map boxes back
+- decode(): raw head [1, 4+nc, N] (or [1, N, 4+nc]) to xyxy boxes, scores
+  and class ids, vectorized
+- nms() / batched_nms(): greedy NMS in numpy; class-aware via per-class
+  coordinate offsets so all classes are suppressed in one pass
+- YoloDetector: model input shape, class names from the export metadata,
+  detect() for single images and detect_batch() for tiles
+
+`compare` runs square and rectangular exports of the same detector over the
+same photos and reports the letterbox padding share, relative FLOPs (the
+network is fully convolutional, so cost scales with input area), latency
+and, with labels, recall.
+
+Usage:
+    python yolo_runtime.py detect model.onnx photo.jpg --conf 0.25 --iou 0.45
+    python yolo_runtime.py compare best_640x640.onnx best_640x480.onnx --images val/images --labels val/labels
+"""
+
+import argparse
+import ast
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.45
+DEFAULT_MAX_DETECTIONS = 300
+PAD_VALUE = 114
+
+
+def load_image(path: str):
+    """RGB uint8 [H, W, 3], EXIF orientation applied"""
+    import numpy as np
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as image:
+        return np.asarray(ImageOps.exif_transpose(image).convert("RGB"))
+
+
+def letterbox(image, shape: Tuple[int, int]):
+    """
+    Resize keeping the aspect ratio and pad to shape (height, width).
+
+    Returns:
+        (padded uint8 image, scale, (pad_x, pad_y))
+    """
+    import numpy as np
+    from PIL import Image
+
+    height, width = image.shape[:2]
+    target_h, target_w = shape
+    scale = min(target_h / height, target_w / width)
+    new_w, new_h = round(width * scale), round(height * scale)
+    if (new_w, new_h) != (width, height):
+        image = np.asarray(Image.fromarray(image).resize((new_w, new_h), Image.BILINEAR))
+    pad_x, pad_y = (target_w - new_w) // 2, (target_h - new_h) // 2
+    padded = np.full((target_h, target_w, 3), PAD_VALUE, dtype=np.uint8)
+    padded[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = image
+    return padded, scale, (pad_x, pad_y)
+
+
+def padding_share(image_shape: Tuple[int, int], input_shape: Tuple[int, int]) -> float:
+    """Fraction of the model input that letterbox fills with padding"""
+    height, width = image_shape[:2]
+    target_h, target_w = input_shape
+    scale = min(target_h / height, target_w / width)
+    return 1.0 - (round(width * scale) * round(height * scale)) / (target_h * target_w)
+
+
+def unletterbox(boxes, scale: float, pad: Tuple[int, int], image_shape: Tuple[int, int]):
+    """Map xyxy boxes from model input coordinates back to the original image"""
+    import numpy as np
+
+    boxes = (boxes - np.array([pad[0], pad[1], pad[0], pad[1]], dtype=np.float32)) / scale
+    height, width = image_shape[:2]
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes
+
+
+def decode(output, conf: float = DEFAULT_CONF, num_classes: Optional[int] = None):
+    """
+    Raw YOLOv8 head to (boxes xyxy, scores, class ids) above conf.
+
+    Accepts [1, 4+nc, N] (ultralytics default) or [1, N, 4+nc].
+    """
+    import numpy as np
+
+    prediction = np.asarray(output)[0]
+    if num_classes is not None:
+        channels_first = prediction.shape[0] == 4 + num_classes
+    else:
+        channels_first = prediction.shape[0] < prediction.shape[1]
+    if channels_first:
+        prediction = prediction.T
+    class_scores = prediction[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+    keep = scores > conf
+    cx, cy, w, h = prediction[keep, :4].T
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1).astype(np.float32)
+    return boxes, scores[keep].astype(np.float32), classes[keep].astype(np.int64)
+
+
+def box_iou(box, boxes, metric: str = "iou"):
+    """IoU (or intersection over the smaller box, 'ios') of one box against many"""
+    import numpy as np
+
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == "ios":
+        return intersection / np.maximum(np.minimum(area, areas), 1e-9)
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def nms(boxes, scores, iou: float = DEFAULT_IOU, max_detections: int = DEFAULT_MAX_DETECTIONS,
+        metric: str = "iou"):
+    """Greedy NMS; returns kept indices in descending score order"""
+    import numpy as np
+
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        if order.size == 1:
+            break
+        overlap = box_iou(boxes[best], boxes[order[1:]], metric)
+        order = order[1:][overlap <= iou]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, classes, iou: float = DEFAULT_IOU,
+                max_detections: int = DEFAULT_MAX_DETECTIONS, metric: str = "iou"):
+    """Class-aware NMS: boxes of different classes are shifted apart so they never overlap"""
+    import numpy as np
+
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Span of all coordinates, so class ranges stay disjoint even with negative (off-image) boxes
+    offset = classes.astype(np.float32)[:, None] * (boxes.max() - boxes.min() + 1)
+    return nms(boxes + offset, scores, iou, max_detections, metric)
+
+
+class Detections:
+    """xyxy boxes in image pixels with scores and class ids."""
+
+    def __init__(self, boxes, scores, classes):
+        self.boxes = boxes
+        self.scores = scores
+        self.classes = classes
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def empty(cls):
+        import numpy as np
+
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+    @classmethod
+    def concatenate(cls, parts: Sequence["Detections"]):
+        import numpy as np
+
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        return cls(np.concatenate([p.boxes for p in parts]), np.concatenate([p.scores for p in parts]),
+                   np.concatenate([p.classes for p in parts]))
+
+    def select(self, indices):
+        return Detections(self.boxes[indices], self.scores[indices], self.classes[indices])
+
+    def to_json(self, names: Optional[List[str]] = None) -> List[Dict]:
+        return [{
+            "box": [round(float(v), 1) for v in box],
+            "score": round(float(score), 4),
+            "class": names[int(cls)] if names and int(cls) < len(names) else int(cls),
+        } for box, score, cls in zip(self.boxes, self.scores, self.classes)]
+
+
+def _parse_names(value: str) -> List[str]:
+    names = ast.literal_eval(value)
+    if isinstance(names, dict):
+        return [names[k] for k in sorted(names)]
+    return list(names)
+
+
+class YoloDetector:
+    """ONNX Runtime or LiteRT session over an exported YOLOv8 detector."""
+
+    def __init__(self, model_path: str, conf: float = DEFAULT_CONF, iou: float = DEFAULT_IOU,
+                 max_detections: int = DEFAULT_MAX_DETECTIONS, threads: Optional[int] = None):
+        self.model_path = model_path
+        self.conf = conf
+        self.iou = iou
+        self.max_detections = max_detections
+        self.names: List[str] = []
+        if model_path.endswith(".tflite"):
+            self._open_tflite(model_path, threads)
+        else:
+            self._open_onnx(model_path, threads)
+
+    def _open_onnx(self, model_path: str, threads: Optional[int]) -> None:
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.layout = "NCHW"
+        _, _, height, width = model_input.shape
+        self.input_shape = (int(height), int(width))
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        # Fixed-batch exports (ultralytics batch=N) take exactly N images per run
+        self.fixed_batch = 1 if self.dynamic_batch else int(model_input.shape[0])
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        if "names" in metadata:
+            self.names = _parse_names(metadata["names"])
+        self.normalized_boxes = False
+
+    def _open_tflite(self, model_path: str, threads: Optional[int]) -> None:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite.python.interpreter import Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=threads or 4)
+        self.interpreter.allocate_tensors()
+        detail = self.interpreter.get_input_details()[0]
+        self.layout = "NHWC"
+        _, height, width, _ = detail["shape"]
+        self.input_shape = (int(height), int(width))
+        self.dynamic_batch = False
+        self.fixed_batch = 1  # _infer invokes the interpreter once per image
+        # ultralytics TFLite exports emit boxes normalized to the input size
+        self.normalized_boxes = True
+        names_file = Path(model_path).with_name("metadata.yaml")
+        if names_file.exists():
+            import yaml
+
+            with open(names_file) as f:
+                self.names = _parse_names(repr(yaml.safe_load(f).get("names", {})))
+
+    def _infer(self, batch):
+        """batch: uint8 [N, H, W, 3] at the model input size -> raw head [N, ...]"""
+        import numpy as np
+
+        pixels = batch.astype(np.float32) / 255.0
+        if self.layout == "NCHW":
+            return self.session.run(None, {self.input_name: pixels.transpose(0, 3, 1, 2)})[0]
+
+        input_detail = self.interpreter.get_input_details()[0]
+        output_detail = self.interpreter.get_output_details()[0]
+        outputs = []
+        for image in pixels:
+            tensor = image[None]
+            if input_detail["dtype"] != np.float32:
+                scale, zero_point = input_detail["quantization"]
+                tensor = (tensor / scale + zero_point).round().astype(input_detail["dtype"])
+            self.interpreter.set_tensor(input_detail["index"], tensor)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(output_detail["index"])
+            if output_detail["dtype"] != np.float32:
+                scale, zero_point = output_detail["quantization"]
+                output = (output.astype(np.float32) - zero_point) * scale
+            outputs.append(output[0])
+        return np.stack(outputs)
+
+    def _postprocess(self, raw, conf: float) -> Detections:
+        import numpy as np
+
+        boxes, scores, classes = decode(raw[None], conf, len(self.names) or None)
+        if self.normalized_boxes:
+            height, width = self.input_shape
+            boxes = boxes * np.array([width, height, width, height], dtype=np.float32)
+        keep = batched_nms(boxes, scores, classes, self.iou, self.max_detections)
+        return Detections(boxes[keep], scores[keep], classes[keep])
+
+    def detect_batch(self, images, conf: Optional[float] = None, batch_size: int = 8) -> List[Detections]:
+        """
+        Detect on images already at the model input size (e.g. tiles).
+
+        Dynamic-batch models run batch_size images at a time and fixed-batch
+        models their export batch (the last run zero-padded). Static batch-1
+        exports, the repo default, run one image at a time.
+
+        Boxes are in input pixel coordinates.
+        """
+        import numpy as np
+
+        conf = self.conf if conf is None else conf
+        step = batch_size if self.dynamic_batch else self.fixed_batch
+        results = []
+        for start in range(0, len(images), step):
+            batch = np.stack(images[start:start + step])
+            count = len(batch)
+            if not self.dynamic_batch and count < step:
+                batch = np.concatenate([batch, np.zeros((step - count,) + batch.shape[1:], batch.dtype)])
+            raw = self._infer(batch)
+            results += [self._postprocess(r, conf) for r in raw[:count]]
+        return results
+
+    def detect(self, image, conf: Optional[float] = None) -> Detections:
+        """Letterbox, infer and map boxes back to the original image"""
+        padded, scale, pad = letterbox(image, self.input_shape)
+        detections = self.detect_batch([padded], conf)[0]
+        detections.boxes = unletterbox(detections.boxes, scale, pad, image.shape)
+        return detections
+
+
+def compare_shapes(model_paths: Sequence[str], images_dir: str, labels_dir: Optional[str] = None,
+                   conf: float = DEFAULT_CONF, repeat: int = 3, limit: Optional[int] = None) -> Dict:
+    """
+    Padding, relative FLOPs, latency and recall per export on the same photos.
+
+    FLOPs are relative to the largest input area among the models.
+    """
+    from sliced_inference import load_labels, match_recall
+
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    if limit:
+        paths = paths[:limit]
+    if not paths:
+        raise ValueError(f"No images in {images_dir}")
+    images = [load_image(str(p)) for p in paths]
+    detectors = [YoloDetector(path, conf) for path in model_paths]
+    largest = max(d.input_shape[0] * d.input_shape[1] for d in detectors)
+
+    report = {}
+    for detector in detectors:
+        height, width = detector.input_shape
+        latencies, found, objects = [], 0, 0
+        for path, image in zip(paths, images):
+            detector.detect(image)  # warm-up
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                detections = detector.detect(image)
+                timings.append((time.perf_counter() - start) * 1000)
+            latencies.append(min(timings))
+            if labels_dir:
+                recall = match_recall(detections, *load_labels(Path(labels_dir) / f"{path.stem}.txt",
+                                                               image.shape[1], image.shape[0]))
+                found += recall["found"]
+                objects += recall["objects"]
+        report[detector.model_path] = {
+            "input": f"{width}x{height}",
+            "relative_flops": round(height * width / largest, 3),
+            "padding_share": round(sum(padding_share(i.shape, detector.input_shape) for i in images) / len(images), 3),
+            "mean_latency_ms": round(sum(latencies) / len(latencies), 2),
+            "recall": round(found / objects, 4) if objects else None,
+        }
+    return {"images": len(paths), "models": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an exported YOLOv8 detector without ultralytics")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    det = subparsers.add_parser("detect", help="Detect objects in photos")
+    det.add_argument("model", help=".onnx or .tflite detector")
+    det.add_argument("images", nargs="+", help="Photos")
+    det.add_argument("--conf", type=float, default=DEFAULT_CONF, help="Score threshold")
+    det.add_argument("--iou", type=float, default=DEFAULT_IOU, help="NMS IoU threshold")
+
+    cmp = subparsers.add_parser("compare", help="Compare exports of different input shapes on the same photos")
+    cmp.add_argument("models", nargs="+", help="Exports of the same detector (e.g. 640x640 and 640x480)")
+    cmp.add_argument("--images", required=True, help="Directory of photos")
+    cmp.add_argument("--labels", help="Directory of YOLO-format labels for recall")
+    cmp.add_argument("--conf", type=float, default=DEFAULT_CONF, help="Score threshold")
+    cmp.add_argument("--limit", type=int, help="Only use the first N images")
+    cmp.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "compare":
+            report = compare_shapes(args.models, args.images, args.labels, args.conf, limit=args.limit)
+            if args.json:
+                print(json.dumps(report))
+                return
+            logger.info(f"📊 {report['images']} images")
+            for path, result in report["models"].items():
+                recall = f", recall {result['recall']}" if result["recall"] is not None else ""
+                logger.info(f"   {result['input']:>9s}: {result['relative_flops'] * 100:.0f}% FLOPs, "
+                            f"{result['padding_share'] * 100:.1f}% padding, {result['mean_latency_ms']} ms{recall}  ({path})")
+            return
+
+        detector = YoloDetector(args.model, args.conf, args.iou)
+        for path in args.images:
+            image = load_image(path)
+            start = time.perf_counter()
+            detections = detector.detect(image)
+            elapsed = (time.perf_counter() - start) * 1000
+            logger.info(f"🔍 {path}: {len(detections)} detections in {elapsed:.1f} ms")
+            print(json.dumps({"image": path, "detections": detections.to_json(detector.names)}))
+    except Exception as e:
+        logger.error(f"❌ {args.command.capitalize()} failed: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
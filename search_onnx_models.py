@@ -1,69 +1,73 @@
 #!/usr/bin/env python3
 """
 Search for available ONNX models on HuggingFace Hub
+
+Searches run concurrently over a pooled session and responses are cached
+on disk (see hf_model_discovery.py). Use --fixture for offline runs.
 """
 
-from huggingface_hub import HfApi, list_models
-import requests
+import argparse
+
+from hf_model_discovery import DEFAULT_CACHE_DIR, DEFAULT_TTL_SECONDS, HubClient, discover
+
+SEARCH_TERMS = [
+    "gemma onnx",
+    "gemma-2b onnx",
+    "gemma vision onnx",
+    "multimodal onnx",
+    "vision language onnx"
+]
+
+# Specific ONNX community models to check alongside the search results
+ONNX_CANDIDATES = [
+    "microsoft/DialoGPT-medium",
+    "onnx-community/gpt2-ONNX",
+    "sentence-transformers/all-MiniLM-L6-v2",
+    "optimum/distilbert-base-uncased-onnx",
+    "philschmid/distilbert-onnx"
+]
+
+VISION_ALTERNATIVES = [
+    {
+        'name': 'CLIP Vision',
+        'repo': 'openai/clip-vit-base-patch32',
+        'description': 'Vision transformer for image understanding'
+    },
+    {
+        'name': 'MobileViT',
+        'repo': 'apple/mobilevit-small',
+        'description': 'Mobile-optimized vision transformer'
+    },
+    {
+        'name': 'DeiT',
+        'repo': 'facebook/deit-tiny-patch16-224',
+        'description': 'Data-efficient vision transformer'
+    }
+]
+
+def _format_size(size_bytes):
+    return f"{size_bytes / (1024 * 1024):.1f} MB" if size_bytes is not None else "size unknown"
+
+def search_onnx_models(client=None):
+    """Search for ONNX models related to Gemma, ranked for mobile deployment"""
+
+    client = client or HubClient()
 
-def search_onnx_models():
-    """Search for ONNX models related to Gemma"""
-    
-    api = HfApi()
-    
     print("🔍 Searching HuggingFace Hub for ONNX models...")
-    
-    # Search for ONNX models
-    search_terms = [
-        "gemma onnx",
-        "gemma-2b onnx", 
-        "gemma vision onnx",
-        "multimodal onnx",
-        "vision language onnx"
-    ]
-    
-    found_models = []
-    
-    for term in search_terms:
-        try:
-            print(f"\n📋 Searching for: '{term}'")
-            models = list_models(search=term, limit=10)
-            
-            for model in models:
-                if 'onnx' in model.modelId.lower() or 'onnx' in str(model.tags).lower():
-                    found_models.append({
-                        'id': model.modelId,
-                        'tags': model.tags or [],
-                        'downloads': getattr(model, 'downloads', 0)
-                    })
-                    print(f"  ✅ Found: {model.modelId}")
-                    print(f"     Tags: {model.tags}")
-                    print(f"     Downloads: {getattr(model, 'downloads', 'N/A')}")
-                    
-        except Exception as e:
-            print(f"  ❌ Search failed for '{term}': {e}")
-    
-    # Look for specific ONNX community models
-    onnx_candidates = [
-        "microsoft/DialoGPT-medium",
-        "onnx-community/gpt2-ONNX",
-        "sentence-transformers/all-MiniLM-L6-v2",
-        "optimum/distilbert-base-uncased-onnx",
-        "philschmid/distilbert-onnx"
-    ]
-    
-    print(f"\n🎯 Checking specific ONNX candidates...")
-    for candidate in onnx_candidates:
-        try:
-            # Try to get model info
-            response = requests.get(f"https://huggingface.co/api/models/{candidate}", timeout=10)
-            if response.status_code == 200:
-                print(f"  ✅ Available: {candidate}")
-            else:
-                print(f"  ❌ Not found: {candidate}")
-        except Exception as e:
-            print(f"  ❌ Error checking {candidate}: {e}")
-    
+    print(f"📋 Search terms: {', '.join(repr(t) for t in SEARCH_TERMS)}")
+
+    found_models = discover(client, SEARCH_TERMS, ONNX_CANDIDATES)
+
+    for rank, model in enumerate(found_models, 1):
+        if not model['onnx_variants']:
+            print(f"  ❌ {model['id']}: no ONNX files")
+            continue
+        print(f"  {rank:>2}. ✅ {model['id']} (score {model['score']:.2f})")
+        print(f"      Smallest ONNX: {_format_size(model['smallest_onnx_bytes'])}, "
+              f"{model['quantization']}, {len(model['onnx_variants'])} variant(s)")
+        print(f"      Downloads: {model['downloads']}")
+
+    found_models = [m for m in found_models if m['onnx_variants']]
     if found_models:
         print(f"\n✅ Found {len(found_models)} ONNX models")
         return found_models
@@ -72,59 +76,57 @@ def search_onnx_models():
         print("💡 We'll need to convert PyTorch models to ONNX")
         return []
 
-def get_alternative_vision_models():
+def get_alternative_vision_models(client=None):
     """Get alternative vision models we can use"""
-    
+
+    client = client or HubClient()
+
     print("\n🔍 Looking for alternative vision models...")
-    
-    alternatives = [
-        {
-            'name': 'CLIP Vision',
-            'repo': 'openai/clip-vit-base-patch32',
-            'description': 'Vision transformer for image understanding'
-        },
-        {
-            'name': 'MobileViT',
-            'repo': 'apple/mobilevit-small',
-            'description': 'Mobile-optimized vision transformer'
-        },
-        {
-            'name': 'DeiT',
-            'repo': 'facebook/deit-tiny-patch16-224',
-            'description': 'Data-efficient vision transformer'
-        }
-    ]
-    
-    for alt in alternatives:
-        try:
-            response = requests.get(f"https://huggingface.co/api/models/{alt['repo']}", timeout=5)
-            if response.status_code == 200:
-                print(f"  ✅ {alt['name']}: {alt['repo']}")
-                print(f"     Description: {alt['description']}")
-            else:
-                print(f"  ❌ {alt['name']}: Not available")
-        except Exception as e:
-            print(f"  ❌ {alt['name']}: Error - {e}")
-    
+
+    infos = client.model_infos([alt['repo'] for alt in VISION_ALTERNATIVES])
+    alternatives = []
+    for alt in VISION_ALTERNATIVES:
+        if infos.get(alt['repo']) is not None:
+            print(f"  ✅ {alt['name']}: {alt['repo']}")
+            print(f"     Description: {alt['description']}")
+            alternatives.append(alt)
+        else:
+            print(f"  ❌ {alt['name']}: Not available")
+
     return alternatives
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the Hugging Face Hub for mobile ONNX models")
+    parser.add_argument("--fixture", help="JSON fixture to use instead of the network")
+    parser.add_argument("--offline", action="store_true", help="Only use cached responses")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help="Response cache directory")
+    parser.add_argument("--ttl-hours", type=float, default=DEFAULT_TTL_SECONDS / 3600,
+                        help="Cache time-to-live in hours")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent requests")
+    args = parser.parse_args()
+
+    hub = HubClient(args.cache_dir, args.ttl_hours * 3600, args.fixture, args.offline, args.workers)
+
     print("🚀 HuggingFace ONNX Model Search")
     print("=" * 40)
-    
+
     # Search for ONNX models
-    onnx_models = search_onnx_models()
-    
+    onnx_models = search_onnx_models(hub)
+
     # Get alternatives
-    alternatives = get_alternative_vision_models()
-    
+    alternatives = get_alternative_vision_models(hub)
+
     print(f"\n📊 Summary:")
     print(f"  - Direct ONNX models found: {len(onnx_models)}")
     print(f"  - Alternative models available: {len(alternatives)}")
-    
-    if not onnx_models:
+
+    if onnx_models:
+        best = onnx_models[0]
+        print(f"\n🏆 Best mobile candidate: {best['id']} "
+              f"({_format_size(best['smallest_onnx_bytes'])}, {best['quantization']})")
+    else:
         print(f"\n💡 Recommendation:")
         print(f"  1. Convert existing PyTorch Gemma model to ONNX")
         print(f"  2. Use YOLO model as vision encoder (already available)")
         print(f"  3. Create optimized text decoder for safety analysis")
-        print(f"  4. This hybrid approach will work excellently for construction safety!")
\ No newline at end of file
+        print(f"  4. This hybrid approach will work excellently for construction safety!")
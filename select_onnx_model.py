@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Pick the best ONNX decoder for the device budget by measuring it
+
+For each candidate (a Hub repo or a local model directory) the file
+manifest is read with real sizes, ONNX graphs are grouped with their
+external data files (.onnx.data / .onnx_data) and variants whose weights
+alone exceed the RAM budget are dropped. Every remaining variant is
+benchmarked in its own subprocess (scripts/onnx_generation.py) so that
+peak RSS belongs to that model only and a crash or hang cannot take down
+the run. The fastest variant that stays within both budgets wins.
+
+Budgets come from model_metadata.json:
+    performance.min_ram_requirement_mb   -> peak RSS limit
+    performance.target_inference_time_ms -> prefill + generation latency limit
+
+Usage:
+    python select_onnx_model.py --repos onnx-community/gemma-3-1b-it-ONNX
+    python select_onnx_model.py --local-dir models/candidates/a models/candidates/b --report selection.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from hf_model_discovery import DEFAULT_CACHE_DIR, HubClient, onnx_variants
+
+DEFAULT_METADATA = Path("HazardHawk/androidApp/src/main/assets/model_metadata.json")
+DEFAULT_DOWNLOAD_DIR = Path("models/temp_download")
+BENCHMARK_SCRIPT = Path(__file__).resolve().parent / "scripts" / "onnx_generation.py"
+
+def load_budgets(metadata_path=DEFAULT_METADATA):
+    """Read the RAM (MB) and latency (ms) budgets from model_metadata.json"""
+    with open(metadata_path, 'r') as f:
+        performance = json.load(f)["performance"]
+    return {
+        "ram_mb": performance["min_ram_requirement_mb"],
+        "latency_ms": performance["target_inference_time_ms"],
+    }
+
+def local_model_info(model_dir):
+    """Build a Hub-style file manifest (id + siblings with sizes) for a local directory"""
+    model_dir = Path(model_dir)
+    siblings = [
+        {"rfilename": path.relative_to(model_dir).as_posix(), "size": path.stat().st_size}
+        for path in sorted(model_dir.rglob("*")) if path.is_file()
+    ]
+    return {"id": str(model_dir), "siblings": siblings}
+
+def gather_candidates(client, repos=(), local_dirs=(), ram_budget_mb=None, max_variants=2):
+    """
+    Collect ONNX variants from Hub repos and local directories.
+
+    Variants with unknown size or whose files (graph + external data) are
+    larger than the RAM budget are skipped without being downloaded. At
+    most max_variants of the smallest remaining variants are kept per source.
+    """
+    sources = []
+    if repos:
+        infos = client.model_infos(repos)
+        for repo in repos:
+            if infos.get(repo) is None:
+                print(f"  ❌ {repo}: not available")
+                continue
+            sources.append((repo, False, infos[repo]))
+    for model_dir in local_dirs:
+        if not Path(model_dir).is_dir():
+            print(f"  ❌ {model_dir}: not a directory")
+            continue
+        sources.append((str(model_dir), True, local_model_info(model_dir)))
+
+    candidates = []
+    for source, local, info in sources:
+        viable = []
+        for variant in onnx_variants(info):
+            size_mb = variant["bytes"] / (1024 * 1024) if variant["bytes"] is not None else None
+            if size_mb is None:
+                print(f"  ⚠️  {source}/{variant['file']}: size unknown, skipped")
+            elif ram_budget_mb is not None and size_mb > ram_budget_mb:
+                print(f"  ⚠️  {source}/{variant['file']}: {size_mb:.1f} MB exceeds {ram_budget_mb} MB RAM budget")
+            else:
+                viable.append({"source": source, "local": local, "size_mb": size_mb, **variant})
+        candidates.extend(viable[:max_variants])
+        print(f"  📁 {source}: {len(viable)} viable ONNX variant(s)")
+
+    return candidates
+
+def materialize(candidate, download_dir=DEFAULT_DOWNLOAD_DIR):
+    """Return a local path to the candidate's ONNX graph, downloading it and its data files if needed"""
+    if candidate["local"]:
+        return Path(candidate["source"]) / candidate["file"]
+
+    from huggingface_hub import hf_hub_download
+
+    local_dir = Path(download_dir) / candidate["source"].replace("/", "_")
+    for filename in [candidate["file"]] + candidate["data_files"]:
+        hf_hub_download(repo_id=candidate["source"], filename=filename, local_dir=str(local_dir))
+    return local_dir / candidate["file"]
+
+def run_benchmark(model_path, prompt_tokens=32, new_tokens=16, timeout=600, threads=None):
+    """
+    Benchmark one model in an isolated subprocess.
+
+    Returns the benchmark dict from onnx_generation.py, or a dict with an
+    "error" key if the process failed, timed out or printed no result.
+    """
+    command = [sys.executable, str(BENCHMARK_SCRIPT), "benchmark", str(model_path),
+               "--prompt-tokens", str(prompt_tokens), "--new-tokens", str(new_tokens), "--json"]
+    if threads:
+        command += ["--threads", str(threads)]
+
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {"model": str(model_path), "error": f"timed out after {timeout}s"}
+
+    lines = [line for line in completed.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        stderr = completed.stderr.strip().splitlines()
+        return {"model": str(model_path), "error": stderr[-1] if stderr else f"exit code {completed.returncode}"}
+    return json.loads(lines[-1])
+
+def budget_violations(result, budgets):
+    """List the budgets a benchmark result exceeds (empty when it fits)"""
+    violations = []
+    if result["peak_rss_mb"] > budgets["ram_mb"]:
+        violations.append(f"peak RSS {result['peak_rss_mb']:.0f} MB > {budgets['ram_mb']} MB")
+    if result["latency_ms"] > budgets["latency_ms"]:
+        violations.append(f"latency {result['latency_ms']:.0f} ms > {budgets['latency_ms']} ms")
+    return violations
+
+def select_model(client=None, repos=(), local_dirs=(), budgets=None, download_dir=DEFAULT_DOWNLOAD_DIR,
+                 prompt_tokens=32, new_tokens=16, timeout=600, max_variants=2, threads=None):
+    """
+    Benchmark every viable candidate and pick the best one within budget.
+
+    Ranking is by measured tokens/s, then by smaller total size.
+
+    Returns:
+        (best candidate dict or None, list of all candidate dicts with results)
+    """
+    client = client or HubClient()
+    budgets = budgets or load_budgets()
+
+    print(f"💰 Budgets: {budgets['ram_mb']} MB RAM, {budgets['latency_ms']} ms latency")
+    print("📋 Reading file manifests...")
+    candidates = gather_candidates(client, repos, local_dirs, budgets["ram_mb"], max_variants)
+
+    for candidate in candidates:
+        label = f"{candidate['source']}/{candidate['file']}"
+        print(f"\n⏱️  Benchmarking {label} ({candidate['size_mb']:.1f} MB, {candidate['quantization']})")
+        try:
+            model_path = materialize(candidate, download_dir)
+        except Exception as e:
+            candidate["result"] = {"error": f"download failed: {e}"}
+            print(f"   ❌ Download failed: {e}")
+            continue
+
+        candidate["path"] = str(model_path)
+        result = run_benchmark(model_path, prompt_tokens, new_tokens, timeout, threads)
+        candidate["result"] = result
+        if "error" in result:
+            print(f"   ❌ {result['error']}")
+            continue
+
+        candidate["violations"] = budget_violations(result, budgets)
+        print(f"   {result['tokens_per_second']:.1f} tok/s, {result['latency_ms']:.0f} ms, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB")
+        for violation in candidate["violations"]:
+            print(f"   ⚠️  Over budget: {violation}")
+
+    # Only successfully benchmarked candidates carry a violations list
+    fitting = [c for c in candidates if c.get("violations") == []]
+    fitting.sort(key=lambda c: (-c["result"]["tokens_per_second"], c["bytes"]))
+    return (fitting[0] if fitting else None), candidates
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Select the fastest ONNX decoder within the device budget")
+    parser.add_argument("--repos", nargs="*", default=[], help="Hugging Face repos to consider")
+    parser.add_argument("--local-dir", nargs="*", default=[], help="Local model directories to consider")
+    parser.add_argument("--metadata", default=str(DEFAULT_METADATA), help="model_metadata.json with budgets")
+    parser.add_argument("--download-dir", default=str(DEFAULT_DOWNLOAD_DIR), help="Where Hub files are downloaded")
+    parser.add_argument("--prompt-tokens", type=int, default=32)
+    parser.add_argument("--new-tokens", type=int, default=16)
+    parser.add_argument("--timeout", type=int, default=600, help="Per-benchmark timeout in seconds")
+    parser.add_argument("--threads", type=int, help="Intra-op threads for each benchmark")
+    parser.add_argument("--max-variants", type=int, default=2, help="Smallest variants benchmarked per source")
+    parser.add_argument("--fixture", help="Hub API JSON fixture to use instead of the network")
+    parser.add_argument("--offline", action="store_true", help="Only use cached Hub responses")
+    parser.add_argument("--report", help="Write all candidates and results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if not args.repos and not args.local_dir:
+        parser.error("give at least one of --repos or --local-dir")
+
+    client = HubClient(DEFAULT_CACHE_DIR, fixture=args.fixture, offline=args.offline)
+    best, candidates = select_model(
+        client, args.repos, args.local_dir, load_budgets(args.metadata), args.download_dir,
+        args.prompt_tokens, args.new_tokens, args.timeout, args.max_variants, args.threads
+    )
+
+    if args.report:
+        os.makedirs(os.path.dirname(os.path.abspath(args.report)), exist_ok=True)
+        with open(args.report, 'w') as f:
+            json.dump({"best": best, "candidates": candidates}, f, indent=2)
+
+    if best is None:
+        print("\n⚠️ No candidate fits the RAM and latency budgets")
+        return False
+
+    print(f"\n🏆 Selected {best['source']}/{best['file']}: {best['result']['tokens_per_second']:.1f} tok/s, "
+          f"{best['size_mb']:.1f} MB, peak RSS {best['result']['peak_rss_mb']:.0f} MB")
+    return True
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)